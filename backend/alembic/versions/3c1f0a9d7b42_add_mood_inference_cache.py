@@ -0,0 +1,41 @@
+"""add mood inference cache
+
+Revision ID: 3c1f0a9d7b42
+Revises: 591df1e64e02
+Create Date: 2026-10-17 10:12:31.408215
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3c1f0a9d7b42'
+down_revision: Union[str, None] = '591df1e64e02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('mood_inference_cache',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('content_hash', sa.String(length=64), nullable=False),
+    sa.Column('perceptual_hash', sa.BigInteger(), nullable=True),
+    sa.Column('mood', sa.String(), nullable=False),
+    sa.Column('hit_count', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('content_hash')
+    )
+    op.create_index(op.f('ix_mood_inference_cache_id'), 'mood_inference_cache', ['id'], unique=False)
+    op.create_index(op.f('ix_mood_inference_cache_perceptual_hash'), 'mood_inference_cache', ['perceptual_hash'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_mood_inference_cache_perceptual_hash'), table_name='mood_inference_cache')
+    op.drop_index(op.f('ix_mood_inference_cache_id'), table_name='mood_inference_cache')
+    op.drop_table('mood_inference_cache')
@@ -0,0 +1,35 @@
+"""add history composite indexes
+
+Revision ID: 8d2e4b6f1a93
+Revises: 3c1f0a9d7b42
+Create Date: 2026-10-17 14:05:12.583104
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d2e4b6f1a93'
+down_revision: Union[str, None] = '3c1f0a9d7b42'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 既存の大きな履歴テーブルへの書き込みを止めないよう CONCURRENTLY で作成する（トランザクション外で実行）
+    with op.get_context().autocommit_block():
+        op.create_index('ix_swipe_history_user_id_liked_song_id', 'swipe_history', ['user_id', 'liked', 'song_id'], unique=False, postgresql_concurrently=True)
+        op.create_index('ix_photo_uploads_user_id_created_at', 'photo_uploads', ['user_id', sa.text('created_at DESC')], unique=False, postgresql_include=['image_path'], postgresql_concurrently=True)
+        op.create_index('ix_playlist_history_user_id_created_at', 'playlist_history', ['user_id', sa.text('created_at DESC'), sa.text('id DESC')], unique=False, postgresql_concurrently=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index('ix_playlist_history_user_id_created_at', table_name='playlist_history', postgresql_concurrently=True)
+        op.drop_index('ix_photo_uploads_user_id_created_at', table_name='photo_uploads', postgresql_concurrently=True)
+        op.drop_index('ix_swipe_history_user_id_liked_song_id', table_name='swipe_history', postgresql_concurrently=True)
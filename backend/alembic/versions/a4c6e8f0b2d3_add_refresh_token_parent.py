@@ -0,0 +1,31 @@
+"""add refresh token parent
+
+Revision ID: a4c6e8f0b2d3
+Revises: f3b5d7e9a1c2
+Create Date: 2026-10-18 11:03:27.904561
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a4c6e8f0b2d3'
+down_revision: Union[str, None] = 'f3b5d7e9a1c2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 既存のトークンはNULLのまま（交換元が分からないため、猶予期間内の再発行の対象外になる）
+    op.add_column('refresh_tokens', sa.Column('parent_id', sa.Integer(), nullable=True))
+    op.create_foreign_key('fk_refresh_tokens_parent_id_refresh_tokens', 'refresh_tokens', 'refresh_tokens', ['parent_id'], ['id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('fk_refresh_tokens_parent_id_refresh_tokens', 'refresh_tokens', type_='foreignkey')
+    op.drop_column('refresh_tokens', 'parent_id')
@@ -0,0 +1,83 @@
+"""store playlist song ids
+
+Revision ID: c7a3f18e9d65
+Revises: b5e1c7d9f204
+Create Date: 2026-10-17 18:20:47.330129
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c7a3f18e9d65'
+down_revision: Union[str, None] = 'b5e1c7d9f204'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# songs_json（Likeした曲 + 推薦曲の楽曲データのJSON配列）を楽曲IDの配列に分ける。
+# 境界は保存されていないため、先頭から続く「ユーザーがLikeした曲」をLike曲とみなす
+# （Likeが3曲未満のときはランダムな3曲で補っていたため、最低でも先頭3曲はLike曲として扱う）。
+# Like判定は ix_swipe_history_user_id_liked_song_id だけで行える。
+# 配列は楽曲の要素を1回だけ集約して作る（プレイリストごとの相関サブクエリにしない）
+CONVERT_SQL = """
+WITH elems AS (
+    SELECT p.id, e.ord, (e.value->>'id')::int AS song_id,
+           EXISTS (
+               SELECT 1 FROM swipe_history s
+               WHERE s.user_id = p.user_id AND s.liked AND s.song_id = (e.value->>'id')::int
+           ) AS was_liked
+    FROM playlist_history p
+    CROSS JOIN LATERAL jsonb_array_elements(p.songs_json::jsonb) WITH ORDINALITY AS e(value, ord)
+    WHERE p.songs_json IS NOT NULL AND p.songs_json <> ''
+),
+prefix AS (
+    SELECT id, ord, song_id, bool_and(was_liked) OVER (PARTITION BY id ORDER BY ord) AS in_prefix
+    FROM elems
+),
+split AS (
+    SELECT id, GREATEST(count(*) FILTER (WHERE in_prefix), LEAST(3, count(*))) AS liked_count
+    FROM prefix GROUP BY id
+),
+agg AS (
+    SELECT x.id,
+           coalesce(array_agg(x.song_id ORDER BY x.ord) FILTER (WHERE x.ord <= s.liked_count), '{}') AS liked,
+           coalesce(array_agg(x.song_id ORDER BY x.ord) FILTER (WHERE x.ord > s.liked_count), '{}') AS rec
+    FROM prefix x JOIN split s ON s.id = x.id
+    GROUP BY x.id
+)
+UPDATE playlist_history p SET liked_song_ids = agg.liked, recommended_song_ids = agg.rec
+FROM agg
+WHERE agg.id = p.id
+"""
+
+# 楽曲データは復元できないため、楽曲IDだけのオブジェクトの配列に戻す
+REVERT_SQL = """
+UPDATE playlist_history SET songs_json = (
+    SELECT COALESCE(json_agg(json_build_object('id', x.song_id) ORDER BY x.ord), '[]'::json)::text
+    FROM unnest(liked_song_ids || recommended_song_ids) WITH ORDINALITY AS x(song_id, ord)
+)
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('playlist_history', sa.Column('liked_song_ids', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.add_column('playlist_history', sa.Column('recommended_song_ids', postgresql.ARRAY(sa.Integer()), nullable=True))
+    op.execute(CONVERT_SQL)
+    op.execute("UPDATE playlist_history SET liked_song_ids = '{}', recommended_song_ids = '{}' WHERE liked_song_ids IS NULL")
+    op.alter_column('playlist_history', 'liked_song_ids', nullable=False)
+    op.alter_column('playlist_history', 'recommended_song_ids', nullable=False)
+    op.drop_column('playlist_history', 'songs_json')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.add_column('playlist_history', sa.Column('songs_json', sa.Text(), nullable=True))
+    op.execute(REVERT_SQL)
+    op.drop_column('playlist_history', 'recommended_song_ids')
+    op.drop_column('playlist_history', 'liked_song_ids')
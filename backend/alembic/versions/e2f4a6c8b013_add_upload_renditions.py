@@ -0,0 +1,47 @@
+"""add upload renditions
+
+Revision ID: e2f4a6c8b013
+Revises: c7a3f18e9d65
+Create Date: 2026-10-17 19:55:31.604217
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2f4a6c8b013'
+down_revision: Union[str, None] = 'c7a3f18e9d65'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # 既存の行はNULLのまま（python -m app.services.upload_store で内容ハッシュの保存先に移行する）
+    op.add_column('photo_uploads', sa.Column('content_hash', sa.String(length=64), nullable=True))
+    op.add_column('photo_uploads', sa.Column('thumbnail_path', sa.String(), nullable=True))
+    op.add_column('photo_uploads', sa.Column('preview_path', sa.String(), nullable=True))
+    op.add_column('playlist_history', sa.Column('thumbnail_path', sa.String(), nullable=True))
+    op.add_column('playlist_history', sa.Column('preview_path', sa.String(), nullable=True))
+    # 最新アップロードの取得でレンディションのパスもインデックスだけで返せるよう、INCLUDE を広げて作り直す
+    # （新しいインデックスを別名で作ってから入れ替え、インデックスが無い時間を作らない）
+    with op.get_context().autocommit_block():
+        op.create_index('ix_photo_uploads_user_id_created_at_new', 'photo_uploads', ['user_id', sa.text('created_at DESC')], unique=False, postgresql_include=['image_path', 'thumbnail_path', 'preview_path'], postgresql_concurrently=True)
+        op.drop_index('ix_photo_uploads_user_id_created_at', table_name='photo_uploads', postgresql_concurrently=True)
+    op.execute('ALTER INDEX ix_photo_uploads_user_id_created_at_new RENAME TO ix_photo_uploads_user_id_created_at')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_photo_uploads_user_id_created_at_old', 'photo_uploads', ['user_id', sa.text('created_at DESC')], unique=False, postgresql_include=['image_path'], postgresql_concurrently=True)
+        op.drop_index('ix_photo_uploads_user_id_created_at', table_name='photo_uploads', postgresql_concurrently=True)
+    op.execute('ALTER INDEX ix_photo_uploads_user_id_created_at_old RENAME TO ix_photo_uploads_user_id_created_at')
+    op.drop_column('playlist_history', 'preview_path')
+    op.drop_column('playlist_history', 'thumbnail_path')
+    op.drop_column('photo_uploads', 'preview_path')
+    op.drop_column('photo_uploads', 'thumbnail_path')
+    op.drop_column('photo_uploads', 'content_hash')
@@ -0,0 +1,45 @@
+"""unique swipe outcomes
+
+Revision ID: f3b5d7e9a1c2
+Revises: e2f4a6c8b013
+Create Date: 2026-10-18 10:12:44.218305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'f3b5d7e9a1c2'
+down_revision: Union[str, None] = 'e2f4a6c8b013'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+# 同時リクエストで二重に記録された同じスワイプ結果を、最初の1行だけ残して削除する
+DEDUPLICATE_SQL = """
+DELETE FROM swipe_history a
+USING swipe_history b
+WHERE a.user_id = b.user_id AND a.liked = b.liked AND a.song_id = b.song_id AND a.id > b.id
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.execute(DEDUPLICATE_SQL)
+    # 一意インデックスを別名で作ってから入れ替え、インデックスが無い時間を作らない
+    # （作成までに重複が書き込まれると失敗するため、書き込みの少ない時間に実行する）
+    with op.get_context().autocommit_block():
+        op.create_index('ix_swipe_history_user_id_liked_song_id_new', 'swipe_history', ['user_id', 'liked', 'song_id'], unique=True, postgresql_concurrently=True)
+        op.drop_index('ix_swipe_history_user_id_liked_song_id', table_name='swipe_history', postgresql_concurrently=True)
+    op.execute('ALTER INDEX ix_swipe_history_user_id_liked_song_id_new RENAME TO ix_swipe_history_user_id_liked_song_id')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.create_index('ix_swipe_history_user_id_liked_song_id_old', 'swipe_history', ['user_id', 'liked', 'song_id'], unique=False, postgresql_concurrently=True)
+        op.drop_index('ix_swipe_history_user_id_liked_song_id', table_name='swipe_history', postgresql_concurrently=True)
+    op.execute('ALTER INDEX ix_swipe_history_user_id_liked_song_id_old RENAME TO ix_swipe_history_user_id_liked_song_id')
@@ -1,7 +1,7 @@
 # アプリケーションの設定を管理するファイル
 # Pydanticを使用して、環境変数から設定を読み込む
 import enum
-from typing import Any, Optional
+from typing import Any, Dict, Optional
 from pydantic import PostgresDsn, ValidationInfo, field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -29,9 +29,96 @@ class Settings(BaseSettings):
 
     # OpenAI API設定
     API_KEY: str
+    # 画像処理（デコード・変換・保存）用スレッドプールのワーカー数
+    IMAGE_WORKERS: int = 4
+    # Vision APIに送る画像の前処理（長辺の上限・JPEG品質・detail指定）
+    VISION_IMAGE_MAX_EDGE: int = 1024
+    VISION_JPEG_QUALITY: int = 85
+    VISION_IMAGE_DETAIL: str = "auto"
+    # アップロード画像の保存先・上限サイズと、保存時に作るサムネイル・プレビューの長辺とJPEG品質
+    UPLOAD_DIR: str = "uploads"
+    UPLOAD_MAX_BYTES: int = 20 * 1024 * 1024
+    UPLOAD_THUMBNAIL_EDGE: int = 256
+    UPLOAD_PREVIEW_EDGE: int = 1024
+    UPLOAD_RENDITION_QUALITY: int = 80
+    # 画像→ムード推定結果のキャッシュ設定
+    MOOD_CACHE_MAX_ENTRIES: int = 10000
+    MOOD_CACHE_TTL_SECONDS: int = 7 * 24 * 3600
+    # 知覚ハッシュ（dHash）で同一とみなすハミング距離（0で近似一致を無効化）
+    MOOD_CACHE_PERCEPTUAL_DISTANCE: int = 4
 
     SECRET_KEY: str
     ALGORITHM: str
+    # アクセストークン・リフレッシュトークンの有効期限
+    ACCESS_TOKEN_EXPIRE_MINUTES: int = 15
+    REFRESH_TOKEN_EXPIRE_DAYS: int = 30
+    # ローテーション直後の旧トークンの再送を許す秒数（応答を受け取れなかったクライアントの再試行。0で無効化）
+    REFRESH_TOKEN_REUSE_GRACE_SECONDS: int = 60
+    # パスワードハッシュ（bcrypt）の設定（コスト・ワーカープロセス数・同時に受け付ける処理数の上限）
+    # コストを変更すると、既存ユーザーのハッシュは次回ログイン時に再ハッシュされる
+    BCRYPT_ROUNDS: int = 12
+    PASSWORD_HASH_WORKERS: int = 2
+    PASSWORD_HASH_MAX_PENDING: int = 64
+    # 検証済みアクセストークンのキャッシュ設定（0件で無効化）
+    AUTH_PRINCIPAL_CACHE_TTL_SECONDS: int = 60
+    AUTH_PRINCIPAL_CACHE_MAX_ENTRIES: int = 10000
+
+    # スワイプ状態キャッシュ設定（"memory": プロセス内LRU / "redis": 共有ストア）
+    SWIPE_SESSION_BACKEND: str = "memory"
+    SWIPE_SESSION_TTL_SECONDS: int = 1800
+    SWIPE_SESSION_MAX_USERS: int = 10000
+    REDIS_URL: Optional[str] = None
+
+    # スワイプ履歴のライトビハインド書き込み設定（まとめて書き込む件数・最大の待ち秒数）
+    # 書き込みが滞った場合の未書き込みイベントの上限と、上限に達したときに /swipe を待たせる最大の秒数（超えたら503）
+    SWIPE_LOG_BATCH_SIZE: int = 500
+    SWIPE_LOG_FLUSH_INTERVAL_SECONDS: float = 0.5
+    SWIPE_LOG_MAX_BUFFER: int = 50000
+    SWIPE_LOG_APPEND_TIMEOUT_SECONDS: float = 5.0
+
+    # プレイリスト履歴のページサイズ（既定値・上限）とエクスポート時に1回で読む件数
+    HISTORY_PAGE_SIZE: int = 20
+    HISTORY_PAGE_SIZE_MAX: int = 100
+    HISTORY_EXPORT_BATCH_SIZE: int = 200
+
+    # 埋め込みによる近傍探索の設定（IVFで探索するリスト数・全件走査モード・スワイプでの利用）
+    EMBEDDING_NPROBE: int = 8
+    EMBEDDING_EXACT: bool = False
+    SWIPE_EMBEDDING_EXPLORE: bool = False
+
+    # 楽曲カタログの再読み込み設定（元データ・CURRENT の変更を確認する間隔。0で無効化）
+    # 管理用トークンを設定すると POST /catalog/reload で即時に確認・切り替えできる
+    CATALOG_RELOAD_INTERVAL_SECONDS: float = 10.0
+    CATALOG_ADMIN_TOKEN: Optional[str] = None
+
+    # メトリクスの収集と GET /metrics（Prometheus テキスト形式）での公開を有効にするか
+    # /metrics は METRICS_TOKEN を Bearer トークンとして送った場合のみ返す（未設定なら公開しない）
+    METRICS_ENABLED: bool = True
+    METRICS_TOKEN: Optional[str] = None
+
+    # リクエストごとのSQLの計測（実行回数・DB時間・行数。メトリクスに記録し、ヘッダーは未指定なら開発環境のみ付ける）
+    # クエリ数の上限はルート（"POST /swipe" のようにメソッドとルートのテンプレート）ごとに指定し、
+    # 超えた場合の動作を DB_QUERY_BUDGET_MODE で選ぶ（"raise": 例外を送出（テスト向け） / "log": 警告 / "off"）
+    # 1リクエストで同じSQL文を DB_QUERY_REPEAT_THRESHOLD 回以上実行したら N+1 の疑いとして警告する（0で無効化）
+    # 既定の上限は認証のキャッシュが無い場合の実測値（python -m benchmarks.check_query_budget・tests で確認する）
+    # スワイプログのINSERTは書き込みスレッドで行うため、/swipe・/swipe/batch の上限には含まれない
+    DB_QUERY_STATS_ENABLED: bool = True
+    DB_QUERY_HEADERS: Optional[bool] = None
+    DB_QUERY_BUDGETS: Dict[str, int] = {
+        "POST /signup": 4,
+        "POST /login": 3,  # 旧コストのハッシュの再ハッシュ（UPDATE）を含む
+        "POST /token/refresh": 5,  # 猶予期間内の再送（後継の失効と再発行）を含む
+        "POST /logout": 2,
+        "POST /photo": 5,
+        "POST /swipe": 2,
+        "GET /swipe/queue": 1,
+        "POST /swipe/batch": 1,
+        "GET /playlist": 3,
+        "GET /history": 2,
+        "GET /history/export": 2,
+    }
+    DB_QUERY_BUDGET_MODE: str = "log"
+    DB_QUERY_REPEAT_THRESHOLD: int = 5
 
     @field_validator("SQLALCHEMY_DATABASE_URI", mode="after")
     def assemble_db_connection(cls, v: Optional[str], values: ValidationInfo) -> Any:
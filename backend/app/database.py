@@ -1,7 +1,7 @@
 # SQLAlchemyを使用してデータベース接続を設定するファイル
 from app.core.config import settings
 from sqlalchemy import create_engine
-from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.orm import sessionmaker
 
 # データベース接続設定
 if settings.SQLALCHEMY_DATABASE_URI:
@@ -9,9 +9,10 @@ if settings.SQLALCHEMY_DATABASE_URI:
         settings.SQLALCHEMY_DATABASE_URI,
         pool_pre_ping=True,
     )
-    SessionLocal = scoped_session(
-        sessionmaker(autocommit=False, autoflush=False, bind=engine)
-    )
+    # リクエストごとに独立したセッションを生成する
+    # （scoped_session はスレッド単位で共有されるため、非同期エンドポイントと
+    #   スレッドプールが混在すると同じセッションが並行利用されてしまう）
+    SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
     if settings.ENVIRONMENT == "development":
         db_info = f"Using database at {settings.SQLALCHEMY_DATABASE_URI}"
@@ -24,7 +24,7 @@ def get_db() -> Generator:
 def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_scheme)):
     """現在のユーザーを取得するための依存関係。
 
-    トークンをデコードして、ユーザー情報を取得する。
+    トークンをデコードして、ユーザー情報を取得する（検証済みのトークンはキャッシュから返す）。
     トークンが無効な場合はHTTP 401エラーを返す。
 
     Args:
@@ -32,6 +32,6 @@ def get_current_user(db: Session = Depends(get_db), token: str = Depends(oauth2_
         token (str): OAuth2トークン（依存性注入によって取得）。
 
     Returns:
-        User: 認証されたユーザーオブジェクト。
+        services.Principal: 認証されたユーザー（ユーザーIDとemail）。
     """
     return services.decode_access_token(db, token)
\ No newline at end of file
@@ -1,11 +1,32 @@
 # FastAPI アプリケーションのエントリーポイントを定義するファイル
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from .routers import router
+from .routers import router, get_openai_client, CATALOG_MANAGER, SWIPE_LOG
+from .services import PASSWORD_HASHER, MetricsMiddleware, QueryStatsMiddleware
+from .core.config import settings
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """起動時にスワイプログの書き込みスレッド・パスワードハッシュのプロセスプールを開始し、
+    カタログを読み込んで（最初のリクエストで読み込まないよう、受け付け開始前に）定期確認を開始する。
+    OpenAIクライアントの作成（openai の読み込み）はリクエストの受け付けと並行してスレッドで行う。
+    終了時に未書き込みのスワイプを書き切ってプロセスプールと定期確認を止める"""
+    try:
+        SWIPE_LOG.start()
+        PASSWORD_HASHER.start()
+        CATALOG_MANAGER.start()
+        asyncio.get_running_loop().run_in_executor(None, get_openai_client)
+        yield
+    finally:
+        # 起動途中で失敗した場合も、開始済みのスレッド・プロセスプールを止める
+        CATALOG_MANAGER.close()
+        SWIPE_LOG.close()
+        PASSWORD_HASHER.shutdown()
 
 # FastAPIのインスタンスを作成（アプリケーション全体を管理する）
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # CORS を許可（Expoとの接続は未テスト）
 app.add_middleware(
@@ -16,8 +37,21 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# アップロードフォルダを公開
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# ルートごとの処理時間・処理中のリクエスト数を記録する（GET /metrics で公開）
+if settings.METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+# リクエストごとのSQLの実行回数・DB時間・行数を記録し、ルートごとのクエリ数の上限を確認する
+if settings.DB_QUERY_STATS_ENABLED:
+    app.add_middleware(
+        QueryStatsMiddleware,
+        budgets=settings.DB_QUERY_BUDGETS,
+        mode=settings.DB_QUERY_BUDGET_MODE,
+        headers=(settings.ENVIRONMENT == "development" if settings.DB_QUERY_HEADERS is None
+                 else settings.DB_QUERY_HEADERS),
+        repeat_threshold=settings.DB_QUERY_REPEAT_THRESHOLD,
+        record_metrics=settings.METRICS_ENABLED,
+    )
 
 # routers.pyで作成したルーティングを読み込む
 app.include_router(router)
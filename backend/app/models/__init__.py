@@ -1,4 +1,6 @@
 from .user import User
 from .playlist_history import PlaylistHistory
 from .swipe_history import SwipeHistory
-from .photo_upload import PhotoUpload
\ No newline at end of file
+from .photo_upload import PhotoUpload
+from .mood_inference import MoodInference
+from .refresh_token import RefreshToken
\ No newline at end of file
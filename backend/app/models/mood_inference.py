@@ -0,0 +1,15 @@
+# FastAPI ORMモデルとPydanticスキーマ定義
+from sqlalchemy import Column, Integer, DateTime, String, BigInteger
+from app.db.base_class import Base # Baseクラスをインポート
+from sqlalchemy.sql import func
+
+# 画像→ムード推定結果のキャッシュ（画像の内容ハッシュをキーとする）
+class MoodInference(Base):
+    __tablename__ = 'mood_inference_cache'
+
+    id = Column(Integer, primary_key=True, index=True)
+    content_hash = Column(String(64), nullable=False, unique=True)
+    perceptual_hash = Column(BigInteger, index=True)
+    mood = Column(String, nullable=False)
+    hit_count = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,5 @@
 # FastAPI ORMモデルとPydanticスキーマ定義
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, String
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base # Baseクラスをインポート
 from sqlalchemy.sql import func
@@ -9,8 +9,22 @@ class PhotoUpload(Base):
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    # 原画像のパス（内容ハッシュで保存。同じ画像は同じパスを指す）
     image_path = Column(String, nullable=False)
+    # 原画像のSHA-256と、保存時に作ったサムネイル・プレビューのパス（内容ハッシュ化以前の行はNULL）
+    content_hash = Column(String(64), nullable=True)
+    thumbnail_path = Column(String, nullable=True)
+    preview_path = Column(String, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # リレーション（Many-to-One）
     user = relationship("User", back_populates="photo_uploads")
+
+
+# ユーザーの最新アップロードのパスをインデックスの先頭1件から返す（PostgreSQLでは INCLUDE で被覆）
+Index(
+    "ix_photo_uploads_user_id_created_at",
+    PhotoUpload.user_id,
+    PhotoUpload.created_at.desc(),
+    postgresql_include=["image_path", "thumbnail_path", "preview_path"],
+)
@@ -1,17 +1,36 @@
 # FastAPI ORMモデルとPydanticスキーマ定義
-from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Text
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String, Index, JSON
+from sqlalchemy.dialects.postgresql import ARRAY
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base # Baseクラスをインポート
 from sqlalchemy.sql import func
 
+# 楽曲IDの配列（PostgreSQLでは int[]、ローカル検証用のSQLiteではJSON配列）
+SongIdArray = ARRAY(Integer).with_variant(JSON(), "sqlite")
+
 # PlaylistHistoryモデルの定義
+# 楽曲データは保存せず楽曲IDだけを持ち、表示時にカタログから復元する
 class PlaylistHistory(Base):
     __tablename__ = "playlist_history"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
     image_path = Column(String)
-    songs_json = Column(Text)
+    # 履歴画面で使う縮小画像のパス（内容ハッシュ化以前の行はNULLで、image_path を使う）
+    thumbnail_path = Column(String, nullable=True)
+    preview_path = Column(String, nullable=True)
+    # Likeした曲・推薦曲の楽曲ID（表示順）
+    liked_song_ids = Column(SongIdArray, nullable=False, default=list)
+    recommended_song_ids = Column(SongIdArray, nullable=False, default=list)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # リレーション（Many-to-One）
-    user = relationship("User", back_populates="playlists")
\ No newline at end of file
+    user = relationship("User", back_populates="playlists")
+
+
+# ユーザーのプレイリスト履歴を新しい順に読む（並べ替えなし）
+Index(
+    "ix_playlist_history_user_id_created_at",
+    PlaylistHistory.user_id,
+    PlaylistHistory.created_at.desc(),
+    PlaylistHistory.id.desc(),
+)
@@ -0,0 +1,20 @@
+# FastAPI ORMモデルとPydanticスキーマ定義
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, String
+from app.db.base_class import Base # Baseクラスをインポート
+from sqlalchemy.sql import func
+
+# リフレッシュトークン（平文は保存せず、HMAC-SHA256 のハッシュだけを持つ）
+class RefreshToken(Base):
+    __tablename__ = 'refresh_tokens'
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=False, index=True)
+    token_hash = Column(String(64), nullable=False, unique=True)
+    # ローテーションで引き継がれる系列のID（再利用を検知したら系列ごと失効させる）
+    family_id = Column(String(32), nullable=False, index=True)
+    # 交換元のトークン（ログインで発行したトークンはNULL。猶予期間内の再発行が1回だけかの確認に使う）
+    parent_id = Column(Integer, ForeignKey('refresh_tokens.id'))
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    # 使用済み（ローテーション済み）または失効した日時
+    revoked_at = Column(DateTime(timezone=True))
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
@@ -1,5 +1,5 @@
 # FastAPI ORMモデルとPydanticスキーマ定義
-from sqlalchemy import Column, Integer, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, ForeignKey, DateTime, Index
 from sqlalchemy.orm import relationship
 from app.db.base_class import Base # Baseクラスをインポート
 from sqlalchemy.sql import func
@@ -16,4 +16,10 @@ class SwipeHistory(Base):
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     # リレーション（Many-to-One）
-    user = relationship("User", back_populates="swipes")
\ No newline at end of file
+    user = relationship("User", back_populates="swipes")
+
+    __table_args__ = (
+        # ユーザーごとのスワイプ済み・Like済みの楽曲IDをインデックスだけで返す（カバリングインデックス）。
+        # 同じスワイプ結果を二重に記録しないよう一意にする（Dislike した曲の Like は別の結果として記録できる）
+        Index("ix_swipe_history_user_id_liked_song_id", "user_id", "liked", "song_id", unique=True),
+    )
\ No newline at end of file
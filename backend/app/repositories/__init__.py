@@ -0,0 +1,8 @@
+from .user import email_exists, get_user_by_email, user_exists
+from .swipe import bulk_insert_swipes, liked_song_ids, swipe_states
+from .photo import latest_upload
+from .playlist import list_playlists
+from .refresh_token import (
+    add_refresh_token, child_refresh_tokens, consume_refresh_token, find_refresh_token, revoke_refresh_family,
+    revoke_user_refresh_tokens,
+)
\ No newline at end of file
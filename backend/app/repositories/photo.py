@@ -0,0 +1,22 @@
+# photo_uploadsテーブルへの問い合わせをまとめたファイル
+from typing import Optional
+
+from sqlalchemy import Row, select
+from sqlalchemy.orm import Session
+
+from app.models import PhotoUpload
+
+
+def latest_upload(db: Session, user_id: int) -> Optional[Row]:
+    """ユーザーが最後にアップロードした画像のパス（image_path, thumbnail_path, preview_path）を返す（無ければNone）。
+
+    ix_photo_uploads_user_id_created_at (user_id, created_at DESC)
+    INCLUDE (image_path, thumbnail_path, preview_path) の先頭1件を読むだけで済む。
+    """
+    stmt = (
+        select(PhotoUpload.image_path, PhotoUpload.thumbnail_path, PhotoUpload.preview_path)
+        .where(PhotoUpload.user_id == user_id)
+        .order_by(PhotoUpload.created_at.desc())
+        .limit(1)
+    )
+    return db.execute(stmt).first()
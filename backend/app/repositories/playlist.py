@@ -0,0 +1,47 @@
+# playlist_historyテーブルへの問い合わせをまとめたファイル
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import Row, select, tuple_
+from sqlalchemy.orm import Session
+
+from app.models import PlaylistHistory
+
+
+def list_playlists(
+    db: Session,
+    user_id: int,
+    limit: Optional[int] = None,
+    before: Optional[Tuple[datetime, int]] = None,
+) -> List[Row]:
+    """ユーザーのプレイリスト履歴（id, 画像のパス, liked_song_ids, recommended_song_ids, created_at）を新しい順に返す。
+
+    ix_playlist_history_user_id_created_at (user_id, created_at DESC, id DESC) の順に読むため、
+    並べ替えは発生しない。before を指定した場合はその行の直後から読み始める（キーセット方式）。
+
+    Args:
+        db (Session): データベースセッション。
+        user_id (int): ユーザーID。
+        limit (int, optional): 返す最大件数（省略時は全件）。
+        before (Tuple[datetime, int], optional): 前のページの最後の行の (created_at, id)。
+    Returns:
+        List[Row]: プレイリスト履歴の行のリスト。
+    """
+    stmt = (
+        select(
+            PlaylistHistory.id,
+            PlaylistHistory.image_path,
+            PlaylistHistory.thumbnail_path,
+            PlaylistHistory.preview_path,
+            PlaylistHistory.liked_song_ids,
+            PlaylistHistory.recommended_song_ids,
+            PlaylistHistory.created_at,
+        )
+        .where(PlaylistHistory.user_id == user_id)
+        .order_by(PlaylistHistory.created_at.desc(), PlaylistHistory.id.desc())
+    )
+    if before is not None:
+        stmt = stmt.where(tuple_(PlaylistHistory.created_at, PlaylistHistory.id) < tuple_(*before))
+    if limit is not None:
+        stmt = stmt.limit(limit)
+    return list(db.execute(stmt))
@@ -0,0 +1,71 @@
+# refresh_tokensテーブルへの問い合わせをまとめたファイル
+# トークンの検索は token_hash の一意インデックス、系列の失効は family_id のインデックスを使う
+from datetime import datetime
+from typing import List, Optional, Tuple
+
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+
+from app.models import RefreshToken, User
+
+
+def add_refresh_token(db: Session, user_id: int, token_hash: str, family_id: str, expires_at: datetime,
+                      parent_id: Optional[int] = None) -> None:
+    """リフレッシュトークンを追加する（コミットは呼び出し側で行う）"""
+    db.add(RefreshToken(user_id=user_id, token_hash=token_hash, family_id=family_id, expires_at=expires_at,
+                        parent_id=parent_id))
+
+
+def find_refresh_token(db: Session, token_hash: str) -> Optional[Tuple[RefreshToken, str]]:
+    """ハッシュに一致するリフレッシュトークンと、持ち主のemailを返す"""
+    stmt = (
+        select(RefreshToken, User.email)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(RefreshToken.token_hash == token_hash)
+        .limit(1)
+    )
+    row = db.execute(stmt).first()
+    return None if row is None else (row[0], row[1])
+
+
+def child_refresh_tokens(db: Session, family_id: str, parent_id: int) -> List[Tuple[int, Optional[datetime]]]:
+    """トークンと交換で発行した後継（id, revoked_at）を発行順に返す（ORMの識別マップを通さず、常にDBの値を読む）。
+
+    系列のインデックスで絞り込むため、parent_id のインデックスは使わない。
+    """
+    stmt = (
+        select(RefreshToken.id, RefreshToken.revoked_at)
+        .where(RefreshToken.family_id == family_id, RefreshToken.parent_id == parent_id)
+        .order_by(RefreshToken.id)
+    )
+    return [(token_id, revoked_at) for token_id, revoked_at in db.execute(stmt)]
+
+
+def consume_refresh_token(db: Session, token_id: int, now: datetime) -> bool:
+    """未使用のトークンを使用済みにする。既に使用済み・失効済みなら False（同時に使われた場合も片方だけが成功する）"""
+    stmt = (
+        update(RefreshToken)
+        .where(RefreshToken.id == token_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    return db.execute(stmt).rowcount == 1
+
+
+def revoke_refresh_family(db: Session, family_id: str, now: datetime) -> int:
+    """系列の未失効のトークンをすべて失効させ、件数を返す"""
+    stmt = (
+        update(RefreshToken)
+        .where(RefreshToken.family_id == family_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    return db.execute(stmt).rowcount
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int, now: datetime) -> int:
+    """ユーザーの未失効のトークンをすべて失効させ、件数を返す"""
+    stmt = (
+        update(RefreshToken)
+        .where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_(None))
+        .values(revoked_at=now)
+    )
+    return db.execute(stmt).rowcount
@@ -0,0 +1,42 @@
+# swipe_historyテーブルへの問い合わせをまとめたファイル
+# ix_swipe_history_user_id_liked_song_id (user_id, liked, song_id) だけで答えられるよう、
+# ORMの行全体ではなく必要な列だけを読む
+from typing import Dict, List, Sequence, Tuple
+
+from sqlalchemy import insert, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+
+from app.models import SwipeHistory
+
+
+def swipe_states(db: Session, user_id: int) -> List[Tuple[int, bool]]:
+    """ユーザーのスワイプ結果（楽曲ID, Likeしたか）を返す"""
+    stmt = select(SwipeHistory.song_id, SwipeHistory.liked).where(SwipeHistory.user_id == user_id)
+    return [(song_id, liked) for song_id, liked in db.execute(stmt)]
+
+
+def liked_song_ids(db: Session, user_id: int) -> List[int]:
+    """ユーザーがLikeした楽曲IDを返す"""
+    stmt = select(SwipeHistory.song_id).where(SwipeHistory.user_id == user_id, SwipeHistory.liked.is_(True))
+    return list(db.scalars(stmt))
+
+
+# ON CONFLICT DO NOTHING を使えるDB（それ以外のDBでは重複が一意制約違反になる）
+_DIALECT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+
+def bulk_insert_swipes(db: Session, rows: Sequence[Dict]) -> None:
+    """複数ユーザー分のスワイプ結果（user_id, song_id, liked の辞書）を複数行INSERTで追加する（コミットは呼び出し側で行う）。
+
+    ORMオブジェクトを作らず、insertmanyvalues によりまとめた VALUES 句で送る。
+    記録済みの結果（同時リクエストなどで二重に届いたもの）は ON CONFLICT DO NOTHING で読み飛ばす。
+    """
+    if not rows:
+        return
+    dialect_insert = _DIALECT_INSERTS.get(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        stmt = insert(SwipeHistory)
+    else:
+        stmt = dialect_insert(SwipeHistory).on_conflict_do_nothing(index_elements=["user_id", "liked", "song_id"])
+    db.execute(stmt, list(rows))
@@ -0,0 +1,22 @@
+# usersテーブルへの問い合わせをまとめたファイル
+from typing import Optional
+
+from sqlalchemy import exists, select
+from sqlalchemy.orm import Session
+
+from app.models import User
+
+
+def email_exists(db: Session, email: str) -> bool:
+    """メールアドレスが登録済みかを EXISTS で確認する（行は読み込まない）"""
+    return db.scalar(select(exists().where(User.email == email)))
+
+
+def get_user_by_email(db: Session, email: str) -> Optional[User]:
+    """メールアドレスからユーザーを取得する（users.email の一意インデックスを使う）"""
+    return db.scalars(select(User).where(User.email == email).limit(1)).first()
+
+
+def user_exists(db: Session, user_id: int) -> bool:
+    """ユーザーIDが存在するかを主キーの EXISTS で確認する（行は読み込まない）"""
+    return db.scalar(select(exists().where(User.id == user_id)))
@@ -1,85 +1,209 @@
 # FastAPIのルーティングを定義するファイル
-from fastapi import APIRouter, Depends, FastAPI, Request, HTTPException, File, UploadFile
+from fastapi import APIRouter, Depends, Header, Request, HTTPException, Query
+from fastapi.responses import Response, StreamingResponse
 from sqlalchemy.orm import Session
 from app.dependencies import get_db, get_current_user
-from typing import List
+from app.database import SessionLocal, engine
+from typing import List, Optional
 from . import schemas
 from . import services
+from . import repositories
 from app.models import User, SwipeHistory, PlaylistHistory, PhotoUpload
-from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
+from fastapi.security import OAuth2PasswordRequestForm
 from starlette.status import HTTP_401_UNAUTHORIZED
 from datetime import timedelta
-import random, json
-from sklearn.metrics.pairwise import cosine_similarity
-import numpy as np
-import base64
+import random
 from app.core.config import settings
-from openai import OpenAI
+from starlette.concurrency import run_in_threadpool
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
 import logging
-from PIL import Image
-import io
 import re
 import difflib
-from uuid import uuid4
-import os
+import hmac
+from time import perf_counter
 
 logger = logging.getLogger(__name__)
 
-# OpenAIクライアント
-openai_client = OpenAI(api_key=settings.API_KEY)
+# OpenAIクライアント（非同期）
+# openai パッケージの読み込みには時間がかかるため、インポート時には作らず get_openai_client() で作る
+# （起動時にバックグラウンドで作成を始め、最初のムード推定を待たせない）
+openai_client = None
+
+def get_openai_client():
+    """OpenAIクライアントを返す（初回のみ openai を読み込んで作成する）"""
+    global openai_client
+    if openai_client is None:
+        from openai import AsyncOpenAI
+        openai_client = AsyncOpenAI(api_key=settings.API_KEY)
+    return openai_client
+
+# 画像のデコード・変換やファイル書き込み用の上限付きスレッドプール
+# （Starletteのスレッドプールを占有して /swipe や /login を止めないよう分離する）
+IMAGE_EXECUTOR = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS, thread_name_prefix="image")
+
+# アップロード画像の保存先（内容ハッシュで1つだけ保存し、サムネイル・プレビューも作る）
+UPLOAD_STORE = services.UploadStore(
+    settings.UPLOAD_DIR,
+    thumbnail_edge=settings.UPLOAD_THUMBNAIL_EDGE,
+    preview_edge=settings.UPLOAD_PREVIEW_EDGE,
+    quality=settings.UPLOAD_RENDITION_QUALITY,
+)
+
+# 画像→ムード推定結果のキャッシュ（同じ画像の再アップロードではAPIを呼ばない）
+MOOD_CACHE = services.MoodInferenceCache(
+    maxsize=settings.MOOD_CACHE_MAX_ENTRIES,
+    ttl=settings.MOOD_CACHE_TTL_SECONDS,
+    max_distance=settings.MOOD_CACHE_PERCEPTUAL_DISTANCE,
+)
 
 # APIRouterインスタンスを作成（ルーティングを管理する）
 router = APIRouter()
 
-# データ読み込み（起動時一度だけ）
-with open("data/filtered_songs_4_or_more_tags.json", encoding="utf-8") as f:
-    SONGS = json.load(f)
-with open("data/mood_similarity.json", encoding="utf-8") as f:
-    MOOD_SIMILARITY = json.load(f)
-with open("data/mood_instrument_similarity.json", encoding="utf-8") as f:
-    MOOD_INST_SIMILARITY = json.load(f)
+# 楽曲カタログ（コンパイル済みカタログを np.memmap で開き、全ワーカーでページキャッシュを共有する）
+# 元データや CURRENT が更新されるとバックグラウンドで新しいバージョンを構築して切り替えるため、
+# エンドポイントは開始時に CATALOG_MANAGER.current を1回だけ取得し、処理中はそのスナップショットを使う
+CATALOG_MANAGER = services.CatalogManager(
+    "data",
+    build=lambda catalog: services.CatalogSnapshot(
+        catalog,
+        embedding_nprobe=settings.EMBEDDING_NPROBE,
+        embedding_exact=settings.EMBEDDING_EXACT,
+        embedding_explore=settings.SWIPE_EMBEDDING_EXPLORE,
+    ),
+    poll_interval=settings.CATALOG_RELOAD_INTERVAL_SECONDS,
+)
+
+# スワイプ履歴のライトビハインド書き込み（件数・時間のしきい値でまとめてINSERTし、終了時に書き切る）
+SWIPE_LOG = services.SwipeLogWriter(
+    SessionLocal,
+    max_batch=settings.SWIPE_LOG_BATCH_SIZE,
+    flush_interval=settings.SWIPE_LOG_FLUSH_INTERVAL_SECONDS,
+    max_buffer=settings.SWIPE_LOG_MAX_BUFFER,
+    append_timeout=settings.SWIPE_LOG_APPEND_TIMEOUT_SECONDS,
+)
+
+# ユーザーごとのスワイプ状態キャッシュ（キャッシュミス時のみDBと未書き込みのスワイプログから復元）
+SWIPE_SESSIONS = services.create_swipe_session_store(settings, pending=SWIPE_LOG.pending)
+
+# メトリクス: DB接続プールの取得待ち・保持時間と、出力時に読む値（カタログ・インデックスの大きさ、キャッシュのヒット率）
+if settings.METRICS_ENABLED:
+    services.instrument_pool(engine.pool)
+# リクエストごとのSQLの実行回数・DB時間・行数（QueryStatsMiddleware が処理中のリクエストごとに集計する）
+if settings.DB_QUERY_STATS_ENABLED:
+    services.instrument_engine(engine)
+
+def _cache_hit_ratios():
+    ratios = {("mood",): MOOD_CACHE.stats()["hit_ratio"]}
+    for cache in ("principal", "swipe_session"):
+        ratio = services.metrics.cache_hit_ratio(cache)
+        if ratio is not None:
+            ratios[(cache,)] = ratio
+    return ratios
+
+services.metrics.Gauge("catalog_index_size", "現在のカタログとインデックスの大きさ（件数・バイト数）", ("index",),
+                       function=lambda: {(k,): v for k, v in CATALOG_MANAGER.current.sizes().items()})
+services.metrics.Gauge("catalog_info", "現在のカタログのバージョン", ("version",),
+                       function=lambda: {(CATALOG_MANAGER.current.version,): 1})
+services.metrics.Gauge("cache_hit_ratio", "キャッシュのヒット率（起動からの累計）", ("cache",), function=_cache_hit_ratios)
+services.metrics.Counter("mood_cache_lookups_total", "ムード推定キャッシュの参照結果ごとの件数", ("result",),
+                         function=lambda: {(k,): v for k, v in MOOD_CACHE.counters.items()})
+services.metrics.Gauge("mood_cache_entries", "ムード推定キャッシュのプロセス内のエントリ数",
+                       function=lambda: MOOD_CACHE.stats()["entries"])
+
+# ムード推定の処理時間（結果の取得元ごと）
+_MOOD_DURATION = {source: services.metrics.MOOD_ESTIMATION_DURATION.labels(source)
+                  for source in ("memory", "db", "api", "error")}
+
+def _log_swipes(db: Session, user_id: int, outcomes):
+    """スワイプ結果をスワイプログに追加し、反映後のスワイプ状態を返す。
+
+    状態を変えないスワイプ（クライアントの再送など、同じ結果の送り直し）は記録しない。
+    Dislike した曲を後から Like した場合は記録する（Like済みになり、プレイリストに使われる）。
+    一度 Like した曲は Like済みのまま扱う（従来どおり）ため、Like済みの曲への Dislike は記録しない。
+    記録するかはスワイプ状態の更新と同時に決める（同時に届いた同じスワイプは一方だけ記録する）。
+    DBへの書き込みが滞ってスワイプログが上限に達した場合は503エラーを返す。
+    """
+    session, applied = SWIPE_SESSIONS.record_many(db, user_id, outcomes)
+    if not applied:
+        return session
+    try:
+        SWIPE_LOG.extend(user_id, applied)
+    except services.SwipeLogFull:
+        # 記録できなかったスワイプを状態から外すため、次のリクエストで履歴から復元し直す
+        SWIPE_SESSIONS.invalidate(user_id)
+        raise HTTPException(status_code=503, detail="スワイプを記録できません。しばらくしてから再度お試しください")
+    return session
+
+def _encode_image_data_url(image_path: str):
+    """画像を縮小・JPEG化し、Base64の Data URL と detail 指定にする（IMAGE_EXECUTOR上で実行する）"""
+    try:
+        return services.prepare_vision_image(
+            image_path,
+            max_edge=settings.VISION_IMAGE_MAX_EDGE,
+            quality=settings.VISION_JPEG_QUALITY,
+            detail=settings.VISION_IMAGE_DETAIL,
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"画像の読み込みまたは変換に失敗しました: {str(e)}")
 
 # 画像からムードを推定する関数
-def estimate_mood_from_image(image_bytes: bytes) -> str:
-    """画像のバイナリデータからムードを推定する関数。
+async def estimate_mood_from_image(image: services.StoredImage, db: Session = None) -> str:
+    """保存済みの画像からムードを推定する関数。
     OpenAIのAPIを使って画像の雰囲気を一つだけ選ぶ。
+    画像の変換は IMAGE_EXECUTOR で行い、APIは非同期クライアントで呼び出すため、
+    イベントループやリクエスト用のスレッドプールをブロックしない。
+    同じ画像（またはほぼ同一の画像）の推定結果がキャッシュにあればAPIは呼ばない。
+    Vision APIに送る解像度がプレビュー以下なら、原画像ではなく保存時に作ったプレビューから変換する。
+    処理時間は結果の取得元（キャッシュ・API）ごとにメトリクスに記録する。
     Args:
-        image_bytes (bytes): 画像のバイナリデータ。
+        image (services.StoredImage): 保存済みの画像（内容ハッシュをキャッシュのキーに使う）。
+        db (Session, optional): データベースセッション（指定時はDBのキャッシュも使う）。
     Returns:
         str: 推定されたムード（雰囲気）。
     Raises:
         HTTPException: OpenAI APIの呼び出しに失敗した場合は500エラー。
     """
-    # 画像データが空の場合は400エラーを返す
-    if not image_bytes:
-        raise HTTPException(status_code=400, detail="画像データが空です")
-    # JPEGに変換
+    started = perf_counter()
     try:
-        with Image.open(io.BytesIO(image_bytes)) as img:
-            rgb_image = img.convert("RGB")  # JPEGはRGB形式が必要
-            output = io.BytesIO()
-            rgb_image.save(output, format="JPEG")
-            image_bytes = output.getvalue()
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=f"画像の読み込みまたは変換に失敗しました: {str(e)}")
-
-    # Base64エンコードして Data URL を作成（prefixはここだけ）
-    try:
-        encoded = base64.b64encode(image_bytes).decode("utf-8")
-        image_data_url = f"data:image/jpeg;base64,{encoded}"
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"画像データのエンコードに失敗しました: {str(e)}")
+        mood, source = await _estimate_mood(image, db)
+    except Exception:
+        _MOOD_DURATION["error"].observe(perf_counter() - started)
+        raise
+    _MOOD_DURATION[source].observe(perf_counter() - started)
+    return mood
+
+async def _estimate_mood(image: services.StoredImage, db: Session = None):
+    """estimate_mood_from_image の本体。(ムード, 取得元（memory / db / api）) を返す"""
+    loop = asyncio.get_running_loop()
+    use_preview = settings.VISION_IMAGE_MAX_EDGE <= settings.UPLOAD_PREVIEW_EDGE
+    source_path = UPLOAD_STORE.local_path(image.preview_path if use_preview else image.original_path)
+
+    # キャッシュを引く（プロセス内 → DB）。内容ハッシュは保存時に計算済み
+    key, phash = image.content_hash, None
+    if settings.MOOD_CACHE_PERCEPTUAL_DISTANCE > 0:
+        phash = await loop.run_in_executor(IMAGE_EXECUTOR, services.perceptual_hash, source_path)
+    mood = MOOD_CACHE.lookup_memory(key, phash)
+    if mood is not None:
+        return mood, "memory"
+    if db is not None:
+        mood = await run_in_threadpool(MOOD_CACHE.lookup_db, db, key, phash)
+        if mood is not None:
+            return mood, "db"
+
+    image_data_url, image_detail = await loop.run_in_executor(IMAGE_EXECUTOR, _encode_image_data_url, source_path)
 
     # OpenAI APIを使ってムードを推定
+    vision_started = perf_counter()
     try:
-        response = openai_client.chat.completions.create(
+        response = await get_openai_client().chat.completions.create(
             model="gpt-4o",
             messages=[
                 {
                     "role": "user",
                     "content": [
-                        {"type": "text", "text": "次の画像を見て、以下の選択肢の中から、最もふさわしいムードを1つだけ選び、その単語だけを小文字で出力してください。理由や説明は不要です。選択肢：" + ", ".join(MOOD_SIMILARITY.keys()) + "出力形式の例：calm"},
-                        {"type": "image_url", "image_url": {"url": image_data_url}}
+                        {"type": "text", "text": "次の画像を見て、以下の選択肢の中から、最もふさわしいムードを1つだけ選び、その単語だけを小文字で出力してください。理由や説明は不要です。選択肢：" + ", ".join(CATALOG_MANAGER.current.mood_similarity.keys()) + "出力形式の例：calm"},
+                        {"type": "image_url", "image_url": {"url": image_data_url, "detail": image_detail}}
                     ]
                 }
             ],
@@ -87,23 +211,89 @@ def estimate_mood_from_image(image_bytes: bytes) -> str:
         )
         mood = response.choices[0].message.content.strip().lower()
         mood = re.sub(r"[^a-z]", "", mood)
-        return mood
     except Exception as e:
+        services.metrics.VISION_ERRORS.labels(type(e).__name__).inc()
         logger.error(f"OpenAI APIの呼び出しに失敗しました: {str(e)}")
         raise HTTPException(status_code=500, detail=f"OpenAI APIの呼び出しに失敗しました: {str(e)}")
+    finally:
+        services.metrics.VISION_DURATION.observe(perf_counter() - vision_started)
 
-def flatten_tags(tags: dict) -> set:
-    """ジャンル・楽器・ムードなどすべてのタグを1つのsetにまとめる"""
-    return {tag for category in tags.values() for tag in category}
+    # 推定結果をキャッシュに保存
+    if db is not None:
+        await run_in_threadpool(MOOD_CACHE.store, db, key, phash, mood)
+    return mood, "api"
 
 # ルート
 @router.get("/")
 def get_root():
     return {"message": "接続成功"}
 
+# 現在の楽曲カタログのバージョン（デバッグ用）
+@router.get("/catalog", response_model=schemas.CatalogVersion)
+def get_catalog_version():
+    """このワーカーが使っている楽曲カタログのバージョン・楽曲数・読み込み時刻を返す"""
+    return CATALOG_MANAGER.current.status()
+
+# メトリクス（Prometheus のテキスト形式）
+@router.get("/metrics", include_in_schema=False)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    """ルートごとの処理時間・Vision API・DB接続プール・カタログ・キャッシュなどのメトリクスを返す。
+
+    トラフィックや接続プールの内部状態を公開しないよう、METRICS_TOKEN を Bearer トークンとして送った場合のみ返す
+    （Prometheus の scrape 設定の authorization.credentials に指定する）。
+    Args:
+        authorization (str, optional): Authorization ヘッダー（"Bearer <METRICS_TOKEN>"）。
+    Raises:
+        HTTPException: メトリクスが無効またはトークンが未設定の場合は404、一致しない場合は403エラー。
+    """
+    if not settings.METRICS_ENABLED or not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    scheme, _, token = (authorization or "").partition(" ")
+    if scheme.lower() != "bearer" or not hmac.compare_digest(token.encode(), settings.METRICS_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail="メトリクス用のトークンが正しくありません")
+    return Response(services.REGISTRY.render(), media_type=services.metrics.CONTENT_TYPE)
+
+# 楽曲カタログの再読み込み（管理用）
+@router.post("/catalog/reload", response_model=schemas.CatalogVersion)
+async def reload_catalog(x_admin_token: Optional[str] = Header(None)):
+    """元データ・CURRENT を確認し、変わっていれば新しいバージョンに切り替えるエンドポイント。
+    定期確認（CATALOG_RELOAD_INTERVAL_SECONDS）を待たずに切り替えたい場合に使う。
+    構築はスレッドで行い、その間も他のリクエストは現在のバージョンで処理される。
+    他のワーカーは CURRENT の切り替えを定期確認で検知する。
+    Args:
+        x_admin_token (str, optional): X-Admin-Token ヘッダー（CATALOG_ADMIN_TOKEN と一致する必要がある）。
+    Returns:
+        schemas.CatalogVersion: 切り替え後（変更が無ければ現在）のバージョン。
+    Raises:
+        HTTPException: 管理用トークンが未設定の場合は404、一致しない場合は403、読み込みに失敗した場合は500エラー。
+    """
+    if not settings.CATALOG_ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, settings.CATALOG_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="管理用トークンが正しくありません")
+    try:
+        await run_in_threadpool(CATALOG_MANAGER.reload)
+    except Exception as e:
+        logger.exception("カタログの再読み込みに失敗しました")
+        raise HTTPException(status_code=500, detail=f"カタログの再読み込みに失敗しました: {str(e)}")
+    return CATALOG_MANAGER.current.status()
+
+def _access_token_response(user_id: int, email: str, refresh_token: str) -> dict:
+    """アクセストークンを生成し、リフレッシュトークンと合わせたレスポンスを返す"""
+    # JWTトークンを生成（"sub"クレームにemail、"uid"クレームにユーザーIDを含める）
+    access_token = services.create_access_token(
+        data={"sub": email, "uid": user_id},
+        expires_delta=timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
+    )
+    return {"access_token": access_token, "token_type": "bearer", "refresh_token": refresh_token}
+
+def _issue_tokens(db: Session, user_id: int, email: str) -> dict:
+    """パスワードで認証したユーザーに、新しい系列のリフレッシュトークンとアクセストークンを発行する"""
+    return _access_token_response(user_id, email, services.issue_refresh_token(db, user_id))
+
 # サインアップ
 @router.post("/signup", response_model=schemas.Token)
-def signup(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
+async def signup(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
     """新しいユーザーを作成して登録するエンドポイント。
 
     指定されたメールアドレスが既に登録されている場合は、409 Conflict エラーを返す。
@@ -115,133 +305,156 @@ def signup(user_data: schemas.UserCreate, db: Session = Depends(get_db)):
         db (Session): データベースセッション（依存性注入によって取得）。
 
     Returns:
-        dict: access_token と token_type を含む辞書。
+        dict: access_token・refresh_token・token_type を含む辞書。
     """
 
-    user = db.query(User).filter(User.email == user_data.email).first()
     # ユーザーが既に存在する場合は409エラーを返す
-    if user:
+    if await run_in_threadpool(repositories.email_exists, db, user_data.email):
         raise HTTPException(status_code=409, detail="メールアドレスは既に使用されています")
-    # パスワードをハッシュ化してUserインスタンス作成
+    # パスワードをハッシュ化（bcryptはプロセスプールで実行）してUserインスタンス作成
     signedup_user = User(
         email=user_data.email,
-        hashed_password=services.get_password_hash(user_data.password)
+        hashed_password=await services.PASSWORD_HASHER.hash_async(user_data.password)
     )
     # DBに保存
     db.add(signedup_user)
-    db.commit()
-    db.refresh(signedup_user)
-   
-    # トークンの有効期限を15分に設定
-    access_token_expires = timedelta(minutes=15)
-    # JWTトークンを生成（"sub"クレームにemailを含める）
-    access_token = services.create_access_token(
-        data={"sub": signedup_user.email},
-        expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    await run_in_threadpool(db.commit)
+    await run_in_threadpool(db.refresh, signedup_user)
+
+    # アクセストークンとリフレッシュトークンを発行
+    return await run_in_threadpool(_issue_tokens, db, signedup_user.id, signedup_user.email)
 
 # ログイン
 @router.post("/login", response_model=schemas.Token)
-def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
+async def login_for_access_token(db: Session = Depends(get_db), form_data: OAuth2PasswordRequestForm = Depends()):
     """ログイン処理を行い、有効なクレデンシャルに対してJWTトークンを発行する。
 
     フォームから送信されたユーザー名（email）とパスワードを検証し、
-    有効な場合は15分間有効なアクセストークン（JWT）を返す。
+    有効な場合は短期間（既定15分）有効なアクセストークン（JWT）と、
+    アクセストークンの再発行に使うリフレッシュトークンを返す。
 
     Args:
         db (Session): データベースセッション。
         form_data (OAuth2PasswordRequestForm): フォームデータ（username, password）。
 
     Returns:
-        dict: アクセストークンとトークンタイプ（bearer）を含む辞書。
+        dict: アクセストークン・リフレッシュトークン・トークンタイプ（bearer）を含む辞書。
 
     Raises:
         HTTPException: 認証に失敗した場合は401エラー。
     """
-    # ユーザー名（メール）とパスワードを使って認証
-    print("form_data.username:", form_data.username)
-    user = services.authenticate_user(db, form_data.username, form_data.password)
-    print("DBから取得したuser:", user)
+    # ユーザー名（メール）とパスワードを使って認証（必要ならコストを合わせて再ハッシュする）
+    user = await services.authenticate_user(db, form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Incorrect email or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    # トークンの有効期限を15分に設定
-    access_token_expires = timedelta(minutes=15)
-    # JWTトークンを生成（"sub"クレームにemailを含める）
-    access_token = services.create_access_token(
-        data={"sub": user.email},
-        expires_delta=access_token_expires
-    )
-    return {"access_token": access_token, "token_type": "bearer"}
+    # アクセストークンとリフレッシュトークンを発行（再ハッシュしたパスワードも同じコミットで保存する）
+    return await run_in_threadpool(_issue_tokens, db, user.id, user.email)
+
+# アクセストークンの再発行
+@router.post("/token/refresh", response_model=schemas.Token)
+def refresh_access_token(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """リフレッシュトークンを新しいアクセストークン・リフレッシュトークンに交換する。
+
+    パスワード（bcrypt）の検証は行わず、リフレッシュトークンのハッシュで検索するだけで済む。
+    送られたリフレッシュトークンは使用済みになり、以降は新しいリフレッシュトークンを使う。
+
+    Args:
+        request (schemas.RefreshRequest): リフレッシュトークン。
+        db (Session): データベースセッション。
+
+    Returns:
+        dict: アクセストークン・リフレッシュトークン・トークンタイプ（bearer）を含む辞書。
+
+    Raises:
+        HTTPException: トークンが不明・期限切れ・使用済みの場合は401エラー
+            （使用済みのトークンが再び使われた場合は、その系列のトークンをすべて失効させる）。
+    """
+    principal, refresh_token = services.rotate_refresh_token(db, request.refresh_token)
+    return _access_token_response(principal.id, principal.email, refresh_token)
+
+# ログアウト
+@router.post("/logout", status_code=204)
+def logout(request: schemas.RefreshRequest, db: Session = Depends(get_db)):
+    """リフレッシュトークン（とローテーションで発行された同じ系列のトークン）を失効させる。"""
+    services.revoke_refresh_token(db, request.refresh_token)
 
 # 初期楽曲を返す
-@router.post("/photo", response_model=schemas.SwipeInitResponse)
-def swipe_init(file: UploadFile = File(...), db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
+@router.post(
+    "/photo",
+    response_model=schemas.SwipeInitResponse,
+    openapi_extra={"requestBody": {"required": True, "content": {"multipart/form-data": {"schema": {
+        "type": "object", "required": ["file"], "properties": {"file": {"type": "string", "format": "binary"}},
+    }}}}},
+)
+async def swipe_init(request: Request, db: Session = Depends(get_db), current_user: services.Principal = Depends(get_current_user)):
     """アップロードされた画像からムードを推定し、初期の楽曲リストを返すエンドポイント。
-    アップロードされた画像を読み込み、OpenAIのAPIを使ってムードを推定し、
+    アップロードされた画像（multipart/form-data の file）を読み込み、OpenAIのAPIを使ってムードを推定し、
     そのムードに基づいて楽曲を選定する。
+    画像は本文を読みながらチャンク単位で保存先に書き込み（全体をメモリに載せない）、
+    UPLOAD_MAX_BYTES を超えた時点で打ち切る。
+    画像は内容ハッシュで保存し（同じ画像は1つだけ）、履歴用のサムネイル・プレビューも作成する。
+    ブロッキングする処理（ファイル保存・画像変換・DBコミット）はスレッドに逃がし、
+    OpenAI APIの応答待ちの間はイベントループを解放する。
     Args:
-        file (UploadFile): アップロードされた画像ファイル。
+        request (Request): 画像ファイルを含むリクエスト。
         db (Session): データベースセッション。
-        current_user (User): 現在の認証ユーザー。
+        current_user (services.Principal): 現在の認証ユーザー。
     Returns:
         schemas.SwipeInitResponse: 初期の楽曲リストを含むレスポンス。
     Raises:
-        HTTPException: 画像のムード推定に失敗した場合や不正なムードが返された場合は400エラー。
+        HTTPException: 画像が上限サイズを超えた場合は413エラー。画像として読み込めない場合・ムード推定に失敗した場合・
+            不正なムードが返された場合は400エラー。
     """
-    # 画像を読み込む
-    image_bytes = file.file.read()
-    upload_dir = "uploads"
-    os.makedirs(upload_dir, exist_ok=True)
-    unique_filename = f"{uuid4().hex}_{file.filename}"
-    image_path = os.path.join(upload_dir, unique_filename)
-
-    try:
-        with open(image_path, "wb") as f:
-            f.write(image_bytes)
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"画像の保存に失敗しました: {str(e)}")
+    catalog = CATALOG_MANAGER.current
+    # 画像を受信しながら保存する
+    stored = await services.receive_upload(
+        request, UPLOAD_STORE, max_bytes=settings.UPLOAD_MAX_BYTES, executor=IMAGE_EXECUTOR
+    )
 
-    # DB保存処理（追加）
-    photo_entry = PhotoUpload(user_id=current_user.id, image_path=image_path)
+    # DB保存処理（同じ画像の再アップロードでも、行はアップロードごとに追加し、ファイルは共有する）
+    photo_entry = PhotoUpload(
+        user_id=current_user.id,
+        image_path=stored.original_path,
+        content_hash=stored.content_hash,
+        thumbnail_path=stored.thumbnail_path,
+        preview_path=stored.preview_path,
+    )
     db.add(photo_entry)
-    db.commit()
+    await run_in_threadpool(db.commit)
 
     # ムードを推定
     try:
-        main_mood = estimate_mood_from_image(image_bytes)
-        print(f"[DEBUG] GPTから返されたムード: '{main_mood}'")
+        main_mood = await estimate_mood_from_image(stored, db)
+        logger.debug("推定されたムード: %r", main_mood)
     except Exception as e:
         raise HTTPException(status_code=400, detail="画像のムード推定に失敗しました")
     # 辞書に存在しないなら補正候補を探す
-    if main_mood not in MOOD_SIMILARITY:
-        candidates = difflib.get_close_matches(main_mood, MOOD_SIMILARITY.keys(), n=1, cutoff=0.6)
+    if main_mood not in catalog.mood_similarity:
+        candidates = difflib.get_close_matches(main_mood, catalog.mood_similarity.keys(), n=1, cutoff=0.6)
         if not candidates:
             raise HTTPException(status_code=400, detail=f"'{main_mood}' は不正な雰囲気です")
         main_mood = candidates[0]
     # ムードに関連する楽曲を3つ選ぶ
-    mood_data = MOOD_SIMILARITY.get(main_mood,{})
-    moods = sorted(mood_data.items(), key=lambda x: x[1], reverse=True)[:3]
+    moods = catalog.mood_similarity.neighbors(main_mood, k=3)
     if not moods:
         raise HTTPException(status_code=400, detail="ムードに関連する楽曲が見つかりません")
     # 選ばれたムードに基づいて楽曲をランダムに選ぶ
     selected = []
-    # ムードごとに楽曲を選ぶ
+    # ムードごとに楽曲を選ぶ（転置リストはリストに変換せず、選択済み（高々2曲）と重なったら次の候補にする）
     for mood, _ in moods:
-        candidates = [
-            s for s in SONGS 
-            if mood in sum(s["tags"].values(), []) and s["id"] not in selected
-        ]
-        if candidates:
-            chosen = random.choice(candidates)
-            selected.append(chosen["id"])
-    
-    songs = [s for s in SONGS if s["id"] in selected]
-    print(f"選ばれた楽曲: {[s['title'] for s in songs]}")
+        postings = catalog.song_index.with_tag(mood)
+        for i in random.sample(range(len(postings)), k=min(len(selected) + 1, len(postings))):
+            pos = int(postings[i])
+            if pos not in selected:
+                selected.append(pos)
+                break
+
+    songs = catalog.song_index.songs_at(selected)
+    logger.debug("選ばれた楽曲: %s", [s["title"] for s in songs])
     return {"songs": songs}
 
 # スワイプ結果を記録・次の曲を返す
@@ -249,64 +462,27 @@ def swipe_init(file: UploadFile = File(...), db: Session = Depends(get_db), curr
 def swipe(
     swipe: schemas.SwipeRequest,
     db: Session = Depends(get_db),
-    current_user: User = Depends(get_current_user)
+    current_user: services.Principal = Depends(get_current_user)
 ):
     """スワイプ結果を記録し、次の曲を返すエンドポイント。"""
-    # スワイプ履歴を保存
-    db.add(SwipeHistory(user_id=current_user.id, song_id=swipe.song_id, liked=swipe.liked))
-    db.commit()
-
-    # スワイプ済みの曲ID
-    swiped_ids = [
-        s.song_id for s in db.query(SwipeHistory).filter_by(user_id=current_user.id).all()
-    ]
-    # スワイプ済みの曲を除外した楽曲リスト
-    SONGS_EXCLUDED = [s for s in SONGS if s["id"] not in swiped_ids]
-    # ユーザーがLikeした曲のIDを取得
-    if swipe.liked:
-        # Likeした曲を履歴に追加
-        db.add(SwipeHistory(user_id=current_user.id, song_id=swipe.song_id, liked=True))
-        db.commit()
-    else:
-        # Likeしなかった曲は履歴に追加しない
-
-        # ユーザーがLikeした曲のIDを取得
-        liked_ids = [
-            s.song_id for s in db.query(SwipeHistory).filter_by(user_id=current_user.id, liked=True).all()
-        ]
-        liked_songs = [s for s in SONGS if s["id"] in liked_ids]
-        # Likeした曲が3曲未満の場合はムード探索
-        if len(liked_songs) < 3:
-            liked_moods = {tag for song in liked_songs for tag in flatten_tags(song["tags"])}
-            exclude_moods = {
-                tag for song in SONGS_EXCLUDED if song["id"] in swiped_ids for tag in flatten_tags(song["tags"])
-            }
-            next_moods = sorted(
-                set(MOOD_SIMILARITY.keys()) - exclude_moods,
-                key=lambda x: -len(MOOD_SIMILARITY.get(x, []))
-            )
-            for mood in next_moods:
-                candidates = [s for s in SONGS_EXCLUDED if mood in flatten_tags(s["tags"])]
-                if candidates:
-                    return {"song": random.choice(candidates)}
-        # Likeした曲が5曲未満の場合は楽器探索
-        elif len(liked_songs) < 5:
-            liked_moods = [tag for song in liked_songs for tag in flatten_tags(song["tags"])]
-            counter = {}
-            for mood in liked_moods:
-                for inst, score in MOOD_INST_SIMILARITY.get(mood, {}).items():
-                    counter[inst] = counter.get(inst, 0) + score
-            sorted_instruments = sorted(counter.items(), key=lambda x: -x[1])
-            top_instruments = [inst for inst, _ in sorted_instruments[:2]]
-
-            for song in SONGS_EXCLUDED:
-                if any(inst in flatten_tags(song["tags"]) for inst in top_instruments):
-                    return {"song": song}
+    # スワイプ履歴をスワイプログに追加し（DBへはまとめて書き込む）、
+    # スワイプ状態（スワイプ済み・Like済みの曲IDと探索フェーズ）を差分更新して取得
+    session = _log_swipes(db, current_user.id, [(swipe.song_id, swipe.liked)])
+    catalog = CATALOG_MANAGER.current
+    # スワイプ済みの曲（カタログ内の位置）。これ以外が候補となる
+    swiped = catalog.song_index.positions_of(session.swiped)
+    if not swipe.liked:
+        # ユーザーがLikeした曲（カタログ内の位置）
+        liked = catalog.song_index.positions_of(session.liked)
+        # 探索フェーズ（Like 3曲未満：ムード探索、5曲未満：楽器探索）に応じて次の1曲を選ぶ
+        ranked = catalog.swipe_queue.rank(session, liked, swiped, n=1)
+        if ranked:
+            return {"song": catalog.song_index.song(ranked[0])}
     # スワイプ済みの曲がすべてLikeされている場合は、次の曲をランダムに選ぶ
-    if not SONGS_EXCLUDED:
+    next_song = catalog.song_index.sample_excluding(swiped, k=1)
+    if not next_song:
         raise HTTPException(status_code=404, detail="スワイプ候補なし")
-    next_song = random.choice(SONGS_EXCLUDED)
-    return {"song": next_song}
+    return {"song": catalog.song_index.song(next_song[0])}
     # # Likeした曲のIDと詳細を取得
     # liked_ids = [
     #     s.song_id for s in db.query(SwipeHistory).filter_by(user_id=current_user.id, liked=True).all()
@@ -347,57 +523,97 @@ def swipe(
     # # 該当曲なし
     # raise HTTPException(status_code=404, detail="スワイプ候補なし")
 
-# プレイリスト生成
-@router.get("/playlist", response_model=schemas.PlaylistResponse)
-def generate_playlist(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    liked_ids = [
-        s.song_id for s in db.query(SwipeHistory)
-        .filter_by(user_id=current_user.id, liked=True).all()
-    ]
-    liked_songs = [s for s in SONGS if s["id"] in liked_ids]
+def _swipe_queue_response(session, size: int, queue: List[int] = (), phase: str = None) -> dict:
+    """スワイプ状態から先読みキューの応答を作る。
 
-    # --- フォールバック①：Like数が足りない場合 ---
-    if len(liked_songs) < 3:
-        liked_songs = random.sample([s for s in SONGS if s["id"] not in liked_ids], k=3)
-
-    # --- タグカウント ---
-    mood_counter = {}
-    inst_counter = {}
-    for song in liked_songs:
-        tags = flatten_tags(song["tags"])
-        for tag in tags:
-            if tag in MOOD_SIMILARITY:
-                mood_counter[tag] = mood_counter.get(tag, 0) + 1
-            else:
-                inst_counter[tag] = inst_counter.get(tag, 0) + 1
+    クライアントのキューを作ったときと探索フェーズが変わっていなければ、その順を保ったまま
+    スワイプ済みの曲を除いて不足分だけ補充する。フェーズが変わった場合は作り直す。
+    """
+    catalog = CATALOG_MANAGER.current
+    swiped = catalog.song_index.positions_of(session.swiped)
+    liked = catalog.song_index.positions_of(session.liked)
+    keep = []
+    if phase == session.phase and queue:
+        positions = catalog.catalog.positions(queue)
+        keep = [int(p) for p in positions if p >= 0]
+    ranked = catalog.swipe_queue.rank(session, liked, swiped, n=size, keep=keep)
+    return {
+        "songs": [catalog.song_index.song(p) for p in ranked],
+        "phase": session.phase,
+        "liked_count": len(session.liked),
+    }
 
-    mood_tags = [m[0] for m in sorted(mood_counter.items(), key=lambda x: -x[1])[:3]]
-    inst_tags = [i[0] for i in sorted(inst_counter.items(), key=lambda x: -x[1])[:2]]
+# 先読みキューを取得する
+@router.get("/swipe/queue", response_model=schemas.SwipeQueueResponse)
+def get_swipe_queue(
+    size: int = Query(10, ge=1, le=services.MAX_QUEUE_SIZE),
+    db: Session = Depends(get_db),
+    current_user: services.Principal = Depends(get_current_user)
+):
+    """次にスワイプさせる曲を提示順に size 件返すエンドポイント。"""
+    session = SWIPE_SESSIONS.get(db, current_user.id)
+    return _swipe_queue_response(session, size)
+
+# スワイプ結果をまとめて記録し、先読みキューを返す
+@router.post("/swipe/batch", response_model=schemas.SwipeQueueResponse)
+def swipe_batch(
+    batch: schemas.SwipeBatchRequest,
+    db: Session = Depends(get_db),
+    current_user: services.Principal = Depends(get_current_user)
+):
+    """複数のスワイプ結果を1回のリクエストで記録し、次の先読みキューを返すエンドポイント。
 
-    # --- 推薦抽出 ---
-    candidates = [
-        s for s in SONGS
-        if s["id"] not in liked_ids
-        and len(set(mood_tags) & flatten_tags(s["tags"])) >= 2
-        and len(set(inst_tags) & flatten_tags(s["tags"])) >= 1
-    ]
+    カードごとに /swipe を呼ぶ代わりに、クライアントはキューの曲を順に提示し、
+    溜まったスワイプ結果と残りのキューを送って補充を受け取る。
 
-    # --- フォールバック②：推薦がゼロならランダム推薦 ---
-    if not candidates:
-        candidates = [s for s in SONGS if s["id"] not in liked_ids]
+    Args:
+        batch (schemas.SwipeBatchRequest): スワイプ結果・残りのキュー・そのフェーズ・キューの長さ。
+        db (Session): データベースセッション。
+        current_user (services.Principal): 現在の認証ユーザー。
+    Returns:
+        schemas.SwipeQueueResponse: 先読みキュー・探索フェーズ・Like数。
+    """
+    session = _log_swipes(db, current_user.id, [(s.song_id, s.liked) for s in batch.swipes])
+    return _swipe_queue_response(session, batch.size, batch.queue, batch.phase)
 
-    recommended = random.sample(candidates, k=min(10, len(candidates)))
+
+# プレイリスト生成
+@router.get("/playlist", response_model=schemas.PlaylistResponse)
+def generate_playlist(db: Session = Depends(get_db), current_user: services.Principal = Depends(get_current_user)):
+    catalog = CATALOG_MANAGER.current
+    # Likeした曲（スワイプ状態キャッシュから取得）
+    liked = catalog.song_index.positions_of(SWIPE_SESSIONS.get(db, current_user.id).liked)
+
+    # --- フォールバック①：Like数が足りない場合 ---
+    if len(liked) < 3:
+        liked = set(catalog.song_index.sample_excluding(liked, k=3))
+    liked_songs = catalog.song_index.songs_at(liked)
+
+    # --- 採点：Like曲のムード上位3つ・楽器上位2つとの一致数を全曲まとめて計算し、
+    #     ムード2つ以上・楽器1つ以上一致する曲を候補とする ---
+    started = perf_counter()
+    score = catalog.scorer.score([liked])[0]
+    services.metrics.PLAYLIST_SCORE_DURATION.observe(perf_counter() - started)
+
+    # --- 候補の中からLikeした曲の埋め込みの重心に近い順に選ぶ（埋め込みが無ければ一致数で重み付けした抽選） ---
+    # --- フォールバック②：推薦がゼロなら全曲から近い曲、それも無ければランダム推薦 ---
+    if len(score.candidates):
+        picked = catalog.nearest(liked, k=10, candidates=score.candidates) or score.picks
+    else:
+        picked = catalog.nearest(liked, k=10, exclude=liked) or catalog.song_index.sample_excluding(liked, k=10)
+    recommended = [catalog.song_index.song(p) for p in picked]
 
     # --- プレイリスト履歴保存 ---
-    latest_upload = db.query(PhotoUpload)\
-        .filter_by(user_id=current_user.id)\
-        .order_by(PhotoUpload.created_at.desc()).first()
+    latest_upload = repositories.latest_upload(db, current_user.id)
 
     if latest_upload:
         playlist = PlaylistHistory(
             user_id=current_user.id,
             image_path=latest_upload.image_path,
-            songs_json=json.dumps(liked_songs + recommended, ensure_ascii=False),
+            thumbnail_path=latest_upload.thumbnail_path,
+            preview_path=latest_upload.preview_path,
+            liked_song_ids=[song["id"] for song in liked_songs],
+            recommended_song_ids=[song["id"] for song in recommended],
         )
         db.add(playlist)
         db.commit()
@@ -409,15 +625,122 @@ def generate_playlist(db: Session = Depends(get_db), current_user: User = Depend
 
 
 
-@router.get("/history", response_model=List[schemas.PlaylistHistoryRead])
-def get_playlist_history(db: Session = Depends(get_db), current_user: User = Depends(get_current_user)):
-    """現在のユーザーのプレイリスト履歴を取得する
-    ユーザーが過去に生成したプレイリストの履歴を取得し、最新のものから順に返す。
+def _hydrate_playlists(rows, song_index: services.SongIndex) -> List[dict]:
+    """保存されたプレイリスト（楽曲IDの配列）をカタログの楽曲データで復元する。
+    全プレイリストの楽曲IDをまとめて1回で引き、同じ楽曲は1度だけ組み立てる。
+    """
+    rows = list(rows)
+    song_ids = {i for row in rows for i in (*row.liked_song_ids, *row.recommended_song_ids)}
+    songs = {song["id"]: song for song in song_index.songs_by_id(sorted(song_ids))}
+    return [
+        {
+            "id": row.id,
+            "image_path": row.image_path,
+            "thumbnail_path": row.thumbnail_path,
+            "preview_path": row.preview_path,
+            "liked": [songs[i] for i in row.liked_song_ids if i in songs],
+            "recommended": [songs[i] for i in row.recommended_song_ids if i in songs],
+            "created_at": row.created_at,
+        }
+        for row in rows
+    ]
+
+@router.get("/history", response_model=schemas.PlaylistHistoryPage)
+def get_playlist_history(
+    limit: int = Query(settings.HISTORY_PAGE_SIZE, ge=1, le=settings.HISTORY_PAGE_SIZE_MAX),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db),
+    current_user: services.Principal = Depends(get_current_user),
+):
+    """現在のユーザーのプレイリスト履歴を1ページ分取得する
+    ユーザーが過去に生成したプレイリストの履歴を、最新のものから順に limit 件まで返す。
+    続きは next_cursor を cursor に指定して取得する（(created_at, id) によるキーセット方式のため、
+    何ページ目でもインデックスを limit 件読むだけで済む）。
+    保存されている楽曲IDは、メモリ上のカタログから楽曲データに復元して返す。
     Args:
+        limit (int): 1ページの件数。
+        cursor (str, optional): 前のページの next_cursor（省略時は最新から）。
         db (Session): データベースセッション。
-        current_user (User): 現在の認証ユーザー。
+        current_user (services.Principal): 現在の認証ユーザー。
     Returns:
-        List[schemas.PlaylistHistoryRead]: ユーザーのプレイリスト履歴のリスト。
+        schemas.PlaylistHistoryPage: プレイリスト履歴と次のページのカーソル。
+    Raises:
+        HTTPException: カーソルが不正な場合。
+    """
+    before = None
+    if cursor:
+        try:
+            before = services.decode_history_cursor(cursor)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="カーソルが不正です")
+    # 1件多く読み、次のページがあるかを判定する
+    rows = repositories.list_playlists(db, current_user.id, limit=limit + 1, before=before)
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = services.encode_history_cursor(rows[-1].created_at, rows[-1].id)
+    return {"items": _hydrate_playlists(rows, CATALOG_MANAGER.current.song_index), "next_cursor": next_cursor}
+
+def _export_history(user_id: int, fmt: str):
+    """プレイリスト履歴を新しい順にページ単位で読みながら1件ずつ書き出すジェネレータ。
+    HISTORY_EXPORT_BATCH_SIZE 件ずつキーセット方式で読み、ページごとにセッションを閉じるため、
+    履歴の件数によらずメモリ使用量は一定で、クライアントが遅くてもDB接続を占有し続けない。
+    途中でカタログが切り替わっても、書き出し開始時のバージョンで最後まで復元する。
+    """
+    song_index = CATALOG_MANAGER.current.song_index
+    before = None
+    first = True
+    if fmt == "json":
+        yield "["
+    while True:
+        with SessionLocal() as db:
+            rows = repositories.list_playlists(db, user_id, limit=settings.HISTORY_EXPORT_BATCH_SIZE, before=before)
+        if not rows:
+            break
+        before = (rows[-1].created_at, rows[-1].id)
+        for item in _hydrate_playlists(rows, song_index):
+            line = schemas.PlaylistHistoryRead.model_validate(item).model_dump_json()
+            if fmt == "json":
+                yield line if first else "," + line
+            else:
+                yield line + "\n"
+            first = False
+        if len(rows) < settings.HISTORY_EXPORT_BATCH_SIZE:
+            break
+    if fmt == "json":
+        yield "]"
+
+@router.get("/history/export")
+def export_playlist_history(
+    format: str = Query("ndjson", pattern="^(ndjson|json)$"),
+    current_user: services.Principal = Depends(get_current_user),
+):
+    """現在のユーザーのプレイリスト履歴をすべてストリーミングで書き出す
+    ndjson では1行に1件（PlaylistHistoryRead）、json では全件の配列を返す。
+    サーバー側では全件をメモリに載せず、読んだページから順に送信する。
+    Args:
+        format (str): "ndjson" または "json"。
+        current_user (services.Principal): 現在の認証ユーザー。
+    Returns:
+        StreamingResponse: 新しい順のプレイリスト履歴。
+    """
+    media_type = "application/x-ndjson" if format == "ndjson" else "application/json"
+    return StreamingResponse(_export_history(current_user.id, format), media_type=media_type)
+
+@router.api_route("/uploads/{path:path}", methods=["GET", "HEAD"], include_in_schema=False)
+def get_upload(path: str, request: Request):
+    """アップロード画像（原画像・サムネイル・プレビュー）を返す
+    内容ハッシュで保存した画像は強いETagと immutable で長期キャッシュさせ、
+    If-None-Match（304）と Range（206）に対応する。
+    Args:
+        path (str): /uploads/ より後ろのパス。
+        request (Request): リクエスト（条件付き・範囲リクエストのヘッダーを見る）。
+    Returns:
+        Response: 画像ファイル。
+    Raises:
+        HTTPException: ファイルが存在しない場合は404エラー。
     """
-    history = db.query(PlaylistHistory).filter(PlaylistHistory.user_id == current_user.id).order_by(PlaylistHistory.created_at.desc()).all()
-    return history
\ No newline at end of file
+    file_path = UPLOAD_STORE.resolve(path)
+    if file_path is None:
+        raise HTTPException(status_code=404, detail="ファイルが見つかりません")
+    return services.upload_response(file_path, path, request.headers, request.method)
\ No newline at end of file
@@ -1,5 +1,5 @@
 from .user import UserBase, UserCreate, UserRead
-from .token import Token, TokenData
-from .song import Song
-from .playlist import PlaylistHistoryRead, PlaylistResponse
-from .swipe import SwipeInitResponse, SwipeRequest, SwipeResponse
\ No newline at end of file
+from .token import RefreshRequest, Token, TokenData
+from .song import CatalogVersion, Song
+from .playlist import PlaylistHistoryPage, PlaylistHistoryRead, PlaylistResponse
+from .swipe import SwipeInitResponse, SwipeRequest, SwipeResponse, SwipeBatchRequest, SwipeQueueResponse
\ No newline at end of file
@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from app.schemas.song import Song
 
@@ -8,12 +8,18 @@ class PlaylistResponse(BaseModel):
     liked: List[Song]
     recommended: List[Song]
 
-# 履歴用：保存されたプレイリストの表示
+# 履歴用：保存されたプレイリストの表示（保存されている楽曲IDをカタログから復元したもの）
 class PlaylistHistoryRead(BaseModel):
     id: int
     image_path: str
-    songs_json: str
+    # 縮小画像（一覧にはサムネイル、拡大表示にはプレビューを使う。古い履歴ではNone）
+    thumbnail_path: Optional[str] = None
+    preview_path: Optional[str] = None
+    liked: List[Song]
+    recommended: List[Song]
     created_at: datetime
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+# 履歴の1ページ分（next_cursor を次の /history の cursor に渡すと続きを取得できる。最後のページではNone）
+class PlaylistHistoryPage(BaseModel):
+    items: List[PlaylistHistoryRead]
+    next_cursor: Optional[str] = None
\ No newline at end of file
@@ -1,5 +1,6 @@
 from pydantic import BaseModel
 from typing import List
+from datetime import datetime
 
 # 楽曲データの構造
 class Song(BaseModel):
@@ -10,4 +11,10 @@ class Song(BaseModel):
     url: str
 
     class Config:
-        orm_mode = True
\ No newline at end of file
+        orm_mode = True
+
+# 楽曲カタログのバージョン（元データの内容ハッシュ）・楽曲数・このワーカーでの読み込み時刻
+class CatalogVersion(BaseModel):
+    version: str
+    songs: int
+    loaded_at: datetime
\ No newline at end of file
@@ -1,5 +1,5 @@
-from pydantic import BaseModel
-from typing import List
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from app.schemas.song import Song
 
 # 初期推薦（3曲）
@@ -13,4 +13,21 @@ class SwipeRequest(BaseModel):
 
 # スワイプ後の1曲推薦
 class SwipeResponse(BaseModel):
-    song: Song
\ No newline at end of file
+    song: Song
+
+# スワイプ結果のまとめ送信
+class SwipeBatchRequest(BaseModel):
+    # 前回の応答以降のスワイプ結果（スワイプした順）
+    swipes: List[SwipeRequest] = []
+    # クライアントに残っている先読みキューの楽曲ID（同じフェーズならこの順を保つ）
+    queue: List[int] = []
+    # 残っているキューを作ったときの探索フェーズ（前回の応答の phase）
+    phase: Optional[str] = None
+    # 返すキューの長さ
+    size: int = Field(default=10, ge=1, le=50)
+
+# 先読みキュー（次にスワイプさせる曲を提示順に並べたもの）
+class SwipeQueueResponse(BaseModel):
+    songs: List[Song]
+    phase: str
+    liked_count: int
\ No newline at end of file
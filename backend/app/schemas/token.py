@@ -1,8 +1,13 @@
+from typing import Optional
 from pydantic import BaseModel, EmailStr
 
 class Token(BaseModel):
     access_token: str
     token_type: str
+    refresh_token: Optional[str] = None
+
+class RefreshRequest(BaseModel):
+    refresh_token: str
 
 class TokenData(BaseModel):
     email: EmailStr
\ No newline at end of file
@@ -1,2 +1,23 @@
-from .password_hash import get_password_hash, verify_password, authenticate_user
-from .jwt_authenticate import create_access_token, decode_access_token
\ No newline at end of file
+from .password_hash import PASSWORD_HASHER, PasswordHasher, get_password_hash, verify_password, authenticate_user
+from .jwt_authenticate import PRINCIPAL_CACHE, create_access_token, decode_access_token
+from .principal_cache import Principal, PrincipalCache
+from .history_cursor import decode_history_cursor, encode_history_cursor
+from .refresh_token import issue_refresh_token, revoke_refresh_token, revoke_user_refresh_tokens, rotate_refresh_token
+from .song_index import SongIndex, flatten_tags
+from .similarity import SimilarityTable
+from .catalog_store import CompiledCatalog, compile_catalog, compile_catalog_from_json, load_catalog, resolve_catalog
+from .catalog_manager import CatalogManager, CatalogSnapshot
+from .swipe_session import (
+    PHASE_INSTRUMENT, PHASE_MOOD, PHASE_RANDOM, SwipeSession, SwipeSessionStore, create_swipe_session_store,
+)
+from .mood_cache import MoodInferenceCache, image_fingerprint, perceptual_hash
+from .image_preprocess import prepare_vision_image
+from .upload_store import StoredImage, UploadStore, UploadTooLarge, migrate_legacy_uploads, upload_response
+from .upload_ingest import receive_upload
+from .embedding_index import EmbeddingIndex, build_ivf
+from .playlist_scoring import PlaylistScore, PlaylistScorer
+from .swipe_queue import MAX_QUEUE_SIZE, SwipeQueue
+from .swipe_log import SwipeLogFull, SwipeLogWriter
+from . import metrics
+from .metrics import REGISTRY, MetricsMiddleware, instrument_pool
+from .query_stats import QueryBudgetExceeded, QueryStats, QueryStatsMiddleware, instrument_engine
\ No newline at end of file
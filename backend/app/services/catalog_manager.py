@@ -0,0 +1,179 @@
+# 楽曲カタログのスナップショットを保持し、元データの更新時に再起動なしで切り替えるファイル
+# カタログとその上に構築するインデックス（SongIndex・採点器・埋め込み・スワイプ候補の順位付け）を
+# 1つの不変なスナップショットにまとめ、新しいバージョンはバックグラウンドのスレッドで構築し終えてから
+# 参照を差し替える。リクエストは開始時に取得したスナップショットを最後まで使うため、
+# 処理中に切り替わっても古いバージョンのまま一貫して処理され、読み込みの時間を待つこともない。
+import logging
+import threading
+import time
+from typing import Callable, Iterable, List, Optional, Sequence
+
+from .catalog_store import CompiledCatalog, resolve_catalog, source_stat
+from .playlist_scoring import PlaylistScorer
+from .song_index import SongIndex
+from .swipe_queue import SwipeQueue
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogSnapshot:
+    """1つのバージョンのカタログとインデックス一式（構築後は変更しない）"""
+
+    __slots__ = (
+        "catalog", "version", "loaded_at", "mood_similarity", "mood_instrument_similarity",
+        "song_index", "scorer", "embeddings", "embedding_exact", "swipe_queue",
+    )
+
+    def __init__(self, catalog: CompiledCatalog, embedding_nprobe: int = 8, embedding_exact: bool = False,
+                 embedding_explore: bool = False):
+        """
+        Args:
+            catalog (CompiledCatalog): メモリマップで開いたカタログ。
+            embedding_nprobe (int): 埋め込みの近傍探索で探索するリスト数。
+            embedding_exact (bool): 埋め込みの近傍探索を全件走査で行うか。
+            embedding_explore (bool): スワイプ候補の順位付けに埋め込みを使うか。
+        """
+        self.catalog = catalog
+        self.version = catalog.version
+        self.loaded_at = time.time()
+        self.mood_similarity = catalog.mood_similarity
+        self.mood_instrument_similarity = catalog.mood_instrument_similarity
+        # 楽曲カタログのインデックス（タグ→楽曲の転置リスト・ID→楽曲・楽曲ごとのタグ集合）
+        self.song_index = SongIndex(catalog)
+        # プレイリスト候補の採点器（楽曲×タグの疎行列）
+        self.scorer = PlaylistScorer(catalog)
+        # 楽曲の埋め込みによる近傍探索エンジン（カタログが埋め込みを持たない場合はNone）
+        self.embeddings = catalog.embedding_index(nprobe=embedding_nprobe)
+        self.embedding_exact = embedding_exact
+        # スワイプ候補の順位付け（/swipe の次の1曲と、先読みキューで共有する）
+        self.swipe_queue = SwipeQueue(
+            self.song_index, self.mood_similarity, self.mood_instrument_similarity,
+            nearest=self.nearest if embedding_explore else None,
+        )
+
+    def nearest(self, liked: Iterable[int], k: int, candidates: Optional[Sequence[int]] = None,
+                exclude: Iterable[int] = ()) -> List[int]:
+        """Likeした曲の埋め込みの重心に近い曲の位置を返す（埋め込みが使えない場合は空）"""
+        if self.embeddings is None:
+            return []
+        return self.embeddings.recommend(liked, k, candidates=candidates, exclude=exclude, exact=self.embedding_exact)
+
+    def warm(self):
+        """初回参照時に作られる構造（採点用の疎行列）を作っておき、切り替え後のリクエストで作らないようにする"""
+        self.scorer.song_tags
+        self.scorer.tag_songs
+
+    def status(self) -> dict:
+        return {"version": self.version, "songs": len(self.catalog), "loaded_at": self.loaded_at}
+
+    def sizes(self) -> dict:
+        """カタログとインデックスの大きさ（件数と、メモリマップしている配列のバイト数）"""
+        catalog = self.catalog
+        return {
+            "songs": len(catalog),
+            "tags": len(catalog.tags),
+            "tag_postings": len(catalog.tag_postings),
+            "song_tags": len(catalog.song_tag_indices),
+            "embeddings": len(self.embeddings) if self.embeddings is not None else 0,
+            "embedding_lists": len(self.embeddings.centroids) if self.embeddings is not None else 0,
+            "mapped_bytes": catalog.nbytes,
+        }
+
+
+class CatalogManager:
+    """現在のカタログのスナップショットを保持し、新しいバージョンに切り替える。
+
+    バージョンの確認（resolve_catalog）は元データの更新時刻・サイズと CURRENT を見るだけなので軽く、
+    変わっていた場合のみコンパイル（元データが更新された場合）とスナップショットの構築を行う。
+    他のワーカーや `python -m app.services.catalog_store` が CURRENT を切り替えた場合も同様に検知する。
+    最初のスナップショットは start()（アプリの起動時）か、最初に current を参照したときに読み込む。
+    元データの更新は、更新時刻・サイズが poll_interval の間変わらなくなってから取り込む。
+    構築に失敗した場合は現在のスナップショットを使い続ける。
+    """
+
+    def __init__(self, data_dir: str, build: Callable[[CompiledCatalog], CatalogSnapshot] = CatalogSnapshot,
+                 poll_interval: float = 10.0):
+        """
+        Args:
+            data_dir (str): データディレクトリのパス。
+            build (Callable): 開いたカタログからスナップショットを作る関数。
+            poll_interval (float): バージョンを確認する間隔（秒）。0以下なら定期確認しない。
+        """
+        self.data_dir = data_dir
+        self.build = build
+        self.poll_interval = poll_interval
+        self._reload_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._snapshot: Optional[CatalogSnapshot] = None
+
+    @property
+    def current(self) -> CatalogSnapshot:
+        """現在のスナップショット（リクエストの開始時に1回だけ取得し、処理中はそれを使う）"""
+        snapshot = self._snapshot
+        return snapshot if snapshot is not None else self.load()
+
+    def load(self) -> CatalogSnapshot:
+        """最初のスナップショットを読み込む（読み込み済みならそれを返す）"""
+        with self._reload_lock:
+            if self._snapshot is None:
+                self._snapshot = self._load(resolve_catalog(self.data_dir))
+            return self._snapshot
+
+    def _load(self, path: str) -> CatalogSnapshot:
+        started = time.perf_counter()
+        snapshot = self.build(CompiledCatalog(path))
+        snapshot.warm()
+        logger.info("カタログ %s を読み込みました（%d曲、%.0fms）",
+                    snapshot.version, len(snapshot.catalog), (time.perf_counter() - started) * 1000)
+        return snapshot
+
+    def reload(self) -> bool:
+        """バージョンを確認し、変わっていれば新しいスナップショットを構築して切り替える。
+
+        構築は呼び出したスレッドで行い、切り替えは参照の差し替え1回で行う。
+        同時に呼ばれた場合は先の呼び出しの完了を待ってから確認する。
+
+        Returns:
+            bool: 切り替えた場合はTrue。
+        Raises:
+            OSError, ValueError: 元データの読み込み・コンパイルに失敗した場合（現在のスナップショットは変わらない）。
+        """
+        with self._reload_lock:
+            path = resolve_catalog(self.data_dir)
+            previous = self._snapshot
+            if previous is not None and path == previous.catalog.path:
+                return False
+            self._snapshot = self._load(path)
+            if previous is not None:
+                logger.info("カタログを %s から %s に切り替えました", previous.version, self._snapshot.version)
+            return True
+
+    def start(self):
+        """最初のスナップショットを読み込み、バージョンを定期的に確認するスレッドを開始する"""
+        self.load()
+        if self.poll_interval <= 0 or self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="catalog-reload", daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        seen = source_stat(self.data_dir)
+        while not self._stop.wait(self.poll_interval):
+            # 書き込み途中の元データを読まないよう、更新時刻・サイズが1周期変わらなくなってから確認する
+            stat = source_stat(self.data_dir)
+            if stat != seen:
+                seen = stat
+                continue
+            try:
+                self.reload()
+            except Exception:
+                logger.exception("カタログの再読み込みに失敗しました（現在のバージョンを使い続けます）")
+
+    def close(self):
+        """定期確認のスレッドを止める"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
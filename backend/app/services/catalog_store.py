@@ -0,0 +1,482 @@
+# 楽曲カタログをメモリマップ可能なバイナリ形式にコンパイル・読み込みするファイル
+# JSONを各ワーカーで辞書に展開する代わりに、NumPy配列（.npy）を np.memmap で開くことで
+# 同一ホスト上の全ワーカーがページキャッシュ上の1つのコピーを共有する
+# コンパイル結果は元データ（JSON）の内容ハッシュをバージョンとして data/catalog/<バージョン>/ に置き、
+# data/catalog/CURRENT が指すバージョンを各ワーカーが読み込む（切り替えは CURRENT の置き換えのみ）
+import hashlib
+import json
+import os
+import re
+import shutil
+import sys
+import tempfile
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .embedding_index import EmbeddingIndex, build_ivf, normalize_rows
+from .similarity import SimilarityTable, top_neighbors
+from .song_index import flatten_tags
+
+# コンパイル済みカタログの配置ディレクトリ名（データディレクトリ直下）
+CATALOG_DIRNAME = "catalog"
+# フォーマットのバージョン（互換性のない変更時に上げる）
+FORMAT_VERSION = 3
+# 現在のバージョンを指すファイル名（カタログディレクトリ直下）
+CURRENT_FILENAME = "CURRENT"
+# 切り替え後も残しておくバージョン数（現在のものを含む。古いバージョンを開いているワーカーのため）
+KEEP_VERSIONS = 2
+# 事前計算するムードごとの近傍数（タグ数が増えてもリクエスト時の計算量は一定）
+NEIGHBORS_K = 64
+
+SONGS_FILENAME = "filtered_songs_4_or_more_tags.json"
+MOOD_SIMILARITY_FILENAME = "mood_similarity.json"
+MOOD_INST_SIMILARITY_FILENAME = "mood_instrument_similarity.json"
+SOURCE_FILENAMES = (SONGS_FILENAME, MOOD_SIMILARITY_FILENAME, MOOD_INST_SIMILARITY_FILENAME)
+# バージョンのディレクトリ名（内容ハッシュの先頭16桁）
+VERSION_PATTERN = re.compile(r"^[0-9a-f]{16}$")
+
+# 文字列テーブルに格納する楽曲ごとのフィールド（tagsはJSON文字列として格納）
+STRING_FIELDS = ("title", "artist", "tags", "url")
+
+# 配列ファイル名の一覧
+ARRAY_NAMES = (
+    "ids",                  # int64[n]           楽曲ID
+    "id_order",             # int64[n]           楽曲IDの昇順に並べた楽曲位置
+    "tag_bitmap",           # uint8[n, ceil(T/8)] 楽曲×タグの所属ビットマップ（packbits）
+    "song_tag_offsets",     # int64[n+1]         楽曲ごとのタグ番号（CSR）
+    "song_tag_indices",     # int32[nnz]
+    "tag_offsets",          # int64[T+1]         タグごとの楽曲位置の転置リスト（CSR）
+    "tag_postings",         # int32[nnz]
+    "mood_similarity",      # float32[M, M]      ムード間の類似度（欠損はNaN）
+    "mood_neighbors",       # int32[M, K]        ムードごとの類似度上位K件の列番号（降順）
+    "mood_inst_similarity", # float32[M', I]     ムードと楽器の相性（欠損はNaN）
+    "string_offsets",       # int64[n*F+1]       文字列テーブルのオフセット
+    "string_blob",          # uint8[...]         UTF-8文字列を連結したもの
+)
+
+# 楽曲が埋め込みベクトル（embedding）を持つ場合のみ書き出す配列
+EMBEDDING_ARRAY_NAMES = (
+    "embeddings",           # float32[n, D]      L2正規化した埋め込み（IVFのリスト順、欠損はゼロベクトル）
+    "ivf_centroids",        # float32[L, D]      IVFの重心
+    "ivf_offsets",          # int64[L+1]         リストごとの行の区間
+    "ivf_members",          # int32[n]           行ごとの楽曲位置
+)
+
+
+def _csr(groups: List[List[int]], dtype=np.int32) -> Tuple[np.ndarray, np.ndarray]:
+    """可変長の整数リストをオフセット配列と値配列（CSR形式）に変換する"""
+    offsets = np.zeros(len(groups) + 1, dtype=np.int64)
+    np.cumsum([len(g) for g in groups], out=offsets[1:])
+    values = np.fromiter((v for g in groups for v in g), dtype=dtype, count=int(offsets[-1]))
+    return offsets, values
+
+
+def _similarity_matrix(table: dict, rows: List[str], cols: List[str]) -> np.ndarray:
+    """辞書の辞書形式の類似度を float32 の密行列に変換する（欠損はNaN）"""
+    col_index = {c: j for j, c in enumerate(cols)}
+    matrix = np.full((len(rows), len(cols)), np.nan, dtype=np.float32)
+    for i, row in enumerate(rows):
+        for col, score in table[row].items():
+            matrix[i, col_index[col]] = score
+    return matrix
+
+
+def _embedding_arrays(songs: List[dict]) -> Dict[str, np.ndarray]:
+    """楽曲の埋め込みを正規化した行列とIVFインデックスを作る（埋め込みが無ければ空）"""
+    dim = max((len(song.get("embedding") or ()) for song in songs), default=0)
+    if not dim:
+        return {}
+    embeddings = np.zeros((len(songs), dim), dtype=np.float32)
+    for pos, song in enumerate(songs):
+        if song.get("embedding"):
+            embeddings[pos] = song["embedding"]
+    embeddings = normalize_rows(embeddings)
+    centroids, offsets, members = build_ivf(embeddings)
+    return {"embeddings": embeddings[members], "ivf_centroids": centroids, "ivf_offsets": offsets, "ivf_members": members}
+
+
+def compile_catalog(songs: List[dict], mood_similarity: dict, mood_inst_similarity: dict, out_dir: str,
+                    source_version: Optional[str] = None) -> str:
+    """楽曲カタログと類似度データをバイナリ形式にコンパイルする。
+
+    一時ディレクトリに書き出してから rename するため、読み込み中のワーカーが
+    書きかけのファイルを開くことはない。出力先が既にコンパイル済みなら置き換えずにそのまま使う
+    （公開したバージョンのディレクトリは変更しない。読み込み中のワーカーがメモリマップしているため）。
+
+    Args:
+        songs (List[dict]): 楽曲データのリスト。
+        mood_similarity (dict): ムード間の類似度（辞書の辞書）。
+        mood_inst_similarity (dict): ムードと楽器の相性（辞書の辞書）。
+        out_dir (str): 出力先ディレクトリ。
+        source_version (str, optional): 元データのバージョン（meta.json に記録する）。
+    Returns:
+        str: 出力先ディレクトリのパス。
+    """
+    # タグ語彙（ムードを先頭に、その他のタグは出現順）
+    tags: List[str] = list(mood_similarity.keys())
+    tag_index: Dict[str, int] = {t: i for i, t in enumerate(tags)}
+    song_tags: List[List[int]] = []
+    for song in songs:
+        for tag in flatten_tags(song["tags"]):
+            if tag not in tag_index:
+                tag_index[tag] = len(tags)
+                tags.append(tag)
+        song_tags.append(sorted(tag_index[t] for t in flatten_tags(song["tags"])))
+
+    n, n_tags = len(songs), len(tags)
+    ids = np.array([s["id"] for s in songs], dtype=np.int64)
+    song_tag_offsets, song_tag_indices = _csr(song_tags)
+
+    # 楽曲×タグのビットマップ
+    rows = np.repeat(np.arange(n, dtype=np.int64), np.diff(song_tag_offsets))
+    dense = np.zeros((n, n_tags), dtype=bool)
+    dense[rows, song_tag_indices] = True
+    tag_bitmap = np.packbits(dense, axis=1)
+    del dense
+
+    # 転置リスト（タグ番号 → 楽曲位置の昇順）
+    order = np.lexsort((rows, song_tag_indices))
+    tag_postings = rows[order].astype(np.int32)
+    tag_offsets = np.zeros(n_tags + 1, dtype=np.int64)
+    np.cumsum(np.bincount(song_tag_indices, minlength=n_tags), out=tag_offsets[1:])
+
+    moods = list(mood_similarity.keys())
+    inst_moods = list(mood_inst_similarity.keys())
+    instruments: List[str] = []
+    for row in mood_inst_similarity.values():
+        for inst in row:
+            if inst not in instruments:
+                instruments.append(inst)
+
+    mood_matrix = _similarity_matrix(mood_similarity, moods, moods)
+
+    strings = [
+        (json.dumps(song["tags"], ensure_ascii=False) if field == "tags" else str(song[field])).encode("utf-8")
+        for song in songs
+        for field in STRING_FIELDS
+    ]
+    string_offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=string_offsets[1:])
+    string_blob = np.frombuffer(b"".join(strings), dtype=np.uint8)
+
+    arrays = {
+        "ids": ids,
+        "id_order": np.argsort(ids, kind="stable"),
+        "tag_bitmap": tag_bitmap,
+        "song_tag_offsets": song_tag_offsets,
+        "song_tag_indices": song_tag_indices,
+        "tag_offsets": tag_offsets,
+        "tag_postings": tag_postings,
+        "mood_similarity": mood_matrix,
+        "mood_neighbors": top_neighbors(mood_matrix, NEIGHBORS_K),
+        "mood_inst_similarity": _similarity_matrix(mood_inst_similarity, inst_moods, instruments),
+        "string_offsets": string_offsets,
+        "string_blob": string_blob,
+        **_embedding_arrays(songs),
+    }
+    meta = {
+        "version": FORMAT_VERSION,
+        "source_version": source_version,
+        "count": n,
+        "tags": tags,
+        "moods": moods,
+        "inst_moods": inst_moods,
+        "instruments": instruments,
+        "string_fields": list(STRING_FIELDS),
+        "embedding_dim": int(arrays["embeddings"].shape[1]) if "embeddings" in arrays else 0,
+    }
+
+    parent = os.path.dirname(os.path.abspath(out_dir))
+    os.makedirs(parent, exist_ok=True)
+    tmp_dir = tempfile.mkdtemp(prefix=".catalog-", dir=parent)
+    try:
+        for name, array in arrays.items():
+            np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+        with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False)
+        if _is_compiled(out_dir):
+            shutil.rmtree(tmp_dir)
+            return out_dir
+        os.rename(tmp_dir, out_dir)
+    except OSError:
+        # 他のワーカーが先にコンパイルを完了した場合はそちらを使う
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not _is_compiled(out_dir):
+            raise
+    return out_dir
+
+
+def source_stat(data_dir: str) -> Optional[List[List[int]]]:
+    """元データの各ファイルの更新時刻とサイズを返す（変更の検知用。ファイルが欠けていればNone）"""
+    try:
+        stats = [os.stat(os.path.join(data_dir, name)) for name in SOURCE_FILENAMES]
+    except FileNotFoundError:
+        return None
+    return [[st.st_mtime_ns, st.st_size] for st in stats]
+
+
+def source_version(data_dir: str) -> str:
+    """元データの内容（とカタログ形式のバージョン）のハッシュから、カタログのバージョンを求める"""
+    digest = hashlib.sha256(f"format={FORMAT_VERSION}".encode())
+    for name in SOURCE_FILENAMES:
+        path = os.path.join(data_dir, name)
+        digest.update(f"\0{name}\0{os.path.getsize(path)}\0".encode())
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def compile_catalog_from_json(data_dir: str, out_dir: Optional[str] = None) -> str:
+    """データディレクトリのJSONファイルからカタログをコンパイルする。
+
+    out_dir を省略した場合は data/catalog/<バージョン>/ に出力し（同じ内容のものがあればコンパイルしない）、
+    CURRENT をそのバージョンに切り替えて古いバージョンを削除する。
+
+    Args:
+        data_dir (str): データディレクトリのパス。
+        out_dir (str, optional): 出力先ディレクトリ（指定時は CURRENT を切り替えない）。
+    Returns:
+        str: コンパイル済みカタログのパス。
+    """
+    def _load(filename):
+        with open(os.path.join(data_dir, filename), encoding="utf-8") as f:
+            return json.load(f)
+
+    # 読み込み中に元データが更新された場合は、次の確認で古い更新時刻として検知される
+    stat = source_stat(data_dir)
+    version = source_version(data_dir)
+    publish = out_dir is None
+    out_dir = out_dir or os.path.join(data_dir, CATALOG_DIRNAME, version)
+    if not _is_compiled(out_dir):
+        compile_catalog(
+            _load(SONGS_FILENAME),
+            _load(MOOD_SIMILARITY_FILENAME),
+            _load(MOOD_INST_SIMILARITY_FILENAME),
+            out_dir,
+            source_version=version,
+        )
+    if publish:
+        _publish(data_dir, version, stat)
+        prune_catalogs(data_dir)
+    return out_dir
+
+
+def _publish(data_dir: str, version: str, stat: Optional[List[List[int]]]):
+    """CURRENT を指定バージョンに置き換える（一時ファイルからの rename のため、読み手は新旧どちらかを読む）"""
+    catalog_dir = os.path.join(data_dir, CATALOG_DIRNAME)
+    fd, tmp_path = tempfile.mkstemp(prefix=".current-", dir=catalog_dir)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump({"version": version, "source_stat": stat}, f)
+        os.replace(tmp_path, os.path.join(catalog_dir, CURRENT_FILENAME))
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+
+def _read_current(data_dir: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(data_dir, CATALOG_DIRNAME, CURRENT_FILENAME), encoding="utf-8") as f:
+            current = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return current if VERSION_PATTERN.match(str(current.get("version"))) else None
+
+
+def prune_catalogs(data_dir: str, keep: int = KEEP_VERSIONS):
+    """CURRENT と新しい順に keep 個までのバージョンを残し、古いバージョンを削除する。
+
+    削除されたバージョンをメモリマップで開いているワーカーは、閉じるまでそのまま読める。
+    以前のバージョン管理なしの形式（catalog 直下の .npy と meta.json）も削除する。
+    """
+    catalog_dir = os.path.join(data_dir, CATALOG_DIRNAME)
+    current = (_read_current(data_dir) or {}).get("version")
+    versions = []
+    for entry in os.scandir(catalog_dir):
+        if entry.is_dir() and VERSION_PATTERN.match(entry.name) and entry.name != current:
+            versions.append((entry.stat().st_mtime, entry.path))
+        elif entry.is_file() and (entry.name == "meta.json" or entry.name.endswith(".npy")):
+            os.unlink(entry.path)
+    versions.sort(reverse=True)
+    for _, path in versions[max(keep - 1, 0):]:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def resolve_catalog(data_dir: str) -> str:
+    """元データに対応するコンパイル済みカタログのパスを返す。
+
+    CURRENT が記録している元データの更新時刻・サイズが現在と同じならそのまま返し
+    （ハッシュは計算しない）、異なる・未コンパイルの場合はコンパイルして CURRENT を切り替える。
+    元データが無い場合（コンパイル済みカタログのみを配布した場合）は CURRENT をそのまま使う。
+
+    Args:
+        data_dir (str): データディレクトリのパス。
+    Returns:
+        str: コンパイル済みカタログのパス。
+    Raises:
+        FileNotFoundError: 元データもコンパイル済みカタログも無い場合。
+    """
+    current = _read_current(data_dir)
+    stat = source_stat(data_dir)
+    if current is not None:
+        path = os.path.join(data_dir, CATALOG_DIRNAME, current["version"])
+        if _is_compiled(path) and (stat is None or current.get("source_stat") == stat):
+            return path
+    if stat is None:
+        raise FileNotFoundError(f"カタログの元データがありません: {data_dir}")
+    return compile_catalog_from_json(data_dir)
+
+
+class CompiledCatalog:
+    """コンパイル済みカタログを np.memmap で開いたもの。
+
+    配列はすべて読み取り専用のメモリマップで、実データはOSのページキャッシュ上に
+    1つだけ存在する。楽曲データ（dict）は参照時に文字列テーブルから組み立てる。
+    """
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get("version") != FORMAT_VERSION:
+            raise ValueError(f"未対応のカタログ形式です: {meta.get('version')}")
+        self.path = path
+        self.meta = meta
+        # 元データの内容ハッシュ（記録が無い場合はディレクトリ名）
+        self.version: str = meta.get("source_version") or os.path.basename(os.path.normpath(path))
+        self.tags: List[str] = meta["tags"]
+        self.tag_index: Dict[str, int] = {t: i for i, t in enumerate(self.tags)}
+        self.string_fields: List[str] = meta["string_fields"]
+        names = ARRAY_NAMES + (EMBEDDING_ARRAY_NAMES if meta["embedding_dim"] else ())
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in names}
+        self._arrays = arrays
+        self.ids = arrays["ids"]
+        self.id_order = arrays["id_order"]
+        self.tag_bitmap = arrays["tag_bitmap"]
+        self.song_tag_offsets = arrays["song_tag_offsets"]
+        self.song_tag_indices = arrays["song_tag_indices"]
+        self.tag_offsets = arrays["tag_offsets"]
+        self.tag_postings = arrays["tag_postings"]
+        self.string_offsets = arrays["string_offsets"]
+        self.string_blob = arrays["string_blob"]
+        self._sorted_ids = self.ids[self.id_order]
+        self.mood_similarity = SimilarityTable(
+            arrays["mood_similarity"], meta["moods"], meta["moods"], neighbors=arrays["mood_neighbors"]
+        )
+        self.mood_instrument_similarity = SimilarityTable(
+            arrays["mood_inst_similarity"], meta["inst_moods"], meta["instruments"]
+        )
+
+    def __len__(self) -> int:
+        return int(self.meta["count"])
+
+    @property
+    def nbytes(self) -> int:
+        """メモリマップしている配列の合計バイト数"""
+        return sum(int(a.nbytes) for a in self._arrays.values())
+
+    def embedding_index(self, nprobe: int = 8) -> Optional[EmbeddingIndex]:
+        """埋め込みの近傍探索エンジンを返す（楽曲が埋め込みを持たない場合はNone）"""
+        if not self.meta["embedding_dim"]:
+            return None
+        return EmbeddingIndex(
+            self._arrays["embeddings"],
+            self._arrays["ivf_centroids"],
+            self._arrays["ivf_offsets"],
+            self._arrays["ivf_members"],
+            nprobe=nprobe,
+        )
+
+    def string(self, pos: int, field: str) -> str:
+        """文字列テーブルから楽曲のフィールド値を取り出す"""
+        i = pos * len(self.string_fields) + self.string_fields.index(field)
+        start, end = self.string_offsets[i], self.string_offsets[i + 1]
+        return self.string_blob[start:end].tobytes().decode("utf-8")
+
+    def song(self, pos: int) -> dict:
+        """楽曲位置から楽曲データ（dict）を組み立てる"""
+        width = len(self.string_fields)
+        offsets = self.string_offsets[pos * width:(pos + 1) * width + 1].tolist()
+        blob = self.string_blob[offsets[0]:offsets[-1]].tobytes()
+        base = offsets[0]
+        values = {
+            field: blob[offsets[k] - base:offsets[k + 1] - base].decode("utf-8")
+            for k, field in enumerate(self.string_fields)
+        }
+        values["tags"] = json.loads(values["tags"])
+        return {"id": int(self.ids[pos]), **values}
+
+    def songs(self, positions: Sequence[int]) -> List[dict]:
+        """複数の楽曲位置の楽曲データをまとめて組み立てる。
+
+        オフセットは1回の配列演算で取り出し、文字列はメモリマップ上のバッファから直接デコードする
+        （楽曲ごとに np.memmap のスライスを作らない）。
+        """
+        width = len(self.string_fields)
+        positions = np.asarray(positions, dtype=np.int64)
+        if not positions.size:
+            return []
+        starts = positions[:, None] * width + np.arange(width + 1)
+        offsets = np.asarray(self.string_offsets)[starts].tolist()
+        blob = memoryview(np.asarray(self.string_blob))
+        ids = np.asarray(self.ids)[positions].tolist()
+        songs = []
+        for song_id, row in zip(ids, offsets):
+            values = {
+                field: str(blob[row[k]:row[k + 1]], "utf-8")
+                for k, field in enumerate(self.string_fields)
+            }
+            values["tags"] = json.loads(values["tags"])
+            songs.append({"id": song_id, **values})
+        return songs
+
+    def positions(self, song_ids: Sequence[int]) -> np.ndarray:
+        """楽曲IDの配列を楽曲位置の配列に変換する（未知のIDは -1）"""
+        song_ids = np.asarray(song_ids, dtype=np.int64)
+        if not len(self) or not song_ids.size:
+            return np.full(song_ids.shape, -1, dtype=np.int64)
+        k = np.searchsorted(self._sorted_ids, song_ids)
+        k = np.minimum(k, len(self) - 1)
+        found = self._sorted_ids[k] == song_ids
+        return np.where(found, self.id_order[k], -1)
+
+    def song_tags(self, pos: int) -> np.ndarray:
+        """楽曲が持つタグ番号の配列を返す"""
+        return self.song_tag_indices[self.song_tag_offsets[pos]:self.song_tag_offsets[pos + 1]]
+
+    def postings(self, tag: int) -> np.ndarray:
+        """タグ番号に対応する楽曲位置の配列（昇順）を返す"""
+        return self.tag_postings[self.tag_offsets[tag]:self.tag_offsets[tag + 1]]
+
+
+def load_catalog(data_dir: str) -> CompiledCatalog:
+    """コンパイル済みカタログ（CURRENT が指すバージョン）を開く。
+
+    未コンパイル・元データが更新されている場合はJSONファイルからその場でコンパイルする
+    （本番ではエントリポイントで事前にコンパイルしておく）。
+
+    Args:
+        data_dir (str): データディレクトリのパス。
+    Returns:
+        CompiledCatalog: メモリマップで開いたカタログ。
+    """
+    return CompiledCatalog(resolve_catalog(data_dir))
+
+
+def _is_compiled(path: str) -> bool:
+    """現在のフォーマットでコンパイル済みのカタログが存在するか"""
+    try:
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("version") == FORMAT_VERSION
+    except (OSError, ValueError):
+        return False
+
+
+if __name__ == "__main__":
+    # 使い方: python -m app.services.catalog_store [データディレクトリ]
+    # 起動中のワーカーは CURRENT の切り替えを検知して新しいバージョンを読み込む
+    data_dir = sys.argv[1] if len(sys.argv) > 1 else "data"
+    out = resolve_catalog(data_dir)
+    print(f"カタログをコンパイルしました: {out}")
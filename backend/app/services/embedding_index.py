@@ -0,0 +1,201 @@
+# 楽曲の埋め込みベクトル（wav2vec2, 768次元）による近傍探索エンジンを定義するファイル
+# 正規化済みの float32 行列に対し、NumPyだけで実装したIVF（転置ファイル）方式の近似近傍探索を行う。
+# 再現率の確認用に全件走査（exact）のモードも持つ。
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+# k-means の学習に使う最大サンプル数（リスト数あたり）
+TRAIN_SAMPLES_PER_LIST = 256
+# 割り当て計算のチャンクサイズ（行数）
+ASSIGN_CHUNK = 65536
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """各行をL2正規化する（ゼロベクトルはそのまま）"""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (matrix / norms).astype(np.float32)
+
+
+def _assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """各ベクトルを内積が最大の重心に割り当てる"""
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK):
+        chunk = vectors[start:start + ASSIGN_CHUNK]
+        labels[start:start + ASSIGN_CHUNK] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def build_ivf(embeddings: np.ndarray, nlist: Optional[int] = None, iterations: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """球面k-meansでIVFインデックスを構築する。
+
+    Args:
+        embeddings (np.ndarray): 正規化済みの埋め込み行列（n × d）。
+        nlist (int, optional): リスト（クラスタ）数。省略時は √n。
+        iterations (int): k-means の反復回数。
+        seed (int): 乱数シード。
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]:
+            重心（nlist × d）、リストごとのオフセット（nlist+1）、リスト順に並べた楽曲位置（n）。
+            埋め込み行列を ``embeddings[members]`` の順に並べ替えたものを EmbeddingIndex に渡す。
+    """
+    n = len(embeddings)
+    nlist = max(1, min(n, nlist or int(np.sqrt(n))))
+    rng = np.random.default_rng(seed)
+    sample_size = min(n, nlist * TRAIN_SAMPLES_PER_LIST)
+    sample = np.asarray(embeddings[rng.choice(n, size=sample_size, replace=False)], dtype=np.float32)
+    centroids = sample[rng.choice(sample_size, size=nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = _assign(sample, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, sample)
+        empty = np.bincount(labels, minlength=nlist) == 0
+        # 空のクラスタはランダムなサンプルで置き換える
+        sums[empty] = sample[rng.choice(sample_size, size=int(empty.sum()))]
+        centroids = normalize_rows(sums)
+
+    labels = _assign(np.asarray(embeddings, dtype=np.float32), centroids)
+    members = np.argsort(labels, kind="stable").astype(np.int32)
+    offsets = np.zeros(nlist + 1, dtype=np.int64)
+    np.cumsum(np.bincount(labels, minlength=nlist), out=offsets[1:])
+    return centroids, offsets, members
+
+
+class EmbeddingIndex:
+    """埋め込みベクトルの近傍探索エンジン。
+
+    埋め込み行列はIVFのリスト順に並べて保持する（行 ≠ 楽曲位置）。
+    クエリに近い nprobe 個のリストは行列上の連続した区間になるため、
+    行を集める（fancy indexing）コピーなしに区間ごとの行列ベクトル積だけで採点できる。
+    - IVF: クエリに近い nprobe 個のリストに属する楽曲だけを採点する（近似）
+    - exact: 全楽曲（または候補集合）を採点する（再現率の確認用）
+    候補集合（タグで絞り込んだ楽曲など）が小さい場合は、その集合を直接採点する。
+    """
+
+    def __init__(self, vectors: np.ndarray, centroids: np.ndarray, offsets: np.ndarray, members: np.ndarray, nprobe: int = 8):
+        """
+        Args:
+            vectors (np.ndarray): リスト順に並べた正規化済みの埋め込み（n × d）。
+            centroids (np.ndarray): IVFの重心（nlist × d）。
+            offsets (np.ndarray): リストごとの行の区間（nlist+1）。
+            members (np.ndarray): 行ごとの楽曲位置（n）。
+            nprobe (int): 探索するリスト数。
+        """
+        self.vectors = vectors
+        self.centroids = centroids
+        self.offsets = np.asarray(offsets)
+        self.members = np.asarray(members)
+        self.nprobe = nprobe
+        # 楽曲位置 → 行
+        self.rows = np.empty(len(self.members), dtype=np.int64)
+        self.rows[self.members] = np.arange(len(self.members))
+
+    def __len__(self) -> int:
+        return len(self.vectors)
+
+    @property
+    def dim(self) -> int:
+        return self.vectors.shape[1]
+
+    def centroid_of(self, positions: Iterable[int]) -> Optional[np.ndarray]:
+        """楽曲群の埋め込みの平均（正規化済み）を返す"""
+        positions = sorted(positions)
+        if not positions:
+            return None
+        query = np.asarray(self.vectors[np.sort(self.rows[positions])], dtype=np.float32).mean(axis=0)
+        norm = np.linalg.norm(query)
+        return None if norm == 0 else query / norm
+
+    @staticmethod
+    def _top(rows: np.ndarray, scores: np.ndarray, k: int) -> np.ndarray:
+        """スコアの高い順に上位k件の行を返す"""
+        if len(rows) > k:
+            top = np.argpartition(-scores, k - 1)[:k]
+            rows, scores = rows[top], scores[top]
+        return rows[np.argsort(-scores, kind="stable")]
+
+    def _lists(self, query: np.ndarray, nprobe: int) -> np.ndarray:
+        """クエリに近い順に nprobe 個のリスト番号を返す"""
+        nlist = len(self.centroids)
+        if nprobe >= nlist:
+            return np.arange(nlist)
+        return np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+
+    def _scan(self, query: np.ndarray, lists: np.ndarray, allowed: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        """リストに属する行を区間ごとに採点し、許可された行とスコアを返す"""
+        rows, scores = [], []
+        for i in lists:
+            start, end = int(self.offsets[i]), int(self.offsets[i + 1])
+            if start == end:
+                continue
+            part = np.arange(start, end)
+            score = self.vectors[start:end] @ query
+            if allowed is not None:
+                keep = allowed[start:end]
+                part, score = part[keep], score[keep]
+            rows.append(part)
+            scores.append(score)
+        if not rows:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        return np.concatenate(rows), np.concatenate(scores)
+
+    def search(
+        self,
+        query: np.ndarray,
+        k: int,
+        candidates: Optional[Sequence[int]] = None,
+        exclude: Iterable[int] = (),
+        exact: bool = False,
+    ) -> List[int]:
+        """クエリベクトルに近い楽曲位置を上位k件返す。
+
+        Args:
+            query (np.ndarray): 正規化済みのクエリベクトル。
+            k (int): 返す件数。
+            candidates (Sequence[int], optional): 対象とする楽曲位置（タグによる事前絞り込み）。
+            exclude (Iterable[int]): 除外する楽曲位置（スワイプ済み・Like済みなど）。
+            exact (bool): Trueなら全件走査する。
+        Returns:
+            List[int]: 楽曲位置のリスト（類似度の降順）。
+        """
+        excluded = self.rows[np.fromiter(exclude, dtype=np.int64)]
+        n = len(self)
+        if candidates is not None:
+            pool = self.rows[np.asarray(candidates, dtype=np.int64)]
+            pool = np.sort(pool[~np.isin(pool, excluded)])
+            if exact or len(pool) <= self._probe_budget():
+                # 候補が少ない場合はIVFを使わず直接採点する
+                return self.members[self._top(pool, self.vectors[pool] @ query, k)].tolist()
+            allowed = np.zeros(n, dtype=bool)
+            allowed[pool] = True
+        else:
+            allowed = None
+            if len(excluded):
+                allowed = np.ones(n, dtype=bool)
+                allowed[excluded] = False
+            if exact:
+                rows, scores = np.arange(n), self.vectors @ query
+                if allowed is not None:
+                    rows, scores = rows[allowed], scores[allowed]
+                return self.members[self._top(rows, scores, k)].tolist()
+
+        # 絞り込み後に k 件に満たない場合は探索するリスト数を倍々に増やす
+        nprobe = self.nprobe
+        while True:
+            rows, scores = self._scan(query, self._lists(query, nprobe), allowed)
+            if len(rows) >= k or nprobe >= len(self.centroids):
+                return self.members[self._top(rows, scores, k)].tolist()
+            nprobe *= 2
+
+    def _probe_budget(self) -> int:
+        """IVFで1回に採点するおおよその件数（これより小さい候補集合は直接採点する）"""
+        return max(1, len(self) * self.nprobe // max(1, len(self.centroids)))
+
+    def recommend(self, liked: Iterable[int], k: int, candidates: Optional[Sequence[int]] = None,
+                  exclude: Iterable[int] = (), exact: bool = False) -> List[int]:
+        """Likeした楽曲の埋め込みの重心に近い楽曲位置を返す（埋め込みが無い場合は空）"""
+        query = self.centroid_of(liked)
+        if query is None:
+            return []
+        return self.search(query, k, candidates=candidates, exclude=exclude, exact=exact)
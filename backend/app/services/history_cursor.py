@@ -0,0 +1,31 @@
+# /history のページ送りに使うカーソルを扱うファイル
+# カーソルはページの最後の行の (created_at, id) を不透明な文字列にしたもので、
+# 次のページは「その行より古い行」をインデックス順に読む（OFFSETのように読み飛ばさない）
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+def encode_history_cursor(created_at: datetime, playlist_id: int) -> str:
+    """(created_at, id) をURLに含められるカーソル文字列に変換する"""
+    raw = json.dumps([created_at.isoformat(), playlist_id], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    """カーソル文字列を (created_at, id) に戻す。
+
+    Args:
+        cursor (str): encode_history_cursor で作ったカーソル。
+    Returns:
+        Tuple[datetime, int]: ページの最後の行の作成日時とID。
+    Raises:
+        ValueError: カーソルの形式が不正な場合。
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, playlist_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), int(playlist_id)
+    except (TypeError, ValueError) as e:
+        raise ValueError("invalid history cursor") from e
@@ -5,17 +5,34 @@ from app.core.config import settings
 from fastapi.security import OAuth2PasswordBearer
 from fastapi import HTTPException
 from starlette.status import HTTP_401_UNAUTHORIZED
-from app.models import User
+from sqlalchemy import event
+from app import repositories
 from app import schemas
+from app.models import User
+from .metrics import CACHE_LOOKUPS
+from .principal_cache import Principal, PrincipalCache
 
 SECRET_KEY = settings.SECRET_KEY
 ALGORITHM = settings.ALGORITHM
+
+# 検証済みトークン → Principal のキャッシュ（ヒットすれば署名検証もDB問い合わせも行わない）
+PRINCIPAL_CACHE = PrincipalCache(
+    maxsize=settings.AUTH_PRINCIPAL_CACHE_MAX_ENTRIES,
+    ttl=settings.AUTH_PRINCIPAL_CACHE_TTL_SECONDS,
+)
+_PRINCIPAL_HIT = CACHE_LOOKUPS.labels("principal", "hit")
+_PRINCIPAL_MISS = CACHE_LOOKUPS.labels("principal", "miss")
+
+@event.listens_for(User, "after_delete")
+def _invalidate_deleted_user(mapper, connection, target):
+    """ユーザーが削除されたら、そのユーザーのキャッシュ済みトークンを破棄する"""
+    PRINCIPAL_CACHE.invalidate_user(target.id)
  
 def create_access_token(*, data: dict, expires_delta: timedelta = None):
     """JWTトークンを生成する関数。
     
     Args:
-        data (dict): トークンに含めるデータ（通常はユーザーの識別情報）。
+        data (dict): トークンに含めるデータ（"sub" にemail、"uid" にユーザーIDを入れる）。
         expires_delta (timedelta, optional): トークンの有効期限。指定しない場合は15分。
     Returns:
         str: 生成されたJWTトークン。
@@ -36,18 +53,26 @@ def create_access_token(*, data: dict, expires_delta: timedelta = None):
 def decode_access_token(db, token):
     """JWTアクセストークンをデコードして、対応するユーザーを取得する。
     
-    トークンの署名と有効期限を検証し、内部に含まれる `sub`（email） を元にデータベースからユーザー情報を取得する。
+    キャッシュ済みのトークンはそのまま Principal を返す。
+    それ以外はトークンの署名と有効期限を検証し、`uid`（ユーザーID）があれば主キーで存在だけを確認する。
+    `uid` を持たない古いトークンは `sub`（email） を元にデータベースからユーザー情報を取得する。
     
     Args:
         db (Session): データベースセッション。
         token (str): アクセストークン（JWT形式）。
     
     Returns:
-        User: デコードされたトークンの `email` に該当するユーザーオブジェクト。
+        Principal: トークンの持ち主（ユーザーIDとemail）。
     
     Raises:
         HTTPException: トークンが不正またはユーザーが存在しない場合に401エラー。
     """
+    principal = PRINCIPAL_CACHE.get(token)
+    if principal is not None:
+        _PRINCIPAL_HIT.inc()
+        return principal
+    _PRINCIPAL_MISS.inc()
+
     # 認証エラー時に共通で使う例外を定義
     credentials_exception = HTTPException(
         status_code=HTTP_401_UNAUTHORIZED,
@@ -65,7 +90,15 @@ def decode_access_token(db, token):
         token_data = schemas.TokenData(email=email)
     except PyJWTError:
         raise credentials_exception
-    user = db.query(User).filter(User.email ==  token_data.email).first()
-    if user is None:
-        raise credentials_exception
-    return user
\ No newline at end of file
+    user_id = payload.get("uid")
+    if isinstance(user_id, int):
+        if not repositories.user_exists(db, user_id):
+            raise credentials_exception
+        principal = Principal(user_id, token_data.email)
+    else:
+        user = repositories.get_user_by_email(db, token_data.email)
+        if user is None:
+            raise credentials_exception
+        principal = Principal(user.id, user.email)
+    PRINCIPAL_CACHE.set(token, principal, payload.get("exp"))
+    return principal
\ No newline at end of file
@@ -0,0 +1,443 @@
+# アプリのメトリクスを集計し、Prometheus のテキスト形式（/metrics）で出力するファイル
+# 本番でも常に有効にしておけるよう、値の更新1回のコストを1µs未満に抑える:
+# - 更新は加算のみでロックを取らない（ヒストグラムはバケットを bisect で探す）。文字列の組み立ては出力時だけ行う。
+#   GIL下のCPythonでは1回の加算の途中で他のスレッドに切り替わることは実質ないが、言語としての保証はないため、
+#   （MoodInferenceCache の件数と同じく）監視用の値として扱い、厳密な件数が必要な処理には使わない
+# - ラベル付きの系列は labels() で子を取得し、ホットパスではモジュールの読み込み時に取得したものを使う
+# - カタログの大きさ・キャッシュのヒット率など、その時点の値で足りるものは出力時に関数で読む（更新コストなし）
+# prometheus_client には依存しない（必要なのはテキスト形式の出力だけのため）。
+import abc
+import logging
+import math
+import threading
+from bisect import bisect_left
+from time import perf_counter
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# /metrics のContent-Type（Prometheus テキスト形式 0.0.4）
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+# 処理時間のヒストグラムの既定のバケット（秒）
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# ラベルに使うHTTPメソッド（それ以外はクライアントが任意に送れるため "other" にまとめ、系列を増やさない）
+HTTP_METHODS = frozenset(("GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"))
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Labels, float]
+
+
+def method_label(method: str) -> str:
+    """HTTPメソッドをラベルの値にする（標準以外のメソッドは "other"）"""
+    return method if method in HTTP_METHODS else "other"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in labels) + "}"
+
+
+class Registry:
+    """メトリクスの集合（render() でまとめてテキスト形式にする）"""
+
+    def __init__(self):
+        self._metrics: List["_Metric"] = []
+        self._names = set()
+        self._lock = threading.Lock()
+
+    def register(self, metric: "_Metric") -> None:
+        with self._lock:
+            if metric.name in self._names:
+                raise ValueError(f"メトリクス名が重複しています: {metric.name}")
+            self._names.add(metric.name)
+            self._metrics.append(metric)
+
+    def unregister(self, metric: "_Metric") -> None:
+        with self._lock:
+            if metric.name in self._names:
+                self._names.discard(metric.name)
+                self._metrics.remove(metric)
+
+    def render(self) -> str:
+        """すべてのメトリクスを Prometheus のテキスト形式で返す"""
+        lines = []
+        for metric in list(self._metrics):
+            try:
+                samples = metric.samples()
+            except Exception:
+                # 値を読む関数の失敗で /metrics 全体を失敗させない
+                logger.exception("メトリクス %s の取得に失敗しました", metric.name)
+                continue
+            lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            for suffix, labels, value in samples:
+                lines.append(f"{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+# アプリ全体で使うレジストリ
+REGISTRY = Registry()
+
+
+class _Metric(abc.ABC):
+    """メトリクスの基底クラス（系列の値を持つ子の作り方をサブクラスで決める）"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY, function: Optional[Callable] = None):
+        """
+        Args:
+            name (str): メトリクス名。
+            documentation (str): HELP に出す説明。
+            labelnames (Sequence[str]): ラベル名（指定した場合は labels() で系列を取得して更新する）。
+            registry (Registry, optional): 登録先（Noneなら登録しない）。
+            function (Callable, optional): 出力時に値を返す関数（カウンタ・ゲージのみ）。ラベルなしなら数値を、
+                ラベルありなら {ラベルの値のタプル: 数値} を返す（Noneなら出力しない）。
+        """
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.function = function
+        self._children: Dict[tuple, object] = {}
+        self._lock = threading.Lock()
+        self._root = None if self.labelnames else self._new_child()
+        if registry is not None:
+            registry.register(self)
+
+    @abc.abstractmethod
+    def _new_child(self):
+        """1系列分の値を持つ子を作る"""
+
+    def labels(self, *values):
+        """ラベルの値に対応する系列を返す（ホットパスでは事前に取得して使い回す）"""
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} のラベルは {self.labelnames} です")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _series(self):
+        if self._root is not None:
+            return [((), self._root)]
+        return [(tuple(zip(self.labelnames, map(str, values))), child)
+                for values, child in sorted(self._children.items(), key=lambda item: tuple(map(str, item[0])))]
+
+    def samples(self) -> List[Sample]:
+        if self.function is not None:
+            value = self.function()
+            if value is None:
+                return []
+            if not self.labelnames:
+                return [("", (), value)]
+            return [("", tuple(zip(self.labelnames, map(str, values))), v) for values, v in sorted(value.items())]
+        return [sample for labels, child in self._series() for sample in child.samples(labels)]
+
+
+class _CounterChild:
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        self._value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self, labels: Labels) -> List[Sample]:
+        return [("", labels, self._value)]
+
+
+class Counter(_Metric):
+    """単調増加するカウンタ（名前は _total で終える）。function を指定すると出力時にその戻り値を使う"""
+
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._root.inc(amount)
+
+    @property
+    def value(self) -> float:
+        return self._root.value
+
+
+class _GaugeChild:
+    __slots__ = ("_value",)
+
+    def __init__(self):
+        self._value = 0
+
+    def inc(self, amount: float = 1) -> None:
+        self._value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self._value -= amount
+
+    def set(self, value: float) -> None:
+        self._value = value
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def samples(self, labels: Labels) -> List[Sample]:
+        return [("", labels, self._value)]
+
+
+class Gauge(_Metric):
+    """増減する値。function を指定すると出力時にその戻り値を使う"""
+
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def inc(self, amount: float = 1) -> None:
+        self._root.inc(amount)
+
+    def dec(self, amount: float = 1) -> None:
+        self._root.dec(amount)
+
+    def set(self, value: float) -> None:
+        self._root.set(value)
+
+    @property
+    def value(self) -> float:
+        return self._root.value
+
+
+class _Timer:
+    """with 文の間の経過時間をヒストグラムに記録する"""
+
+    __slots__ = ("_histogram", "_started")
+
+    def __init__(self, histogram: "_HistogramChild"):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._started = perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._histogram.observe(perf_counter() - self._started)
+        return False
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_counts", "_sum")
+
+    def __init__(self, bounds: Tuple[float, ...]):
+        self._bounds = bounds
+        # 最後の要素は上限（+Inf）のバケット
+        self._counts = [0] * (len(bounds) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self._bounds, value)] += 1
+        self._sum += value
+
+    def time(self) -> _Timer:
+        return _Timer(self)
+
+    @property
+    def count(self) -> int:
+        return sum(self._counts)
+
+    @property
+    def sum(self) -> float:
+        return self._sum
+
+    def samples(self, labels: Labels) -> List[Sample]:
+        counts, total = list(self._counts), self._sum
+        samples, cumulative = [], 0
+        for bound, count in zip((*self._bounds, math.inf), counts):
+            cumulative += count
+            samples.append(("_bucket", labels + (("le", _format_value(bound)),), cumulative))
+        samples.append(("_sum", labels, total))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Histogram(_Metric):
+    """値の分布（バケットごとの累積件数・合計・件数）"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 registry: Optional[Registry] = REGISTRY, buckets: Iterable[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames, registry)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float) -> None:
+        self._root.observe(value)
+
+    def time(self) -> _Timer:
+        """with 文の間の経過時間（秒）を記録する"""
+        return _Timer(self._root)
+
+    @property
+    def count(self) -> int:
+        return self._root.count
+
+    @property
+    def sum(self) -> float:
+        return self._root.sum
+
+
+# --- HTTP ---
+HTTP_REQUEST_DURATION = Histogram(
+    "http_request_duration_seconds", "ルートごとのリクエストの処理時間（レスポンスの送信完了まで）", ("method", "route"),
+)
+HTTP_REQUESTS = Counter("http_requests_total", "ルート・ステータスごとのリクエスト数", ("method", "route", "status"))
+HTTP_IN_FLIGHT = Gauge("http_requests_in_flight", "処理中のリクエスト数")
+
+# --- ムード推定（Vision API） ---
+VISION_DURATION = Histogram(
+    "vision_api_duration_seconds", "Vision API の呼び出しの応答時間",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+VISION_ERRORS = Counter("vision_api_errors_total", "Vision API の呼び出しの失敗数（例外の種類ごと）", ("reason",))
+MOOD_ESTIMATION_DURATION = Histogram(
+    "mood_estimation_duration_seconds", "estimate_mood_from_image の処理時間（結果の取得元ごと: memory, db, api, error）",
+    ("source",), buckets=(0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0),
+)
+
+# --- 推薦 ---
+SWIPE_RANK_DURATION = Histogram("swipe_rank_duration_seconds", "探索フェーズごとのスワイプ候補の選択時間", ("phase",))
+PLAYLIST_SCORE_DURATION = Histogram("playlist_score_duration_seconds", "プレイリスト候補の採点時間")
+
+# --- キャッシュ ---
+CACHE_LOOKUPS = Counter("cache_lookups_total", "プロセス内キャッシュの参照数（hit / miss）", ("cache", "result"))
+
+# --- DB接続プール ---
+DB_POOL_CHECKOUT_WAIT = Histogram(
+    "db_pool_checkout_wait_seconds", "接続プールから接続を取得するまでの時間（空き待ち・pre_ping を含む）",
+)
+DB_POOL_CHECKOUT_HOLD = Histogram(
+    "db_pool_connection_hold_seconds", "接続を取得してからプールに返すまでの時間",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0),
+)
+
+# --- リクエストごとのSQL（QueryStatsMiddleware が記録する） ---
+DB_QUERIES_PER_REQUEST = Histogram(
+    "db_queries_per_request", "リクエスト1回で実行したSQLの数", ("method", "route"),
+    buckets=(0, 1, 2, 3, 4, 5, 6, 8, 10, 15, 20, 30, 50, 100),
+)
+DB_TIME_PER_REQUEST = Histogram("db_time_per_request_seconds", "リクエスト1回のSQLの実行時間の合計", ("method", "route"))
+DB_ROWS_PER_REQUEST = Histogram(
+    "db_rows_per_request", "リクエスト1回で取得・更新した行数（ドライバが返す件数）", ("method", "route"),
+    buckets=(0, 1, 5, 10, 20, 50, 100, 200, 500, 1000, 5000, 10000),
+)
+DB_QUERY_BUDGET_EXCEEDED = Counter(
+    "db_query_budget_exceeded_total", "クエリ数がルートの上限を超えたリクエスト数", ("method", "route"),
+)
+DB_REPEATED_QUERIES = Counter(
+    "db_repeated_queries_total", "同じSQL文をしきい値以上の回数実行したリクエスト数（N+1 の疑い）", ("method", "route"),
+)
+
+
+def cache_hit_ratio(cache: str) -> Optional[float]:
+    """CACHE_LOOKUPS に数えたキャッシュのヒット率（参照が無ければNone）"""
+    hits = CACHE_LOOKUPS.labels(cache, "hit").value
+    total = hits + CACHE_LOOKUPS.labels(cache, "miss").value
+    return hits / total if total else None
+
+
+def instrument_pool(pool) -> None:
+    """SQLAlchemy の接続プールの取得待ち時間・保持時間と使用状況を記録する。
+
+    取得待ちは pool.connect() の所要時間（Engine はこれで接続を取得する）、保持時間は
+    checkout から checkin までの時間で測る。engine.dispose() でプールが作り直された場合は再度呼ぶ。
+    """
+    from sqlalchemy import event
+
+    connect = pool.connect
+
+    def timed_connect():
+        started = perf_counter()
+        try:
+            return connect()
+        finally:
+            DB_POOL_CHECKOUT_WAIT.observe(perf_counter() - started)
+
+    pool.connect = timed_connect
+
+    @event.listens_for(pool, "checkout")
+    def on_checkout(dbapi_connection, record, proxy):
+        record.info["metrics_checked_out_at"] = perf_counter()
+
+    @event.listens_for(pool, "checkin")
+    def on_checkin(dbapi_connection, record):
+        started = record.info.pop("metrics_checked_out_at", None)
+        if started is not None:
+            DB_POOL_CHECKOUT_HOLD.observe(perf_counter() - started)
+
+    def usage():
+        if not hasattr(pool, "checkedout"):
+            return None
+        # overflow() は常駐数に満たない間は負の値になる
+        return {("checked_out",): pool.checkedout(), ("size",): pool.size(), ("overflow",): max(pool.overflow(), 0)}
+
+    Gauge("db_pool_connections", "接続プールの使用状況（checked_out: 使用中、size: 常駐数、overflow: 超過分）",
+          ("state",), function=usage)
+
+
+class MetricsMiddleware:
+    """ルートごとの処理時間・リクエスト数と処理中のリクエスト数を記録するASGIミドルウェア。
+
+    ルートはパスそのものではなくテンプレート（/uploads/{path:path} など）で集計し、系列が増え続けないようにする。
+    どのルートにも一致しなかったリクエストは "unmatched" に、標準以外のHTTPメソッドは "other" にまとめる。
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = perf_counter() - started
+            HTTP_IN_FLIGHT.dec()
+            # ルーティング後に FastAPI が scope["route"] を設定する
+            route = getattr(scope.get("route"), "path", "unmatched")
+            method = method_label(scope["method"])
+            HTTP_REQUEST_DURATION.labels(method, route).observe(elapsed)
+            HTTP_REQUESTS.labels(method, route, status).inc()
@@ -0,0 +1,231 @@
+# 画像→ムード推定結果のキャッシュを定義するファイル
+# 同じ画像（リトライ・ギャラリーからの再選択・共有された写真）の再アップロード時に
+# OpenAI APIを呼ばずに済ませる。キーは画像の内容ハッシュ（SHA-256）で、
+# 任意でほぼ同一の画像を拾うための知覚ハッシュ（dHash）も使う。
+#   1段目: プロセス内のLRU+TTL（知覚ハッシュのハミング距離による近似一致も見る）
+#   2段目: DBテーブル mood_inference_cache（ワーカー・再起動をまたいで共有）
+import hashlib
+import io
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Dict, Optional, Tuple, Union
+
+from PIL import Image
+from sqlalchemy import bindparam, update
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.models import MoodInference
+
+# DBの期限切れ行を掃除する頻度（保存の何回に1回か）
+PURGE_EVERY = 100
+# DBのヒット数をまとめて書き込む件数（未書き込みのヒットがこの件数に達したら加算する）
+HIT_FLUSH_EVERY = 100
+
+
+def content_hash(image_bytes: bytes) -> str:
+    """画像のバイト列のSHA-256（16進文字列）を返す"""
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def perceptual_hash(image: Union[bytes, str]) -> Optional[int]:
+    """画像（バイト列またはファイルのパス）の64bit dHash を返す（デコードできない場合はNone）。
+
+    JPEGは draft() でデコード時に縮小するため、大きな写真でも数ミリ秒で済む。
+    """
+    try:
+        with Image.open(io.BytesIO(image) if isinstance(image, bytes) else image) as img:
+            img.draft("L", (64, 64))
+            pixels = list(img.convert("L").resize((9, 8), Image.Resampling.BILINEAR).getdata())
+    except Exception:
+        return None
+    value = 0
+    for row in range(8):
+        for col in range(8):
+            left = pixels[row * 9 + col]
+            right = pixels[row * 9 + col + 1]
+            value = (value << 1) | (left > right)
+    return value
+
+
+def image_fingerprint(image_bytes: bytes, perceptual: bool = True) -> Tuple[str, Optional[int]]:
+    """キャッシュキー（内容ハッシュ, 知覚ハッシュ）を返す（IMAGE_EXECUTOR上で実行する）"""
+    return content_hash(image_bytes), perceptual_hash(image_bytes) if perceptual else None
+
+
+def _to_signed(value: Optional[int]) -> Optional[int]:
+    """64bitの符号なし整数をDBのBIGINT（符号付き）に収まる値に変換する"""
+    if value is None:
+        return None
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _bands(max_distance: int) -> Tuple[Tuple[int, int], ...]:
+    """64bitを max_distance + 1 個の帯（シフト量, マスク）に分ける。
+
+    ハミング距離が max_distance 以下の2つのハッシュは、鳩の巣原理により少なくとも1つの帯が完全に一致する。
+    """
+    count = max_distance + 1
+    bands, start = [], 0
+    for i in range(count):
+        width = 64 // count + (1 if i < 64 % count else 0)
+        bands.append((start, (1 << width) - 1))
+        start += width
+    return tuple(bands)
+
+
+class MoodInferenceCache:
+    """画像→ムード推定結果の2段キャッシュ。
+
+    知覚ハッシュの近似一致は、64bitを帯に分けた索引（帯の値→内容ハッシュ）で候補を絞り込むため、
+    エントリ数によらず参照は数マイクロ秒で済む（イベントループ上で呼んでよい）。
+    DBのヒット数（hit_count）は参照のたびには書き込まず、まとめて加算する。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 7 * 24 * 3600, max_distance: int = 4):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.max_distance = max_distance
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._bands = _bands(max_distance) if 0 < max_distance < 64 else ()
+        self._index = [{} for _ in self._bands]
+        self._lock = threading.Lock()
+        self._stores = 0
+        # DBのヒット数の未書き込み分（内容ハッシュ→件数）
+        self._pending_hits: Dict[str, int] = {}
+        self.counters: Dict[str, int] = {
+            "memory_hits": 0,
+            "perceptual_hits": 0,
+            "db_hits": 0,
+            "misses": 0,
+        }
+
+    def stats(self) -> dict:
+        """ヒット・ミスの件数とヒット率を返す"""
+        hits = self.counters["memory_hits"] + self.counters["perceptual_hits"] + self.counters["db_hits"]
+        total = hits + self.counters["misses"]
+        return {**self.counters, "entries": len(self._entries), "hit_ratio": hits / total if total else 0.0}
+
+    def _index_update(self, key: str, phash: Optional[int], add: bool) -> None:
+        """知覚ハッシュの索引に key を追加・削除する（_lock を取得して呼ぶ）"""
+        if phash is None:
+            return
+        for (shift, mask), index in zip(self._bands, self._index):
+            band = (phash >> shift) & mask
+            if add:
+                index.setdefault(band, set()).add(key)
+            else:
+                keys = index.get(band)
+                if keys is not None:
+                    keys.discard(key)
+                    if not keys:
+                        del index[band]
+
+    def _discard(self, key: str) -> None:
+        """エントリを削除する（_lock を取得して呼ぶ）"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._index_update(key, entry[1], add=False)
+
+    def _remember(self, key: str, phash: Optional[int], mood: str) -> None:
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (time.monotonic() + self.ttl, phash, mood)
+            self._index_update(key, phash, add=True)
+            while len(self._entries) > self.maxsize:
+                self._discard(next(iter(self._entries)))
+
+    def lookup_memory(self, key: str, phash: Optional[int] = None) -> Optional[str]:
+        """プロセス内キャッシュを引く（内容ハッシュの完全一致 → 知覚ハッシュの近似一致）"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry[0] >= now:
+                    self._entries.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                    return entry[2]
+                self._discard(key)
+            if phash is None or not self._bands:
+                return None
+            # いずれかの帯が一致する候補だけを調べ、最も近いものを使う
+            best = None
+            for (shift, mask), index in zip(self._bands, self._index):
+                for other_key in index.get((phash >> shift) & mask, ()):
+                    expires_at, other, mood = self._entries[other_key]
+                    distance = (phash ^ other).bit_count()
+                    if expires_at >= now and distance <= self.max_distance and (best is None or distance < best[0]):
+                        best = (distance, mood)
+            if best is not None:
+                self.counters["perceptual_hits"] += 1
+                return best[1]
+        return None
+
+    def lookup_db(self, db: Session, key: str, phash: Optional[int] = None) -> Optional[str]:
+        """DBのキャッシュテーブルを引く（内容ハッシュ → 知覚ハッシュの完全一致）。
+
+        ヒットした場合はプロセス内キャッシュにも載せる。どちらにも無ければミスとして数える。
+        ミスの後は Vision API の応答を待つ間（数秒）接続を保持しないよう、ヒット・ミスによらず
+        読み取りのトランザクションを終えて接続をプールに返す。
+        """
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        try:
+            query = db.query(MoodInference.content_hash, MoodInference.mood).filter(MoodInference.created_at >= cutoff)
+            row = query.filter(MoodInference.content_hash == key).first()
+            if row is None and phash is not None:
+                row = query.filter(MoodInference.perceptual_hash == _to_signed(phash)).first()
+        finally:
+            db.rollback()
+        if row is None:
+            self.counters["misses"] += 1
+            return None
+        self.counters["db_hits"] += 1
+        self._remember(key, phash, row.mood)
+        with self._lock:
+            self._pending_hits[row.content_hash] = self._pending_hits.get(row.content_hash, 0) + 1
+            flush = sum(self._pending_hits.values()) >= HIT_FLUSH_EVERY
+        if flush:
+            self.flush_hits(db)
+        return row.mood
+
+    def flush_hits(self, db: Session) -> int:
+        """未書き込みのヒット数をDBに加算し、加算した行数を返す（失敗した分は捨てる。統計用の値のため）"""
+        with self._lock:
+            pending, self._pending_hits = self._pending_hits, {}
+        if not pending:
+            return 0
+        table = MoodInference.__table__
+        statement = (
+            update(table)
+            .where(table.c.content_hash == bindparam("key"))
+            .values(hit_count=table.c.hit_count + bindparam("hits"))
+        )
+        try:
+            db.connection().execute(statement, [{"key": k, "hits": n} for k, n in pending.items()])
+            db.commit()
+        except SQLAlchemyError:
+            db.rollback()
+            return 0
+        return len(pending)
+
+    def store(self, db: Session, key: str, phash: Optional[int], mood: str) -> None:
+        """推定結果を両方の段に保存する（同じキーが同時に保存された場合は先勝ち）"""
+        self._remember(key, phash, mood)
+        db.add(MoodInference(content_hash=key, perceptual_hash=_to_signed(phash), mood=mood, hit_count=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+        self._stores += 1
+        if self._stores % PURGE_EVERY == 0:
+            self.flush_hits(db)
+            self.purge_expired(db)
+
+    def purge_expired(self, db: Session) -> int:
+        """TTLを過ぎたDBの行を削除し、削除件数を返す"""
+        cutoff = datetime.now(timezone.utc) - timedelta(seconds=self.ttl)
+        deleted = db.query(MoodInference).filter(MoodInference.created_at < cutoff).delete(synchronize_session=False)
+        db.commit()
+        return deleted
@@ -1,10 +1,114 @@
-from app.models import User
-from passlib.context import CryptContext
- 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
- 
+# パスワードのハッシュ化・検証を行うファイル
+# bcrypt はCPUを占有するため、専用の上限付きプロセスプールで実行し、
+# イベントループとリクエスト用スレッドプールを止めないようにする。
+# ワーカープロセスには bcrypt の関数だけを渡す（アプリのモジュールを読み込ませない）。
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional
+
+import bcrypt
+from fastapi import HTTPException
+from starlette.concurrency import run_in_threadpool
+from starlette.status import HTTP_503_SERVICE_UNAVAILABLE
+
+from app import repositories
+from app.core.config import settings
+
+
+def hash_rounds(hashed_password: str) -> Optional[int]:
+    """bcryptハッシュ（$2b$12$...）からコスト（rounds）を取り出す。形式が違う場合はNone"""
+    parts = hashed_password.split("$")
+    if len(parts) < 4 or not parts[2].isdigit():
+        return None
+    return int(parts[2])
+
+
+class PasswordHasher:
+    """bcrypt のハッシュ化・検証を上限付きのプロセスプールで行う。
+
+    同時に受け付ける処理数は max_pending までとし、超えた場合は 503 を返す
+    （ログインが集中したときに待ち行列を際限なく伸ばさない）。
+    """
+
+    def __init__(self, rounds: int = 12, workers: int = 2, max_pending: int = 64):
+        """
+        Args:
+            rounds (int): 新しく作るハッシュのコスト（2^rounds 回の反復）。
+            workers (int): ワーカープロセス数。
+            max_pending (int): 実行中・待機中の処理数の上限。
+        """
+        self.rounds = rounds
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        """プロセスプールを作成する（初回の処理時にも自動で作成される）"""
+        with self._lock:
+            if self._executor is None:
+                # fork はスレッド（スワイプログの書き込みなど）と併用すると安全でないため spawn を使う
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context("spawn")
+                )
+
+    def shutdown(self) -> None:
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """設定中のコストと異なるハッシュか"""
+        return hash_rounds(hashed_password) != self.rounds
+
+    def hash(self, password: str) -> str:
+        """呼び出し元のスレッドでハッシュ化する（スクリプトやテストデータ作成用）"""
+        return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(self.rounds)).decode("ascii")
+
+    def verify(self, password: str, hashed_password: str) -> bool:
+        """呼び出し元のスレッドで検証する"""
+        return bcrypt.checkpw(password.encode("utf-8"), hashed_password.encode("ascii"))
+
+    async def _submit(self, fn, *args):
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise HTTPException(
+                    status_code=HTTP_503_SERVICE_UNAVAILABLE,
+                    detail="混雑しています。しばらくしてから再度お試しください",
+                    headers={"Retry-After": "1"},
+                )
+            self._pending += 1
+        try:
+            if self._executor is None:
+                self.start()
+            return await asyncio.get_running_loop().run_in_executor(self._executor, fn, *args)
+        finally:
+            with self._lock:
+                self._pending -= 1
+
+    async def hash_async(self, password: str) -> str:
+        """プロセスプールでハッシュ化する"""
+        hashed = await self._submit(bcrypt.hashpw, password.encode("utf-8"), bcrypt.gensalt(self.rounds))
+        return hashed.decode("ascii")
+
+    async def verify_async(self, password: str, hashed_password: str) -> bool:
+        """プロセスプールで検証する"""
+        return await self._submit(bcrypt.checkpw, password.encode("utf-8"), hashed_password.encode("ascii"))
+
+
+# アプリ全体で共有するハッシュ器（ワーカー数・コストは設定で変更する）
+PASSWORD_HASHER = PasswordHasher(
+    rounds=settings.BCRYPT_ROUNDS,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
 def verify_password(plain_password, hashed_password):
-    """パスワードの検証を行う関数。
+    """パスワードの検証を行う関数（呼び出し元のスレッドで実行する）。
 
     Args:
         plain_password (str): ユーザーが入力した平文のパスワード。
@@ -12,21 +116,26 @@ def verify_password(plain_password, hashed_password):
     Returns:
         bool: パスワードが一致する場合はTrue、一致しない場合はFalse。
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return PASSWORD_HASHER.verify(plain_password, hashed_password)
 
 def get_password_hash(password):
-    """パスワードをハッシュ化する関数。
-    
+    """パスワードをハッシュ化する関数（呼び出し元のスレッドで実行する）。
+
     Args:
         password (str): ユーザーが入力した平文のパスワード。
     Returns:
         str: ハッシュ化されたパスワード。
     """
-    return pwd_context.hash(password)
- 
-def authenticate_user(db, email: str, password: str):
+    return PASSWORD_HASHER.hash(password)
+
+async def authenticate_user(db, email: str, password: str):
     """ユーザー認証を行う関数。
-    
+
+    bcrypt の検証はプロセスプールで行う。保存済みハッシュのコストが設定と異なる場合は、
+    認証に成功したパスワードで再ハッシュする。再ハッシュはセッション上のユーザーを更新するだけで、
+    コミットは呼び出し側で行う（ログインではリフレッシュトークンの発行と同じコミットで保存し、
+    コミットで失効したユーザーを読み直すクエリを増やさない）。
+
     Args:
         db (Session): データベースセッション。
         email (str): ユーザーのメールアドレス。
@@ -34,14 +143,11 @@ def authenticate_user(db, email: str, password: str):
     Returns:
         User | bool: 認証に成功した場合はUserオブジェクト、失敗した場合はFalse。
     """
-    print(f"入力されたemail: {email}")
-    print(f"入力されたpassword: {password}")
-    user = db.query(User).filter(User.email == email).first()
-    print(f"ユーザーが見つかりました: {user.email}")
-    print(f"DBに保存されているハッシュ: {user.hashed_password}")
-    print(pwd_context.hash("test"))
+    user = await run_in_threadpool(repositories.get_user_by_email, db, email)
     if not user:
         return False
-    if not verify_password(password, user.hashed_password):
+    if not await PASSWORD_HASHER.verify_async(password, user.hashed_password):
         return False
-    return user
\ No newline at end of file
+    if PASSWORD_HASHER.needs_rehash(user.hashed_password):
+        user.hashed_password = await PASSWORD_HASHER.hash_async(password)
+    return user
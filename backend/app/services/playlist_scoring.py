@@ -0,0 +1,148 @@
+# プレイリスト候補の採点をベクトル化したファイル
+# カタログをタグ×楽曲の疎行列（CSR）として持ち、ユーザーのムード指示ベクトルとの行列積1回で
+# 全楽曲のムード一致数を求め、楽器の一致数はビットマップ（packbits）から配列演算で引く。
+# 閾値によるマスクと重み付きサンプリングも配列演算で行い、複数ユーザーをまとめて採点できる
+# （夜間の一括再生成など）。
+from typing import TYPE_CHECKING, Iterable, List, Optional, Sequence
+
+import numpy as np
+
+if TYPE_CHECKING:
+    from scipy import sparse
+
+# Likeした曲から使うムードタグ・楽器（ムード以外）タグの数
+MOOD_TOP = 3
+INST_TOP = 2
+# 候補とするのに必要なムードタグの一致数
+MIN_MOOD_HITS = 2
+# プレイリストの推薦曲数
+PLAYLIST_SIZE = 10
+
+
+class PlaylistScore:
+    """1ユーザー分の採点結果"""
+
+    def __init__(self, mood_tags: List[str], inst_tags: List[str], candidates: np.ndarray, picks: List[int]):
+        self.mood_tags = mood_tags
+        self.inst_tags = inst_tags
+        # 条件を満たす楽曲位置（昇順）
+        self.candidates = candidates
+        # 一致数で重み付けしてサンプリングした推薦曲の位置
+        self.picks = picks
+
+
+class PlaylistScorer:
+    """楽曲×タグの疎行列によるプレイリスト候補の採点器。
+
+    タグ語彙はムードが先頭に並んでいる（catalog_store を参照）ため、
+    タグ番号が n_moods 未満ならムード、それ以外は楽器などのタグとして扱う。
+    ムードの一致数は ムード指示行列（ユーザー × タグ）× タグ×楽曲行列 の疎行列積1回で求める。
+    計算量は選ばれたムードの転置リストの長さの合計に比例する（全楽曲は走査しない）。
+    楽器の一致数はムードの条件を満たした楽曲についてだけ、楽曲×タグのビットマップから数える。
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+        self.tags: List[str] = catalog.tags
+        self.n_moods = len(catalog.meta["moods"])
+        self._song_tags: Optional["sparse.csr_matrix"] = None
+        self._tag_songs: Optional["sparse.csr_matrix"] = None
+
+    @property
+    def song_tags(self) -> "sparse.csr_matrix":
+        """楽曲×タグの所属行列（初回参照時にカタログのCSR配列から作る）"""
+        if self._song_tags is None:
+            self._song_tags = self._csr(self.catalog.song_tag_offsets, self.catalog.song_tag_indices,
+                                        (len(self.catalog), len(self.tags)))
+        return self._song_tags
+
+    @property
+    def tag_songs(self) -> "sparse.csr_matrix":
+        """タグ×楽曲の所属行列（転置リストそのもの）"""
+        if self._tag_songs is None:
+            self._tag_songs = self._csr(self.catalog.tag_offsets, self.catalog.tag_postings,
+                                        (len(self.tags), len(self.catalog)))
+        return self._tag_songs
+
+    @staticmethod
+    def _csr(offsets: np.ndarray, indices: np.ndarray, shape) -> "sparse.csr_matrix":
+        from scipy import sparse  # 読み込みに時間がかかるため、最初に行列を作るときまで読み込まない
+        indices = np.asarray(indices)
+        return sparse.csr_matrix((np.ones(len(indices), dtype=np.float32), indices, np.asarray(offsets)), shape=shape)
+
+    def _top_tags(self, counts: np.ndarray, start: int, stop: int, k: int) -> np.ndarray:
+        """counts[start:stop] のうち件数の多い順（同数はタグ番号順）に最大k個のタグ番号を返す"""
+        part = counts[start:stop]
+        order = np.argsort(-part, kind="stable")[:k]
+        return order[part[order] > 0] + start
+
+    def score(self, liked_batch: Sequence[Iterable[int]], k: int = PLAYLIST_SIZE,
+              rng: Optional[np.random.Generator] = None) -> List[PlaylistScore]:
+        """複数ユーザーのLike曲からプレイリスト候補をまとめて採点する。
+
+        Args:
+            liked_batch (Sequence[Iterable[int]]): ユーザーごとのLikeした曲の位置。
+            k (int): ユーザーごとに選ぶ推薦曲数。
+            rng (np.random.Generator, optional): サンプリングに使う乱数生成器。
+        Returns:
+            List[PlaylistScore]: 入力と同じ順のユーザーごとの採点結果。
+        """
+        rng = rng or np.random.default_rng()
+        liked_batch = [sorted(liked) for liked in liked_batch]
+        users, n, n_tags = len(liked_batch), len(self.catalog), len(self.tags)
+
+        # Like曲のタグ集計（ユーザー×楽曲の選択行列 × 楽曲×タグ）
+        lengths = [len(liked) for liked in liked_batch]
+        rows = np.repeat(np.arange(users), lengths)
+        cols = np.fromiter((p for liked in liked_batch for p in liked), dtype=np.int64, count=len(rows))
+        selection = self._csr(np.concatenate(([0], np.cumsum(lengths))), cols, (users, n))
+        tag_counts = (selection @ self.song_tags).toarray()
+
+        # ユーザーごとのムード指示行列（ムード上位を 1）と楽器上位の表（無い場合は -1）
+        mood_tags, inst_tags, q_offsets, q_cols = [], [], [0], []
+        inst_table = np.full((users, INST_TOP), -1, dtype=np.int64)
+        for u in range(users):
+            moods = self._top_tags(tag_counts[u], 0, self.n_moods, MOOD_TOP)
+            insts = self._top_tags(tag_counts[u], self.n_moods, n_tags, INST_TOP)
+            q_cols += moods.tolist()
+            q_offsets.append(len(q_cols))
+            inst_table[u, :len(insts)] = insts
+            mood_tags.append([self.tags[j] for j in moods])
+            inst_tags.append([self.tags[j] for j in insts])
+        queries = self._csr(np.array(q_offsets), np.array(q_cols, dtype=np.int64), (users, n_tags))
+
+        # 全楽曲のムード一致数（疎行列積1回、一致しない楽曲は結果に現れない）
+        hits = queries @ self.tag_songs
+        mood_hits = np.rint(hits.data).astype(np.int64)
+        songs = hits.indices.astype(np.int64)
+        owners = np.repeat(np.arange(users), np.diff(hits.indptr))
+        keep = mood_hits >= MIN_MOOD_HITS
+        songs, owners, mood_hits = songs[keep], owners[keep], mood_hits[keep]
+
+        # 楽器の一致数（ビットマップのビットを直接参照する）
+        inst_hits = np.zeros(len(songs), dtype=np.int64)
+        for slot in range(INST_TOP):
+            tag = inst_table[owners, slot]
+            valid = tag >= 0
+            bits = self.catalog.tag_bitmap[songs[valid], tag[valid] >> 3] >> (7 - (tag[valid] & 7))
+            inst_hits[valid] += bits & 1
+
+        # ムード2つ以上かつ楽器1つ以上一致し、Like済みでない曲を一致数の合計で重み付けする
+        keep = (inst_hits >= 1) & ~np.isin(owners * n + songs, rows * n + cols)
+        songs, owners, weights = songs[keep], owners[keep], (mood_hits + inst_hits)[keep]
+        offsets = np.zeros(users + 1, dtype=np.int64)
+        np.cumsum(np.bincount(owners, minlength=users), out=offsets[1:])
+
+        # 重み付きの重複なしサンプリング（Efraimidis–Spirakis: キー log(u)/w の上位k件）
+        keys = np.log(rng.random(len(weights))) / weights
+        results = []
+        for u in range(users):
+            candidates = songs[offsets[u]:offsets[u + 1]]
+            row_keys = keys[offsets[u]:offsets[u + 1]]
+            if len(candidates) > k:
+                top = np.argpartition(-row_keys, k - 1)[:k]
+            else:
+                top = np.arange(len(candidates))
+            picks = candidates[top[np.argsort(-row_keys[top], kind="stable")]]
+            results.append(PlaylistScore(mood_tags[u], inst_tags[u], np.sort(candidates), picks.tolist()))
+        return results
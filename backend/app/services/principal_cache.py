@@ -0,0 +1,76 @@
+# 検証済みアクセストークン → 認証済みユーザー（Principal）のキャッシュを定義するファイル
+# 保護されたエンドポイントは毎回 JWT の署名検証とユーザーの取得を行っていたため、
+# 一度検証したトークンはトークンの有効期限とTTLの短い方まで、検証もDB問い合わせもせずに使い回す
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+
+class Principal:
+    """認証済みユーザーの軽量な表現（エンドポイントが使うのは id のみ）"""
+
+    __slots__ = ("id", "email")
+
+    def __init__(self, id: int, email: str):
+        self.id = id
+        self.email = email
+
+    def __repr__(self) -> str:
+        return f"Principal(id={self.id!r}, email={self.email!r})"
+
+
+class PrincipalCache:
+    """アクセストークン文字列をキーとするLRU+TTLキャッシュ。
+
+    ユーザーが削除された場合は invalidate_user() でそのユーザーのエントリを破棄する。
+    プロセス内のキャッシュのため、他のワーカーでは最大 ttl 秒だけ削除が反映されない。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Optional[Principal]:
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+            expires_at, principal = entry
+            if expires_at < time.monotonic():
+                del self._entries[token]
+                return None
+            self._entries.move_to_end(token)
+            return principal
+
+    def set(self, token: str, principal: Principal, token_exp: Optional[float] = None) -> None:
+        """
+        Args:
+            token (str): 検証済みのアクセストークン。
+            principal (Principal): トークンの持ち主。
+            token_exp (float, optional): トークンの有効期限（UNIX時刻、exp クレーム）。これを過ぎて使われないようにする。
+        """
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl
+        if token_exp is not None:
+            ttl = min(ttl, token_exp - time.time())
+        if ttl <= 0:
+            return
+        with self._lock:
+            self._entries[token] = (time.monotonic() + ttl, principal)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate_user(self, user_id: int) -> None:
+        """ユーザーのすべてのトークンのエントリを破棄する（ユーザー削除時など）"""
+        with self._lock:
+            for token in [t for t, (_, p) in self._entries.items() if p.id == user_id]:
+                del self._entries[token]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
@@ -0,0 +1,154 @@
+# リクエストごとのSQLの実行回数・DB時間・行数を数えるファイル（N+1 の検出とクエリ数の上限の確認に使う）
+# - Engine のイベント（before/after_cursor_execute）で、処理中のリクエストの QueryStats に加算する。
+#   QueryStats は contextvars で渡すため、スレッドプールで動く同期エンドポイント・依存関係のクエリも数え、
+#   リクエストの外（スワイプログの書き込みスレッドなど）で実行したクエリは数えない。
+#   スワイプの記録は SwipeLogWriter のスレッドでまとめてINSERTするため、POST /swipe・/swipe/batch の値と上限は
+#   認証・スワイプ状態の復元の読み込みのみで、スワイプログの書き込みは含まない
+# - COMMIT / ROLLBACK はカーソルで実行しないため数えない（接続プールの保持時間は metrics.instrument_pool で測る）
+# - 行数はドライバが cursor.rowcount で返す件数（psycopg2 では SELECT の取得件数・更新件数）。
+#   SELECT の件数を返さないドライバ（SQLite）では、更新系の件数のみになる
+# - 同じSQL文（パラメータ違い）の繰り返しを数え、関連の遅延読み込みの連鎖などの N+1 を検出する
+import logging
+from contextvars import ContextVar
+from time import perf_counter
+from typing import Callable, Dict, Mapping, Optional
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+# 上限を超えたときの動作
+BUDGET_MODES = ("off", "log", "raise")
+
+
+class QueryStats:
+    """1リクエスト分のSQLの実行回数・DB時間（秒）・行数と、SQL文ごとの実行回数"""
+
+    __slots__ = ("queries", "duration", "rows", "statements")
+
+    def __init__(self):
+        self.queries = 0
+        self.duration = 0.0
+        self.rows = 0
+        self.statements: Dict[str, int] = {}
+
+    def most_repeated(self):
+        """最も多く実行したSQL文とその回数（クエリが無ければ (None, 0)）"""
+        if not self.statements:
+            return None, 0
+        return max(self.statements.items(), key=lambda item: item[1])
+
+
+_CURRENT: ContextVar[Optional[QueryStats]] = ContextVar("query_stats", default=None)
+
+
+def current() -> Optional[QueryStats]:
+    """処理中のリクエストの QueryStats（リクエストの外ではNone）"""
+    return _CURRENT.get()
+
+
+def instrument_engine(engine) -> None:
+    """Engine で実行するSQLを、処理中のリクエストの QueryStats に数える"""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if _CURRENT.get() is not None:
+            conn.info.setdefault("query_stats_started", []).append(perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _CURRENT.get()
+        if stats is None:
+            return
+        started = conn.info.get("query_stats_started")
+        if started:
+            stats.duration += perf_counter() - started.pop()
+        stats.queries += 1
+        stats.statements[statement] = stats.statements.get(statement, 0) + 1
+        if cursor.rowcount > 0:
+            stats.rows += cursor.rowcount
+
+
+class QueryBudgetExceeded(Exception):
+    """リクエストのクエリ数がルートの上限を超えた（mode="raise" のときリクエストの終了時に送出する）"""
+
+
+class QueryStatsMiddleware:
+    """リクエストごとのSQLの実行回数・DB時間・行数を記録するASGIミドルウェア。
+
+    - メトリクス（db_queries_per_request など）にルートごとに記録する
+    - headers=True なら X-DB-Queries / X-DB-Time-Ms / X-DB-Rows をレスポンスヘッダーに付ける
+      （ヘッダーの送信後に実行したクエリ（StreamingResponse の本文の生成中など）はメトリクスにのみ含まれる）
+    - budgets に "POST /swipe" のような「メソッド ルートのテンプレート」ごとのクエリ数の上限を指定すると、
+      超えたリクエストを mode に応じて警告（"log"）するか、QueryBudgetExceeded を送出（"raise"）する。
+      "raise" はテスト用（TestClient では例外がテストに伝わる。レスポンスは送信済みのため変わらない）
+    - 同じSQL文を repeat_threshold 回以上実行したリクエストは N+1 の疑いとして警告する（0で無効化）
+    - on_finish を指定すると、リクエストの終了時に (メソッド, ルート, QueryStats) で呼ぶ（計測スクリプト用）
+    """
+
+    def __init__(self, app, budgets: Optional[Mapping[str, int]] = None, mode: str = "log", headers: bool = False,
+                 repeat_threshold: int = 5, record_metrics: bool = True,
+                 on_finish: Optional[Callable[[str, str, QueryStats], None]] = None):
+        if mode not in BUDGET_MODES:
+            raise ValueError(f"mode は {BUDGET_MODES} のいずれかです: {mode}")
+        self.app = app
+        self.budgets = dict(budgets or {})
+        self.mode = mode
+        self.headers = headers
+        self.repeat_threshold = repeat_threshold
+        self.record_metrics = record_metrics
+        self.on_finish = on_finish
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = QueryStats()
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                message = dict(message)
+                message["headers"] = [
+                    *message.get("headers", []),
+                    (b"x-db-queries", str(stats.queries).encode()),
+                    (b"x-db-time-ms", f"{stats.duration * 1000:.2f}".encode()),
+                    (b"x-db-rows", str(stats.rows).encode()),
+                ]
+            await send(message)
+
+        token = _CURRENT.set(stats)
+        try:
+            await self.app(scope, receive, send_with_headers if self.headers else send)
+        finally:
+            _CURRENT.reset(token)
+            # ルーティング後に FastAPI が scope["route"] を設定する
+            method = metrics.method_label(scope["method"])
+            route = getattr(scope.get("route"), "path", "unmatched")
+            if self.record_metrics:
+                metrics.DB_QUERIES_PER_REQUEST.labels(method, route).observe(stats.queries)
+                metrics.DB_TIME_PER_REQUEST.labels(method, route).observe(stats.duration)
+                metrics.DB_ROWS_PER_REQUEST.labels(method, route).observe(stats.rows)
+            if self.on_finish is not None:
+                self.on_finish(method, route, stats)
+        self._check(method, route, stats)
+
+    def _check(self, method: str, route: str, stats: QueryStats) -> None:
+        """N+1 の疑いとクエリ数の上限を確認する"""
+        if self.repeat_threshold > 0:
+            statement, repeated = stats.most_repeated()
+            if repeated >= self.repeat_threshold:
+                if self.record_metrics:
+                    metrics.DB_REPEATED_QUERIES.labels(method, route).inc()
+                logger.warning("%s %s で同じSQL文を %d 回実行しました（N+1 の疑い）: %s",
+                               method, route, repeated, " ".join(statement.split())[:200])
+
+        budget = self.budgets.get(f"{method} {route}")
+        if self.mode == "off" or budget is None or stats.queries <= budget:
+            return
+        if self.record_metrics:
+            metrics.DB_QUERY_BUDGET_EXCEEDED.labels(method, route).inc()
+        message = f"{method} {route} で {stats.queries} 件のクエリを実行しました（上限 {budget} 件）"
+        if self.mode == "raise":
+            raise QueryBudgetExceeded(message)
+        logger.warning(message)
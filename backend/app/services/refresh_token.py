@@ -0,0 +1,129 @@
+# リフレッシュトークンの発行・ローテーション・失効を行うファイル
+# リフレッシュトークンは推測できない不透明な文字列で、DBには HMAC-SHA256 のハッシュだけを保存する。
+# アクセストークンの再発行は bcrypt を使わず、ハッシュの一意インデックスを1回引くだけで済む。
+# 使うたびに新しいトークンへ交換（ローテーション）し、使用済みのトークンが再び使われたら
+# 盗用とみなしてその系列のトークンをすべて失効させる。
+# ただし直前に交換したトークンの REFRESH_TOKEN_REUSE_GRACE_SECONDS 以内の再送は、応答を受け取れなかった
+# クライアントの再試行とみなし、未使用の後継を失効させて同じ系列に新しいトークンを発行する（平文のトークンは
+# 保存しないため、発行済みの後継そのものは返せない）。系列の有効なトークンは常に1つだけになる。
+# 猶予が使えるのは1つのトークンにつき1回だけで、2回目以降の再送や、失効させた後継の使用は盗用とみなす。
+import hashlib
+import hmac
+import logging
+import secrets
+from datetime import datetime, timedelta, timezone
+from typing import Tuple
+from uuid import uuid4
+
+from fastapi import HTTPException
+from sqlalchemy.orm import Session
+from starlette.status import HTTP_401_UNAUTHORIZED
+
+from app import repositories
+from app.core.config import settings
+from .principal_cache import Principal
+
+logger = logging.getLogger(__name__)
+
+
+def hash_refresh_token(token: str) -> str:
+    """リフレッシュトークンのハッシュ（DBの検索キー）を返す"""
+    return hmac.new(settings.SECRET_KEY.encode("utf-8"), token.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
+def _as_utc(value: datetime) -> datetime:
+    # SQLite はタイムゾーンを保持しないため、UTCとして扱う
+    return value if value.tzinfo is not None else value.replace(tzinfo=timezone.utc)
+
+
+def issue_refresh_token(db: Session, user_id: int, family_id: str = None, parent_id: int = None) -> str:
+    """リフレッシュトークンを発行して保存（コミット）し、平文のトークンを返す。
+
+    Args:
+        db (Session): データベースセッション。
+        user_id (int): トークンの持ち主。
+        family_id (str, optional): ローテーションの系列ID。省略時はログインごとに新しい系列を作る。
+        parent_id (int, optional): 交換元のトークンのID（ローテーション時）。
+    Returns:
+        str: クライアントに渡すリフレッシュトークン。
+    """
+    token = secrets.token_urlsafe(32)
+    expires_at = datetime.now(timezone.utc) + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS)
+    repositories.add_refresh_token(db, user_id, hash_refresh_token(token), family_id or uuid4().hex, expires_at,
+                                   parent_id)
+    db.commit()
+    return token
+
+
+def rotate_refresh_token(db: Session, token: str) -> Tuple[Principal, str]:
+    """リフレッシュトークンを検証して使用済みにし、同じ系列の新しいトークンを発行する。
+
+    Args:
+        db (Session): データベースセッション。
+        token (str): クライアントが送ったリフレッシュトークン。
+    Returns:
+        Tuple[Principal, str]: トークンの持ち主と、新しいリフレッシュトークン。
+    Raises:
+        HTTPException: 不明・期限切れ・使用済み（再利用）のトークンの場合に401エラー。
+            再利用の場合はその系列のトークンをすべて失効させる（猶予期間内の1回目の再送を除く）。
+    """
+    credentials_exception = HTTPException(
+        status_code=HTTP_401_UNAUTHORIZED,
+        detail="Invalid refresh token",
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+    found = repositories.find_refresh_token(db, hash_refresh_token(token))
+    if found is None:
+        raise credentials_exception
+    record, email = found
+    now = datetime.now(timezone.utc)
+    if _as_utc(record.expires_at) <= now:
+        raise credentials_exception
+    # 未使用のトークンだけを条件付きUPDATEで使用済みにする（同時に送られた場合も成功するのは1回だけ）
+    if record.revoked_at is not None or not repositories.consume_refresh_token(db, record.id, now):
+        if _revoke_successor_within_grace(db, record, now):
+            logger.info("交換済みのリフレッシュトークンが猶予期間内に再送されたため再発行します（user_id=%s）", record.user_id)
+            new_token = issue_refresh_token(db, record.user_id, record.family_id, parent_id=record.id)
+            return Principal(record.user_id, email), new_token
+        revoked = repositories.revoke_refresh_family(db, record.family_id, now)
+        db.commit()
+        logger.warning("リフレッシュトークンの再利用を検知しました（user_id=%s, 失効 %d 件）", record.user_id, revoked)
+        raise credentials_exception
+    new_token = issue_refresh_token(db, record.user_id, record.family_id, parent_id=record.id)
+    return Principal(record.user_id, email), new_token
+
+
+def _revoke_successor_within_grace(db: Session, record, now: datetime) -> bool:
+    """使用済みのトークンの再送が猶予期間内の再試行とみなせる場合に、未使用の後継を失効させて True を返す。
+
+    送られたトークンの交換から REFRESH_TOKEN_REUSE_GRACE_SECONDS 以内で、後継が1つだけかつ未使用の場合に限る。
+    再発行すると後継が2つになるため、同じトークンの2回目の再送は対象外になる。ログアウト・失効済みの系列も対象外。
+    後継の失効は条件付きUPDATEで行い、同時に後継が使われた場合は対象外にする。
+    """
+    if settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS <= 0:
+        return False
+    if record.revoked_at is None:
+        # 同時に送られたリクエストが先に使用済みにした場合、読み込んだ時点の値は古いため読み直す
+        db.refresh(record, attribute_names=["revoked_at"])
+    if record.revoked_at is None:
+        return False
+    if now - _as_utc(record.revoked_at) > timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS):
+        return False
+    children = repositories.child_refresh_tokens(db, record.family_id, record.id)
+    if len(children) != 1 or children[0][1] is not None:
+        return False
+    return repositories.consume_refresh_token(db, children[0][0], now)
+
+
+def revoke_refresh_token(db: Session, token: str) -> None:
+    """リフレッシュトークンの系列を失効させる（ログアウト）。不明なトークンは何もしない"""
+    found = repositories.find_refresh_token(db, hash_refresh_token(token))
+    if found is not None:
+        repositories.revoke_refresh_family(db, found[0].family_id, datetime.now(timezone.utc))
+        db.commit()
+
+
+def revoke_user_refresh_tokens(db: Session, user_id: int) -> None:
+    """ユーザーのリフレッシュトークンをすべて失効させる（パスワード変更・アカウント停止時など）"""
+    repositories.revoke_user_refresh_tokens(db, user_id, datetime.now(timezone.utc))
+    db.commit()
@@ -0,0 +1,121 @@
+# ムード間・ムードと楽器の類似度行列を扱うファイル
+# 辞書の辞書（MOOD_SIMILARITY）の代わりに float32 の密行列と語彙の添字表を持ち、
+# 「Xに似たムード（除外ムードを除く）」を事前計算済みの近傍配列で引けるようにする
+from collections.abc import Mapping
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def top_neighbors(matrix: np.ndarray, k: int) -> np.ndarray:
+    """各行について類似度の高い順に上位k件の列番号を求める（欠損は末尾）。
+
+    同点の場合は列の並び順を保つ（辞書を sorted したときと同じ順序）。
+
+    Args:
+        matrix (np.ndarray): 類似度行列（欠損はNaN）。
+        k (int): 行ごとに保持する近傍数。
+    Returns:
+        np.ndarray: int32[行数, min(k, 列数)] の列番号。
+    """
+    scores = np.where(np.isnan(matrix), -np.inf, matrix)
+    k = min(k, matrix.shape[1])
+    return np.argsort(-scores, axis=1, kind="stable")[:, :k].astype(np.int32)
+
+
+class SimilarityRow(Mapping):
+    """類似度行列の1行を {列名: スコア} の読み取り専用辞書として扱うビュー"""
+
+    def __init__(self, values: np.ndarray, cols: Sequence[str], col_index: Dict[str, int], size: int):
+        self._values = values
+        self._cols = cols
+        self._col_index = col_index
+        self._size = size
+
+    def __getitem__(self, key: str) -> float:
+        j = self._col_index[key]
+        value = self._values[j]
+        if np.isnan(value):
+            raise KeyError(key)
+        return float(value)
+
+    def __iter__(self) -> Iterator[str]:
+        for j in np.flatnonzero(~np.isnan(self._values)):
+            yield self._cols[j]
+
+    def __len__(self) -> int:
+        return self._size
+
+
+class SimilarityTable(Mapping):
+    """float32の類似度行列を MOOD_SIMILARITY と同じ辞書の辞書として扱うビュー。
+
+    neighbors に行ごとの上位K件（top_neighbors の結果）を渡すと、
+    neighbors() は行全体をソートせずに事前計算済みの配列を先頭から辿る。
+    """
+
+    def __init__(self, matrix: np.ndarray, rows: Sequence[str], cols: Sequence[str], neighbors: Optional[np.ndarray] = None):
+        self.matrix = matrix
+        self.rows = list(rows)
+        self.cols = list(cols)
+        self.row_index = {r: i for i, r in enumerate(self.rows)}
+        self.col_index = {c: j for j, c in enumerate(self.cols)}
+        self._neighbors = neighbors
+        self._sizes = (~np.isnan(matrix)).sum(axis=1).tolist() if len(self.rows) else []
+        # 類似度を持つ列の数が多い順（同数なら行の並び順）に並べた行名
+        self.order: List[str] = [self.rows[i] for i in np.argsort(-np.asarray(self._sizes, dtype=np.int64), kind="stable")]
+
+    def __getitem__(self, key: str) -> SimilarityRow:
+        i = self.row_index[key]
+        return SimilarityRow(self.matrix[i], self.cols, self.col_index, self._sizes[i])
+
+    def __contains__(self, key) -> bool:
+        return key in self.row_index
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.rows)
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def neighbors(self, key: str, k: int, exclude: Iterable[str] = ()) -> List[Tuple[str, float]]:
+        """key に類似度の高い列を上位k件、除外対象を除いて返す。
+
+        事前計算済みの近傍配列で足りる場合はそれを辿るだけで済み、
+        除外が多く足りない場合のみ行全体をマスクして argsort する。
+
+        Args:
+            key (str): 行名（ムード）。
+            k (int): 返す件数。
+            exclude (Iterable[str]): 除外する列名。
+        Returns:
+            List[Tuple[str, float]]: (列名, 類似度) のリスト（類似度の降順）。
+        """
+        i = self.row_index.get(key)
+        if i is None or k <= 0:
+            return []
+        row = self.matrix[i]
+        excluded = {self.col_index[c] for c in exclude if c in self.col_index}
+
+        if self._neighbors is not None:
+            result = []
+            candidates = self._neighbors[i].tolist()
+            for j in candidates:
+                score = row[j]
+                if np.isnan(score):
+                    # 以降はすべて欠損
+                    return result
+                if j in excluded:
+                    continue
+                result.append((self.cols[j], float(score)))
+                if len(result) == k:
+                    return result
+            if len(candidates) == len(self.cols):
+                return result
+
+        # 除外ムードをマスクした上でのargsort
+        scores = np.where(np.isnan(row), -np.inf, row)
+        if excluded:
+            scores[list(excluded)] = -np.inf
+        order = np.argsort(-scores, kind="stable")[:k]
+        return [(self.cols[j], float(row[j])) for j in order.tolist() if np.isfinite(scores[j])]
@@ -0,0 +1,95 @@
+# 楽曲カタログの検索用インデックスを定義するファイル
+import random
+from typing import FrozenSet, Iterable, List, Optional, Set
+
+import numpy as np
+
+
+def flatten_tags(tags: dict) -> set:
+    """ジャンル・楽器・ムードなどすべてのタグを1つのsetにまとめる"""
+    return {tag for category in tags.values() for tag in category}
+
+
+class SongIndex:
+    """楽曲カタログの検索用インデックス。
+
+    コンパイル済みカタログ（CompiledCatalog）の上に構築し、以下を参照する。
+    - タグ → 楽曲位置（カタログ内の添字）の転置リスト（昇順）
+    - 楽曲ID → 楽曲位置の対応表
+    - 楽曲ごとのタグ集合
+
+    エンドポイントは全楽曲を走査する代わりにこのインデックスを参照する。
+    配列はメモリマップ上にあるため、ワーカー間で共有される。
+    """
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __len__(self) -> int:
+        return len(self.catalog)
+
+    def song(self, pos: int) -> dict:
+        """楽曲位置から楽曲データを返す"""
+        return self.catalog.song(pos)
+
+    def get(self, song_id: int) -> Optional[dict]:
+        """楽曲IDから楽曲データを返す（存在しない場合はNone）"""
+        pos = int(self.catalog.positions([song_id])[0])
+        return None if pos < 0 else self.catalog.song(pos)
+
+    def songs_by_id(self, song_ids: Iterable[int]) -> List[dict]:
+        """楽曲IDのリストを同じ順の楽曲データのリストに変換する（カタログに無いIDは除く）"""
+        positions = self.catalog.positions(list(song_ids))
+        return self.catalog.songs(positions[positions >= 0])
+
+    def positions_of(self, song_ids: Iterable[int]) -> Set[int]:
+        """楽曲IDの集合をカタログ内の位置の集合に変換する（未知のIDは無視）"""
+        positions = self.catalog.positions(list(song_ids))
+        return set(positions[positions >= 0].tolist())
+
+    def with_tag(self, tag: str) -> np.ndarray:
+        """指定タグを持つ楽曲の位置の配列（カタログ順＝昇順）を返す。
+
+        メモリマップ上の転置リストのスライスをそのまま返すため、リストには変換しない
+        （呼び出し側で走査するか、np.isin・searchsorted で絞り込む）。
+        """
+        j = self.catalog.tag_index.get(tag)
+        return self.catalog.tag_postings[:0] if j is None else self.catalog.postings(j)
+
+    def tags(self, pos: int) -> FrozenSet[str]:
+        """楽曲位置に対応するタグ集合を返す"""
+        names = self.catalog.tags
+        return frozenset(names[j] for j in self.catalog.song_tags(pos).tolist())
+
+    def songs_at(self, positions: Iterable[int]) -> List[dict]:
+        """楽曲位置の集合をカタログ順の楽曲データのリストに変換する"""
+        return self.catalog.songs(sorted(positions))
+
+    def sample_excluding(self, excluded: Set[int], k: int) -> List[int]:
+        """除外集合に含まれない楽曲位置を重複なしで最大k件ランダムに選ぶ。
+
+        残りの楽曲が十分多い場合は棄却サンプリングで選び、
+        除外対象がカタログの大半を占める場合のみ候補リストを作る。
+
+        Args:
+            excluded (Set[int]): 除外する楽曲位置の集合。
+            k (int): 選ぶ件数。
+        Returns:
+            List[int]: 選ばれた楽曲位置のリスト。
+        """
+        n = len(self.catalog)
+        remaining = n - len(excluded)
+        k = min(k, remaining)
+        if k <= 0:
+            return []
+        if remaining >= 2 * k and remaining * 2 >= n:
+            chosen: List[int] = []
+            seen: Set[int] = set()
+            while len(chosen) < k:
+                pos = random.randrange(n)
+                if pos in excluded or pos in seen:
+                    continue
+                seen.add(pos)
+                chosen.append(pos)
+            return chosen
+        return random.sample([p for p in range(n) if p not in excluded], k=k)
@@ -0,0 +1,200 @@
+# スワイプ履歴（swipe_history）の書き込みを遅延・集約するファイル
+# /swipe ごとに INSERT + COMMIT（fsync）する代わりに、イベントをメモリに溜めて
+# 件数または経過時間のしきい値でまとめて複数行INSERTする（ライトビハインド）。
+# 未書き込みのイベントは pending() で参照でき、本人の読み取りには即座に反映される（read-your-writes）。
+# - 行の内容が原因でDBに拒否されたバッチ（削除済みユーザーへの外部キー違反など）は二分して書き直し、
+#   それでも書けない行だけをデッドレターとして記録・破棄する（1行のために他の全員の書き込みを止めない）
+# - 接続断などでバッチ全体が書けない間はバッファに戻して再試行し、バッファが max_buffer 件に達したら
+#   追加側を最大 append_timeout 秒待たせ（背圧）、それでも空かなければ SwipeLogFull を送出する
+# プロセスが異常終了した場合、最大でしきい値分の未書き込みイベントが失われる。
+import logging
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from sqlalchemy.exc import DataError, IntegrityError
+
+from app import repositories
+
+logger = logging.getLogger(__name__)
+
+
+class SwipeLogFull(Exception):
+    """書き込みが滞ってバッファが上限に達し、待っても空かなかった"""
+
+
+class SwipeLogWriter:
+    """スワイプイベントのライトビハインド書き込み器（追記専用）"""
+
+    def __init__(self, session_factory: Callable, max_batch: int = 500, flush_interval: float = 0.5,
+                 max_buffer: int = 50000, append_timeout: float = 5.0):
+        """
+        Args:
+            session_factory (Callable): DBセッションを生成する関数（SessionLocal）。
+            max_batch (int): この件数溜まったら書き込む。
+            flush_interval (float): 最後の書き込みからこの秒数が経ったら書き込む。
+            max_buffer (int): 未書き込みのイベントの上限（書き込み中の分を含む）。
+            append_timeout (float): 上限に達したとき、追加側が空きを待つ最大の秒数。
+        """
+        self.session_factory = session_factory
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.append_timeout = append_timeout
+        self._buffer: List[dict] = []
+        # 書き込み中（未コミット）のイベント。コミットまでは pending() に含める
+        self._inflight: List[dict] = []
+        # ユーザーごとの未書き込みのイベント（追加順。pending() をバッファ全体の走査にしないため）
+        self._by_user: Dict[int, List[dict]] = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        # 書き込みでバッファに空きができたことを追加側に知らせる
+        self._space = threading.Condition(self._lock)
+        # 書き込み自体を直列化する（バックグラウンドスレッドと flush() の呼び出しが重ならないように）
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._closed = False
+        # 書き込めなかった行（直近の分のみ保持する。調査用）
+        self.dead_letters = deque(maxlen=1000)
+        self.counters: Dict[str, int] = {
+            "appended": 0, "flushed": 0, "batches": 0, "failures": 0, "dead_lettered": 0, "rejected": 0,
+        }
+
+    def start(self) -> None:
+        """バックグラウンドの書き込みスレッドを起動する"""
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="swipe-log", daemon=True)
+                self._thread.start()
+
+    def append(self, user_id: int, song_id: int, liked: bool) -> None:
+        """スワイプイベントを1件追加する"""
+        self.extend(user_id, [(song_id, liked)])
+
+    def extend(self, user_id: int, outcomes: Iterable[Tuple[int, bool]]) -> None:
+        """1ユーザー分のスワイプイベントをまとめて追加する。
+
+        Raises:
+            SwipeLogFull: バッファが上限に達し、append_timeout 秒待っても空かなかった場合（イベントは追加しない）。
+        """
+        rows = [{"user_id": user_id, "song_id": song_id, "liked": liked} for song_id, liked in outcomes]
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            deadline = time.monotonic() + self.append_timeout
+            while self._size() + len(rows) > self.max_buffer and self._size() > 0:
+                self._wakeup.notify()
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["rejected"] += len(rows)
+                    raise SwipeLogFull(f"スワイプログの未書き込みのイベントが上限（{self.max_buffer}件）に達しています")
+                self._space.wait(remaining)
+            self._buffer.extend(rows)
+            self._by_user.setdefault(user_id, []).extend(rows)
+            self.counters["appended"] += len(rows)
+            if len(self._buffer) >= self.max_batch:
+                self._wakeup.notify()
+
+    def _size(self) -> int:
+        return len(self._buffer) + len(self._inflight)
+
+    def pending(self, user_id: int) -> List[Tuple[int, bool]]:
+        """まだコミットされていないユーザーのイベント（楽曲ID, Likeしたか）を追加順に返す"""
+        with self._lock:
+            return [(r["song_id"], r["liked"]) for r in self._by_user.get(user_id, ())]
+
+    def _forget(self, rows: List[dict]) -> None:
+        """書き込み済み・破棄した行を未書き込みの一覧から除く（_lock を取得して呼ぶ）"""
+        for row in rows:
+            user_rows = self._by_user.get(row["user_id"])
+            if user_rows is None:
+                continue
+            for i, other in enumerate(user_rows):
+                if other is row:
+                    del user_rows[i]
+                    break
+            if not user_rows:
+                del self._by_user[row["user_id"]]
+
+    def _write(self, rows: List[dict]) -> Tuple[List[dict], List[dict]]:
+        """行を書き込み、(書き込んだ行, 再試行する行) を返す。
+
+        行の内容が原因の失敗（制約違反・不正な値）なら二分して書き直し、1行でも書けない行はデッドレターにする。
+        それ以外の失敗（接続断など）は全行を再試行に回す。
+        """
+        try:
+            with self.session_factory() as db:
+                repositories.bulk_insert_swipes(db, rows)
+                db.commit()
+            return rows, []
+        except (IntegrityError, DataError) as e:
+            if len(rows) == 1:
+                logger.error("スワイプ履歴の行を書き込めないため破棄します: %s (%s)", rows[0], e.orig)
+                self.dead_letters.append(rows[0])
+                self.counters["dead_lettered"] += 1
+                return [], []
+            middle = len(rows) // 2
+            written, retry = self._write(rows[:middle])
+            written_rest, retry_rest = self._write(rows[middle:])
+            return written + written_rest, retry + retry_rest
+        except Exception:
+            logger.exception("スワイプ履歴の書き込みに失敗しました（%d件、再試行します）", len(rows))
+            return [], rows
+
+    def flush(self) -> int:
+        """溜まっているイベントを複数行INSERTで書き込み、書き込んだ件数を返す。
+
+        書き込めなかった行（デッドレターにした行を除く）はバッファの先頭に戻し、次回の書き込みで再試行する。
+        """
+        with self._flush_lock:
+            with self._lock:
+                if not self._buffer:
+                    return 0
+                self._inflight, self._buffer = self._buffer, []
+                rows = self._inflight
+            written, retry = self._write(rows)
+            retry_ids = {id(row) for row in retry}
+            with self._lock:
+                self._buffer[:0] = retry
+                self._inflight = []
+                self._forget([row for row in rows if id(row) not in retry_ids])
+                if retry:
+                    self.counters["failures"] += 1
+                if written:
+                    self.counters["flushed"] += len(written)
+                    self.counters["batches"] += 1
+                self._space.notify_all()
+            return len(written)
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._closed and len(self._buffer) < self.max_batch:
+                    self._wakeup.wait(self.flush_interval)
+                closed = self._closed
+            written = self.flush()
+            if closed:
+                return
+            if not written and self._buffer:
+                # 書き込みに失敗した直後は間隔を空けて再試行する
+                time.sleep(self.flush_interval)
+
+    def close(self, retries: int = 3) -> None:
+        """バックグラウンドスレッドを止め、残っているイベントを書き込む（シャットダウン時に呼ぶ）。
+
+        書き込みに失敗した場合は retries 回まで間隔を空けて再試行し、それでも残った件数をログに出す。
+        """
+        with self._lock:
+            self._closed = True
+            self._wakeup.notify()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
+        for attempt in range(retries + 1):
+            self.flush()
+            if not self._buffer:
+                return
+            if attempt < retries:
+                time.sleep(self.flush_interval)
+        logger.error("スワイプ履歴 %d 件を書き込めないまま終了します", len(self._buffer))
@@ -0,0 +1,110 @@
+# スワイプ候補の先読みキューを定義するファイル
+# /swipe の「次の1曲」の選び方（探索フェーズごとの方針）を N 曲分に拡張したもの。
+# クライアントは数曲分を先読みしておき、スワイプ結果はまとめて送る。
+import heapq
+import random
+from time import perf_counter
+from typing import Callable, Iterable, List, Optional, Set
+
+import numpy as np
+
+from .metrics import SWIPE_RANK_DURATION
+from .swipe_session import PHASE_INSTRUMENT, PHASE_MOOD, PHASE_RANDOM, SwipeSession
+
+# 1回に返すキューの長さの上限
+MAX_QUEUE_SIZE = 50
+
+# 探索フェーズごとの候補の選択時間
+_RANK_DURATION = {phase: SWIPE_RANK_DURATION.labels(phase) for phase in (PHASE_MOOD, PHASE_INSTRUMENT, PHASE_RANDOM)}
+
+
+class SwipeQueue:
+    """探索フェーズに応じてスワイプ候補を順位付けする。
+
+    - ムード探索: 類似度を持つムード数の多い順に、各ムードの未スワイプ曲をランダムな順で並べる
+    - 楽器探索: Like曲のムードと相性の良い楽器上位2つを持つ曲をカタログ順に並べる
+    - それ以降: （nearest が与えられていれば）Like曲の埋め込みに近い順、なければランダム
+    いずれも足りない分はランダムな未スワイプ曲で埋める。
+    """
+
+    def __init__(self, song_index, mood_similarity, mood_inst_similarity,
+                 nearest: Optional[Callable[..., List[int]]] = None):
+        self.song_index = song_index
+        self.mood_similarity = mood_similarity
+        self.mood_inst_similarity = mood_inst_similarity
+        # nearest(liked, k, exclude=...) -> 楽曲位置のリスト
+        self.nearest = nearest
+
+    def top_instruments(self, liked: Iterable[int], k: int = 2) -> List[str]:
+        """Like曲のタグと相性の良い楽器を、相性スコアの合計の降順で返す"""
+        counter = {}
+        for pos in sorted(liked):
+            for mood in self.song_index.tags(pos):
+                for inst, score in self.mood_inst_similarity.get(mood, {}).items():
+                    counter[inst] = counter.get(inst, 0) + score
+        return [inst for inst, _ in sorted(counter.items(), key=lambda x: -x[1])[:k]]
+
+    def _by_mood(self, taken: Set[int], n: int) -> List[int]:
+        chosen: List[int] = []
+        excluded = np.fromiter(taken, dtype=np.int64, count=len(taken))
+        for mood in self.mood_similarity.order:
+            postings = self.song_index.with_tag(mood)
+            pool = postings[~np.isin(postings, excluded)] if len(excluded) else postings
+            # 先に選んだムードの曲（高々 len(chosen) 曲）と重なる分を見込んで多めに引き、重なりを除く
+            need = n - len(chosen)
+            for i in random.sample(range(len(pool)), k=min(need + len(chosen), len(pool))):
+                pos = int(pool[i])
+                if pos not in taken:
+                    chosen.append(pos)
+                    taken.add(pos)
+                    if len(chosen) >= n:
+                        break
+            if len(chosen) >= n:
+                break
+        return chosen
+
+    def _by_instrument(self, liked: Set[int], taken: Set[int], n: int) -> List[int]:
+        chosen: List[int] = []
+        postings = [self.song_index.with_tag(inst) for inst in self.top_instruments(liked)]
+        previous = None
+        for pos in heapq.merge(*postings):
+            if pos == previous or pos in taken:
+                continue
+            previous = pos
+            chosen.append(int(pos))
+            if len(chosen) >= n:
+                break
+        taken.update(chosen)
+        return chosen
+
+    def rank(self, session: SwipeSession, liked: Set[int], swiped: Set[int], n: int,
+             keep: Iterable[int] = ()) -> List[int]:
+        """次にスワイプさせる楽曲の位置を最大n件、提示順に返す。
+
+        Args:
+            session (SwipeSession): ユーザーのスワイプ状態（探索フェーズの判定に使う）。
+            liked (Set[int]): Likeした曲の位置。
+            swiped (Set[int]): スワイプ済みの曲の位置（候補から除く）。
+            n (int): 返す件数。
+            keep (Iterable[int]): 先頭にそのまま残す位置（同じフェーズで先読み済みのキュー）。
+        Returns:
+            List[int]: 楽曲位置のリスト。
+        """
+        started = perf_counter()
+        chosen = [p for p in dict.fromkeys(keep) if p not in swiped][:n]
+        taken = set(swiped) | set(chosen)
+        need = n - len(chosen)
+        if need > 0:
+            if session.phase == PHASE_MOOD:
+                chosen += self._by_mood(taken, need)
+            elif session.phase == PHASE_INSTRUMENT:
+                chosen += self._by_instrument(liked, taken, need)
+            elif self.nearest is not None:
+                picks = self.nearest(liked, k=need, exclude=taken)
+                chosen += picks
+                taken.update(picks)
+        need = n - len(chosen)
+        if need > 0:
+            chosen += self.song_index.sample_excluding(taken, k=need)
+        _RANK_DURATION[session.phase].observe(perf_counter() - started)
+        return chosen
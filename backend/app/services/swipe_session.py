@@ -0,0 +1,293 @@
+# ユーザーごとのスワイプ状態（スワイプ済み・Like済みの楽曲IDと探索フェーズ）をキャッシュするファイル
+# /swipe のたびに SwipeHistory を全件読み直す代わりに、キャッシュミス時のみDBから復元し、
+# 以降はスワイプごとに差分だけを反映する
+# スワイプ履歴をライトビハインドで書き込む場合（swipe_log）は、未書き込みのイベントも復元に含める
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Iterable, List, Optional, Sequence, Set, Tuple
+
+from sqlalchemy.orm import Session
+
+from app import repositories
+
+from .metrics import CACHE_LOOKUPS
+
+# 探索フェーズ（Like数で決まる）
+PHASE_MOOD = "mood"              # Like 3曲未満：ムード探索
+PHASE_INSTRUMENT = "instrument"  # Like 5曲未満：楽器探索
+PHASE_RANDOM = "random"          # それ以降：ランダム
+
+_SESSION_HIT = CACHE_LOOKUPS.labels("swipe_session", "hit")
+_SESSION_MISS = CACHE_LOOKUPS.labels("swipe_session", "miss")
+
+
+def phase_for(liked_count: int) -> str:
+    """Like数から探索フェーズを決める"""
+    if liked_count < 3:
+        return PHASE_MOOD
+    if liked_count < 5:
+        return PHASE_INSTRUMENT
+    return PHASE_RANDOM
+
+
+class SwipeSession:
+    """1ユーザー分のスワイプ状態"""
+
+    def __init__(self, user_id: int, swiped: Iterable[int] = (), liked: Iterable[int] = ()):
+        self.user_id = user_id
+        self.swiped: Set[int] = set(swiped)
+        self.liked: Set[int] = set(liked)
+        self.phase = phase_for(len(self.liked))
+
+    def add(self, song_id: int, liked: bool) -> None:
+        """スワイプ結果を1件反映する"""
+        self.swiped.add(song_id)
+        if liked:
+            self.liked.add(song_id)
+        self.phase = phase_for(len(self.liked))
+
+    def changes(self, song_id: int, liked: bool) -> bool:
+        """スワイプ結果が状態を変えるか（Like済みの曲、Dislike済みの曲への Dislike は変えない）"""
+        return song_id not in self.liked and (liked or song_id not in self.swiped)
+
+    def apply(self, outcomes: Iterable[Tuple[int, bool]]) -> List[Tuple[int, bool]]:
+        """状態を変えるスワイプ結果だけを反映し、反映したものを返す"""
+        applied = []
+        for song_id, liked in outcomes:
+            if self.changes(song_id, liked):
+                self.add(song_id, liked)
+                applied.append((song_id, liked))
+        return applied
+
+    def copy(self) -> "SwipeSession":
+        return SwipeSession(self.user_id, self.swiped, self.liked)
+
+
+class InMemorySessionBackend:
+    """プロセス内のLRU+TTLキャッシュ。
+
+    単一ワーカー構成向け。複数ワーカーで同じユーザーを扱う場合は RedisSessionBackend を使う。
+    """
+
+    def __init__(self, maxsize: int = 10000, ttl: float = 1800):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries: "OrderedDict[int, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[SwipeSession]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            expires_at, session = entry
+            if expires_at < time.monotonic():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            # 他スレッドの更新と競合しないようコピーを返す
+            return session.copy()
+
+    def add(self, session: SwipeSession) -> SwipeSession:
+        """未キャッシュの場合のみ状態を載せ、キャッシュ上の状態を返す（他のリクエストが先に載せていればそちら）"""
+        with self._lock:
+            entry = self._entries.get(session.user_id)
+            if entry is not None and entry[0] >= time.monotonic():
+                self._entries.move_to_end(session.user_id)
+                return entry[1].copy()
+            self._entries[session.user_id] = (time.monotonic() + self.ttl, session.copy())
+            self._entries.move_to_end(session.user_id)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+            return session
+
+    def record(self, user_id: int, outcomes: Sequence[Tuple[int, bool]]) -> Optional[Tuple[SwipeSession, List[Tuple[int, bool]]]]:
+        """キャッシュ済みの場合のみ状態を変えるスワイプ結果を反映し、(更新後の状態, 反映した結果) を返す（未キャッシュならNone）"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                return None
+            session = entry[1]
+            applied = session.apply(outcomes)
+            self._entries[user_id] = (time.monotonic() + self.ttl, session)
+            self._entries.move_to_end(user_id)
+            return session.copy(), applied
+
+    def invalidate(self, user_id: int) -> None:
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+
+class RedisSessionBackend:
+    """Redisプロトコルの共有ストアに状態を置くバックエンド。
+
+    複数ワーカー・複数ノードで同じユーザーを扱える。client には redis-py 互換の
+    オブジェクト（redis.Redis やローカル検証用の fakeredis.FakeRedis など）を渡す。
+
+    キー構成（user_id ごと）:
+        {prefix}{user_id}:swiped  スワイプ済みの楽曲ID（SET）
+        {prefix}{user_id}:liked   Like済みの楽曲ID（SET）
+        {prefix}{user_id}:loaded  DBから復元済みであることを示すマーカー
+
+    loaded の確認と SET の更新は WATCH/MULTI の1トランザクションで行い、途中で期限切れ・復元が
+    挟まった場合はやり直す（swiped だけ・loaded だけが残る中途半端な状態を作らない）。
+    """
+
+    # 復元時に1コマンドで送るSETの要素数
+    CHUNK_SIZE = 5000
+
+    def __init__(self, client, ttl: int = 1800, prefix: str = "swipe_session:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    @classmethod
+    def from_url(cls, url: str, **kwargs) -> "RedisSessionBackend":
+        import redis  # Redisバックエンドを使う場合のみ必要
+
+        return cls(redis.Redis.from_url(url), **kwargs)
+
+    def _keys(self, user_id: int):
+        base = f"{self.prefix}{user_id}"
+        return f"{base}:loaded", f"{base}:swiped", f"{base}:liked"
+
+    def get(self, user_id: int) -> Optional[SwipeSession]:
+        loaded, swiped, liked = self._keys(user_id)
+        pipe = self.client.pipeline()
+        pipe.exists(loaded)
+        pipe.smembers(swiped)
+        pipe.smembers(liked)
+        exists, swiped_ids, liked_ids = pipe.execute()
+        if not exists:
+            return None
+        return SwipeSession(user_id, (int(i) for i in swiped_ids), (int(i) for i in liked_ids))
+
+    def _read(self, pipe, user_id: int) -> Optional[SwipeSession]:
+        """WATCH 中のパイプラインで現在の状態を読む（loaded が無ければNone）"""
+        loaded, swiped, liked = self._keys(user_id)
+        if not pipe.exists(loaded):
+            return None
+        return SwipeSession(user_id, (int(i) for i in pipe.smembers(swiped)), (int(i) for i in pipe.smembers(liked)))
+
+    def add(self, session: SwipeSession) -> SwipeSession:
+        """未キャッシュの場合のみ状態を載せ、キャッシュ上の状態を返す（他のワーカーが先に載せていればそちら）"""
+        user_id = session.user_id
+        loaded, swiped, liked = self._keys(user_id)
+
+        def transaction(pipe):
+            current = self._read(pipe, user_id)
+            if current is not None:
+                return current
+            pipe.multi()
+            pipe.delete(swiped, liked)
+            for key, ids in ((swiped, list(session.swiped)), (liked, list(session.liked))):
+                for start in range(0, len(ids), self.CHUNK_SIZE):
+                    pipe.sadd(key, *ids[start:start + self.CHUNK_SIZE])
+            pipe.set(loaded, 1)
+            for key in (loaded, swiped, liked):
+                pipe.expire(key, self.ttl)
+            return session
+
+        return self.client.transaction(transaction, loaded, swiped, liked, value_from_callable=True)
+
+    def record(self, user_id: int, outcomes: Sequence[Tuple[int, bool]]) -> Optional[Tuple[SwipeSession, List[Tuple[int, bool]]]]:
+        loaded, swiped, liked_key = self._keys(user_id)
+
+        def transaction(pipe):
+            session = self._read(pipe, user_id)
+            if session is None:
+                return None
+            applied = session.apply(outcomes)
+            pipe.multi()
+            if applied:
+                pipe.sadd(swiped, *(song_id for song_id, _ in applied))
+            liked_ids = [song_id for song_id, liked in applied if liked]
+            if liked_ids:
+                pipe.sadd(liked_key, *liked_ids)
+            for key in (loaded, swiped, liked_key):
+                pipe.expire(key, self.ttl)
+            return session, applied
+
+        return self.client.transaction(transaction, loaded, swiped, liked_key, value_from_callable=True)
+
+    def invalidate(self, user_id: int) -> None:
+        self.client.delete(*self._keys(user_id))
+
+
+class SwipeSessionStore:
+    """スワイプ状態の取得・更新をまとめる窓口。キャッシュミス時のみDBから復元する。"""
+
+    def __init__(self, backend, pending: Optional[Callable[[int], List[Tuple[int, bool]]]] = None):
+        """
+        Args:
+            backend: キャッシュのバックエンド。
+            pending (Callable, optional): ユーザーIDを受け取り、DBに未書き込みのスワイプ結果を返す関数
+                （SwipeLogWriter.pending）。復元時にDBの履歴へ重ねる。
+        """
+        self.backend = backend
+        self.pending = pending
+
+    def hydrate(self, db: Session, user_id: int) -> SwipeSession:
+        """SwipeHistory（と未書き込みのイベント）から状態を復元してキャッシュに載せる。
+
+        復元中に他のリクエストが先にキャッシュへ載せた場合は、そちら（以降の差分を反映済み）を返す。
+        """
+        # 未書き込み分を先に取る。後に取ると、間に書き込みが完了したイベントがどちらにも現れない。
+        # 先に取れば重複はあり得るが、集合に入れるので結果は変わらない
+        pending = self.pending(user_id) if self.pending is not None else []
+        rows = list(repositories.swipe_states(db, user_id)) + pending
+        session = SwipeSession(
+            user_id,
+            swiped=(song_id for song_id, _ in rows),
+            liked=(song_id for song_id, liked in rows if liked),
+        )
+        return self.backend.add(session)
+
+    def get(self, db: Session, user_id: int) -> SwipeSession:
+        """ユーザーのスワイプ状態を返す"""
+        session = self.backend.get(user_id)
+        if session is None:
+            _SESSION_MISS.inc()
+            return self.hydrate(db, user_id)
+        _SESSION_HIT.inc()
+        return session
+
+    def record(self, db: Session, user_id: int, song_id: int, liked: bool) -> Tuple[SwipeSession, List[Tuple[int, bool]]]:
+        """スワイプ結果を反映し、(反映後の状態, 反映した結果) を返す（record_many を参照）"""
+        return self.record_many(db, user_id, [(song_id, liked)])
+
+    def record_many(self, db: Session, user_id: int,
+                    outcomes: Sequence[Tuple[int, bool]]) -> Tuple[SwipeSession, List[Tuple[int, bool]]]:
+        """複数のスワイプ結果（楽曲ID, Likeしたか）のうち状態を変えるものだけを反映し、(反映後の状態, 反映した結果) を返す。
+
+        確認と反映はバックエンドで不可分に行うため、同じユーザーの同時リクエスト（再送、/swipe と /swipe/batch）が
+        同じ結果を送っても、反映した結果として返すのはどちらか一方だけになる。反映した結果を記録（スワイプログへの追加）する。
+        未キャッシュなら履歴から復元してから反映する。
+        """
+        result = self.backend.record(user_id, outcomes)
+        if result is not None:
+            _SESSION_HIT.inc()
+            return result
+        _SESSION_MISS.inc()
+        while result is None:
+            self.hydrate(db, user_id)
+            result = self.backend.record(user_id, outcomes)
+        return result
+
+    def invalidate(self, user_id: int) -> None:
+        self.backend.invalidate(user_id)
+
+
+def create_swipe_session_store(settings, pending: Optional[Callable[[int], List[Tuple[int, bool]]]] = None) -> SwipeSessionStore:
+    """設定に応じたバックエンドでスワイプ状態ストアを生成する"""
+    if settings.SWIPE_SESSION_BACKEND == "redis":
+        if not settings.REDIS_URL:
+            raise ValueError("SWIPE_SESSION_BACKEND=redis には REDIS_URL の設定が必要です")
+        backend = RedisSessionBackend.from_url(settings.REDIS_URL, ttl=settings.SWIPE_SESSION_TTL_SECONDS)
+    else:
+        backend = InMemorySessionBackend(
+            maxsize=settings.SWIPE_SESSION_MAX_USERS,
+            ttl=settings.SWIPE_SESSION_TTL_SECONDS,
+        )
+    return SwipeSessionStore(backend, pending=pending)
@@ -0,0 +1,127 @@
+# multipart/form-data のアップロードを、リクエスト本文を読みながら保存先に書き込むファイル
+# UploadFile（Starlette のフォーム解析）はファイル全体を一時ファイルに溜めてからエンドポイントに渡すため、
+# エンドポイントで read() すると全体が bytes としてメモリに載る。ここでは本文のチャンクを
+# そのまま UploadWriter に渡し（書き込みとハッシュ計算を同時に行う）、上限サイズを超えた時点で打ち切る。
+import asyncio
+from concurrent.futures import Executor
+from typing import List, Optional
+
+from fastapi import HTTPException, Request
+from multipart.multipart import MultipartParseError, MultipartParser, parse_options_header
+from starlette.concurrency import run_in_threadpool
+from starlette.status import HTTP_400_BAD_REQUEST, HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+from .upload_store import StoredImage, UploadStore, UploadTooLarge
+
+# multipart の境界・ヘッダー・他のフィールドの分として、本文全体に上限サイズに加えて許容するバイト数
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _too_large(max_bytes: int) -> HTTPException:
+    return HTTPException(
+        status_code=HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"画像のサイズが上限（{max_bytes // (1024 * 1024)}MB）を超えています",
+    )
+
+
+async def receive_upload(
+    request: Request,
+    store: UploadStore,
+    max_bytes: int,
+    field_name: str = "file",
+    executor: Optional[Executor] = None,
+) -> StoredImage:
+    """リクエスト本文（multipart/form-data）の画像ファイルを、読みながら保存する。
+
+    Content-Length が上限を超えていれば本文を読む前に、チャンク転送などで途中から超えた場合は
+    その時点で 413 を返す。ファイルの書き込みはスレッドプール、デコードとレンディションの作成は
+    executor で行う。
+
+    Args:
+        request (Request): リクエスト。
+        store (UploadStore): 保存先。
+        max_bytes (int): 画像ファイルの上限サイズ（バイト）。
+        field_name (str): 画像ファイルのフォームフィールド名。
+        executor (Executor, optional): デコード・レンディション作成を行うExecutor。
+    Returns:
+        StoredImage: 保存した画像。
+    Raises:
+        HTTPException: 上限を超えた場合は413、multipart として不正・ファイルが無い・画像として読み込めない場合は400。
+    """
+    content_type, options = parse_options_header(request.headers.get("content-type", ""))
+    boundary = options.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="multipart/form-data で送信してください")
+    max_body = max_bytes + MULTIPART_OVERHEAD
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_body:
+        raise _too_large(max_bytes)
+
+    writer = await run_in_threadpool(store.writer, max_bytes)
+    try:
+        pending: List[bytes] = []
+        state = {"headers": [], "name": b"", "value": b"", "target": False, "found": False, "complete": False}
+
+        def on_part_begin():
+            state["headers"] = []
+
+        def on_header_field(data, start, end):
+            state["name"] += data[start:end]
+
+        def on_header_value(data, start, end):
+            state["value"] += data[start:end]
+
+        def on_header_end():
+            state["headers"].append((state["name"].lower(), state["value"]))
+            state["name"], state["value"] = b"", b""
+
+        def on_headers_finished():
+            disposition = dict(state["headers"]).get(b"content-disposition", b"")
+            _, params = parse_options_header(disposition)
+            # 同名のファイルが複数ある場合は最初の1つだけを使う
+            state["target"] = (
+                not state["found"] and params.get(b"name") == field_name.encode() and b"filename" in params
+            )
+            state["found"] = state["found"] or state["target"]
+
+        def on_part_data(data, start, end):
+            if state["target"]:
+                pending.append(data[start:end])
+
+        def on_part_end():
+            if state["target"]:
+                state["complete"] = True
+            state["target"] = False
+
+        parser = MultipartParser(boundary, {
+            "on_part_begin": on_part_begin,
+            "on_header_field": on_header_field,
+            "on_header_value": on_header_value,
+            "on_header_end": on_header_end,
+            "on_headers_finished": on_headers_finished,
+            "on_part_data": on_part_data,
+            "on_part_end": on_part_end,
+        })
+        received = 0
+        async for chunk in request.stream():
+            received += len(chunk)
+            if received > max_body:
+                raise _too_large(max_bytes)
+            try:
+                parser.write(chunk)
+            except MultipartParseError:
+                raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail="multipart の形式が不正です")
+            if pending:
+                # 書き込みはイベントループを止めないようスレッドで行う
+                chunks, pending = pending, []
+                await run_in_threadpool(writer.write_many, chunks)
+        if not state["complete"]:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=f"画像ファイル（{field_name}）がありません")
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, writer.commit)
+        except ValueError as e:
+            raise HTTPException(status_code=HTTP_400_BAD_REQUEST, detail=f"画像の読み込みに失敗しました: {str(e)}")
+    except UploadTooLarge:
+        raise _too_large(max_bytes)
+    finally:
+        await run_in_threadpool(writer.discard)
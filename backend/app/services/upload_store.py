@@ -0,0 +1,413 @@
+# アップロード画像を内容ハッシュ（SHA-256）をキーに保存し、配信するファイル
+# 同じ画像を何度アップロードしてもディスク上は1つだけ保存する。
+# 保存時に履歴画面用のサムネイルとプレビュー（縮小JPEG）も作成しておき、
+# 一覧ではフル解像度の原画像をダウンロードさせない。
+# パスに内容ハッシュを含むファイルは内容が変わらないため、強いETagと immutable で長期キャッシュさせる。
+#   uploads/original/<先頭2文字>/<ハッシュ>.<拡張子>
+#   uploads/thumb/<先頭2文字>/<ハッシュ>.jpg
+#   uploads/preview/<先頭2文字>/<ハッシュ>.jpg
+# 受信したデータは一時ファイル（uploads/incoming/）にチャンク単位で書きながらハッシュを計算し、
+# デコードはその一時ファイルをメモリマップして行う（アップロード全体をbytesとして持たない）。
+# 既存の uploads/{uuid}_{filename} 形式の画像は python -m app.services.upload_store で移行する。
+import hashlib
+import io
+import mmap
+import mimetypes
+import os
+import re
+import tempfile
+from typing import Dict, Iterator, Mapping, Optional, Tuple
+
+from PIL import Image
+from sqlalchemy import select, update
+from sqlalchemy.orm import Session
+from starlette.responses import FileResponse, Response, StreamingResponse
+
+from app.models import PhotoUpload, PlaylistHistory
+
+from .image_preprocess import downscale_image
+
+# 公開パス（/uploads/... のURL、DBの image_path）の先頭
+PUBLIC_PREFIX = "uploads"
+# 原画像の形式ごとの拡張子（これ以外の形式はJPEGに変換して保存する）
+ORIGINAL_EXTENSIONS = {"JPEG": ".jpg", "PNG": ".png", "WEBP": ".webp", "GIF": ".gif"}
+# 内容ハッシュで保存したファイルのキャッシュ指定（内容が変わらないため1年・immutable）
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+# 内容ハッシュを持たない旧形式のファイル（uploads/{uuid}_{filename}）は毎回ETagで再検証させる
+LEGACY_CACHE_CONTROL = "public, no-cache"
+# Rangeリクエストで送るとき・ファイルから取り込むときの読み込み単位
+CHUNK_SIZE = 64 * 1024
+# 受信中のアップロードを置くディレクトリ（保存先と同じファイルシステムに置き、rename で確定する）
+INCOMING_DIRNAME = "incoming"
+
+_HASHED_PATH = re.compile(r"^(original|thumb|preview)/[0-9a-f]{2}/([0-9a-f]{64})\.[a-z]+$")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class StoredImage:
+    """保存した画像の内容ハッシュと、原画像・各レンディションの公開パス（例: uploads/thumb/ab/<ハッシュ>.jpg）"""
+
+    __slots__ = ("content_hash", "original_path", "thumbnail_path", "preview_path")
+
+    def __init__(self, content_hash: str, original_path: str, thumbnail_path: str, preview_path: str):
+        self.content_hash = content_hash
+        self.original_path = original_path
+        self.thumbnail_path = thumbnail_path
+        self.preview_path = preview_path
+
+
+class UploadTooLarge(Exception):
+    """アップロードが上限サイズを超えた"""
+
+    def __init__(self, max_bytes: int):
+        super().__init__(f"upload exceeds {max_bytes} bytes")
+        self.max_bytes = max_bytes
+
+
+class UploadWriter:
+    """受信中のアップロード。一時ファイルに書き込みながらSHA-256とサイズを数える。
+
+    with 文で使い、commit() せずに抜けた場合（上限超過・切断など）は一時ファイルを削除する。
+    """
+
+    def __init__(self, store: "UploadStore", max_bytes: Optional[int] = None):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.size = 0
+        self._hash = hashlib.sha256()
+        directory = os.path.join(store.root, INCOMING_DIRNAME)
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix=".upload-", dir=directory)
+        self._file = os.fdopen(fd, "wb")
+        self._done = False
+
+    def write(self, data: bytes) -> None:
+        """チャンクを書き込む（上限を超えた時点で UploadTooLarge を送出する）"""
+        self.size += len(data)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            raise UploadTooLarge(self.max_bytes)
+        self._hash.update(data)
+        self._file.write(data)
+
+    def write_many(self, chunks) -> None:
+        for data in chunks:
+            self.write(data)
+
+    def commit(self) -> StoredImage:
+        """書き込みを確定し、画像として保存する（IMAGE_EXECUTOR上で実行する）。
+
+        Raises:
+            ValueError: 画像として読み込めない場合。
+        """
+        self._file.close()
+        self._done = True
+        try:
+            return self.store._ingest(self.path, self._hash.hexdigest())
+        finally:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+    def discard(self) -> None:
+        if not self._done:
+            self._done = True
+            self._file.close()
+            os.unlink(self.path)
+
+    def __enter__(self) -> "UploadWriter":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.discard()
+
+
+class UploadStore:
+    """内容ハッシュをキーとするアップロード画像の保存先。
+
+    パスは公開URLと同じ "uploads/original/ab/<ハッシュ>.jpg" の形で返す
+    （PhotoUpload.image_path など、既存の image_path と同じ扱いができる）。
+    """
+
+    def __init__(self, root: str = "uploads", thumbnail_edge: int = 256, preview_edge: int = 1024, quality: int = 80):
+        """
+        Args:
+            root (str): 保存先ディレクトリ。
+            thumbnail_edge (int): サムネイルの長辺（ピクセル）。
+            preview_edge (int): プレビューの長辺（ピクセル）。
+            quality (int): レンディションのJPEG品質。
+        """
+        self.root = root
+        self.thumbnail_edge = thumbnail_edge
+        self.preview_edge = preview_edge
+        self.quality = quality
+
+    @staticmethod
+    def _key(kind: str, digest: str, ext: str) -> str:
+        """保存先ディレクトリからの相対パス（公開パスの PUBLIC_PREFIX より後ろ）"""
+        return f"{kind}/{digest[:2]}/{digest}{ext}"
+
+    def _disk_path(self, key: str) -> str:
+        return os.path.join(self.root, *key.split("/"))
+
+    @staticmethod
+    def _write_once(path: str, data: bytes) -> bool:
+        """ファイルが無い場合だけ書き込む（一時ファイルに書いてから rename するため、書きかけは見えない）。
+
+        Returns:
+            bool: 新しく書き込んだ場合はTrue、既に同じ内容が保存されていた場合はFalse。
+        """
+        if os.path.exists(path):
+            return False
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=directory)
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return True
+
+    def _rendition(self, img: Image.Image, max_edge: int) -> bytes:
+        output = io.BytesIO()
+        downscale_image(img, max_edge).save(output, format="JPEG", quality=self.quality, optimize=True, progressive=True)
+        return output.getvalue()
+
+    def writer(self, max_bytes: Optional[int] = None) -> UploadWriter:
+        """チャンク単位で受信するアップロードの書き込み先を作る"""
+        return UploadWriter(self, max_bytes)
+
+    def put(self, image_bytes: bytes) -> StoredImage:
+        """メモリ上の画像を保存する（スクリプト・移行用。受信したアップロードには writer() を使う）"""
+        with self.writer() as writer:
+            writer.write(image_bytes)
+            return writer.commit()
+
+    def put_file(self, path: str) -> StoredImage:
+        """ディスク上の画像をチャンク単位で読みながら保存する"""
+        with self.writer() as writer, open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                writer.write(chunk)
+            return writer.commit()
+
+    def _ingest(self, path: str, digest: str) -> StoredImage:
+        """受信済みの一時ファイルを内容ハッシュの保存先に移し、サムネイル・プレビューを作成する。
+
+        画像はメモリマップしたファイルからデコードするため、原画像のbytesのコピーは作らない。
+        同じ内容の画像が保存済みなら、原画像の書き込みもレンディションの作成も行わない。
+
+        Args:
+            path (str): 受信済みの一時ファイル。
+            digest (str): ファイルの内容のSHA-256。
+        Returns:
+            StoredImage: 内容ハッシュと各ファイルの公開パス。
+        Raises:
+            ValueError: 画像として読み込めない場合。
+            OSError: ファイルの書き込みに失敗した場合。
+        """
+        thumbnail_key = self._key("thumb", digest, ".jpg")
+        preview_key = self._key("preview", digest, ".jpg")
+        thumbnail_path, preview_path = self._disk_path(thumbnail_key), self._disk_path(preview_key)
+        renditions = {}
+        converted = None
+        try:
+            with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped, \
+                    Image.open(mapped) as img:
+                ext = ORIGINAL_EXTENSIONS.get(img.format)
+                original_key = self._key("original", digest, ext or ".jpg")
+                original_path = self._disk_path(original_key)
+                if not os.path.exists(preview_path) or not os.path.exists(thumbnail_path):
+                    # プレビューからサムネイルを作る（原画像のデコードは1回だけ）
+                    preview = downscale_image(img, self.preview_edge)
+                    renditions[thumbnail_path] = self._rendition(preview, self.thumbnail_edge)
+                    renditions[preview_path] = self._rendition(preview, self.preview_edge)
+                if ext is None and not os.path.exists(original_path):
+                    # ブラウザで表示できない形式（HEICなど）は原画像もJPEGにする
+                    converted = self._rendition(img, max(img.size))
+        except (OSError, ValueError) as e:
+            # 空のファイルは mmap が ValueError を送出する
+            raise ValueError(f"画像として読み込めません: {e}") from e
+        for rendition_path, data in renditions.items():
+            self._write_once(rendition_path, data)
+        if converted is not None:
+            self._write_once(original_path, converted)
+        elif not os.path.exists(original_path):
+            os.makedirs(os.path.dirname(original_path), exist_ok=True)
+            os.replace(path, original_path)
+        return StoredImage(
+            digest,
+            f"{PUBLIC_PREFIX}/{original_key}",
+            f"{PUBLIC_PREFIX}/{thumbnail_key}",
+            f"{PUBLIC_PREFIX}/{preview_key}",
+        )
+
+    def local_path(self, public_path: str) -> Optional[str]:
+        """公開パス（uploads/...）を実ファイルのパスに変換する（存在しない場合はNone）"""
+        prefix, _, relative_path = public_path.partition("/")
+        return self.resolve(relative_path) if prefix == PUBLIC_PREFIX else None
+
+    def resolve(self, relative_path: str) -> Optional[str]:
+        """公開パスの PUBLIC_PREFIX より後ろの部分を実ファイルのパスに変換する（root の外や存在しない場合はNone）"""
+        root = os.path.realpath(self.root)
+        path = os.path.realpath(os.path.join(root, relative_path))
+        if os.path.commonpath([root, path]) != root or not os.path.isfile(path):
+            return None
+        # 受信中の一時ファイルは公開しない
+        if os.path.relpath(path, root).split(os.sep)[0] == INCOMING_DIRNAME:
+            return None
+        return path
+
+
+def _etag_matches(header: str, etag: str) -> bool:
+    """If-None-Match / If-Range の値が ETag に一致するか"""
+    return header.strip() == "*" or etag in (tag.strip() for tag in header.split(","))
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """単一の "bytes=start-end" を (start, end) に変換する（end を含む）。
+
+    複数範囲や解釈できない指定は None（全体を返す）。範囲外の場合は ValueError。
+    """
+    match = _RANGE.match(header.strip())
+    if not match or match.group(0) == "bytes=-":
+        return None
+    start, end = match.groups()
+    if start == "":
+        # "bytes=-N": 末尾のNバイト
+        length = int(end)
+        if length == 0:
+            raise ValueError("unsatisfiable range")
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        raise ValueError("unsatisfiable range")
+    return start, end
+
+
+def _iter_file(path: str, start: int, length: int) -> Iterator[bytes]:
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def upload_response(path: str, relative_path: str, request_headers: Mapping[str, str], method: str = "GET") -> Response:
+    """アップロード画像を ETag・Cache-Control・Range に対応して返す。
+
+    内容ハッシュで保存したファイルは ETag をハッシュそのものにし（強いETag）、immutable で長期キャッシュさせる。
+    旧形式のファイルは更新日時とサイズから ETag を作り、毎回再検証させる。
+
+    Args:
+        path (str): 実ファイルのパス（UploadStore.resolve の戻り値）。
+        relative_path (str): 公開パスの PUBLIC_PREFIX より後ろの部分。
+        request_headers (Mapping[str, str]): リクエストヘッダー。
+        method (str): HTTPメソッド（HEAD の場合は本文を返さない）。
+    Returns:
+        Response: 200（全体）・206（部分）・304（未変更）・416（範囲外）のいずれか。
+    """
+    stat = os.stat(path)
+    hashed = _HASHED_PATH.match(relative_path.replace(os.sep, "/"))
+    if hashed:
+        kind, digest = hashed.groups()
+        etag = f'"{digest}"' if kind == "original" else f'"{digest}-{kind}"'
+        cache_control = IMMUTABLE_CACHE_CONTROL
+    else:
+        etag = f'"{int(stat.st_mtime_ns):x}-{stat.st_size:x}"'
+        cache_control = LEGACY_CACHE_CONTROL
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    headers: Dict[str, str] = {"ETag": etag, "Cache-Control": cache_control, "Accept-Ranges": "bytes"}
+
+    if_none_match = request_headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    size = stat.st_size
+    range_header = request_headers.get("range")
+    if_range = request_headers.get("if-range")
+    if range_header and (not if_range or _etag_matches(if_range, etag)):
+        try:
+            byte_range = _parse_range(range_header, size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        if byte_range is not None:
+            start, end = byte_range
+            length = end - start + 1
+            headers.update({"Content-Range": f"bytes {start}-{end}/{size}", "Content-Length": str(length)})
+            body = iter(()) if method == "HEAD" else _iter_file(path, start, length)
+            return StreamingResponse(body, status_code=206, media_type=media_type, headers=headers)
+
+    if method == "HEAD":
+        return Response(status_code=200, media_type=media_type, headers={**headers, "Content-Length": str(size)})
+    return FileResponse(path, media_type=media_type, headers=headers, stat_result=stat)
+
+
+def migrate_legacy_uploads(db: Session, store: UploadStore, delete: bool = False) -> Dict[str, int]:
+    """内容ハッシュ化以前のアップロード（content_hash がNULLの photo_uploads）を保存し直し、
+    photo_uploads と playlist_history の行を新しいパスとレンディションに付け替える。
+
+    Args:
+        db (Session): データベースセッション。
+        store (UploadStore): 移行先の保存先。
+        delete (bool): 移行後に旧形式のファイルを削除するか。
+    Returns:
+        Dict[str, int]: 移行した画像数・見つからなかった／読み込めなかった画像数・削除したファイル数。
+    """
+    counts = {"migrated": 0, "missing": 0, "unreadable": 0, "deleted": 0}
+    legacy_paths = db.scalars(
+        select(PhotoUpload.image_path).where(PhotoUpload.content_hash.is_(None)).distinct()
+    ).all()
+    for image_path in legacy_paths:
+        path = store.local_path(image_path)
+        if path is None:
+            counts["missing"] += 1
+            continue
+        try:
+            stored = store.put_file(path)
+        except ValueError:
+            # 画像として読み込めないファイルはそのまま残す
+            counts["unreadable"] += 1
+            continue
+        db.execute(
+            update(PhotoUpload)
+            .where(PhotoUpload.image_path == image_path)
+            .values(image_path=stored.original_path, content_hash=stored.content_hash,
+                    thumbnail_path=stored.thumbnail_path, preview_path=stored.preview_path)
+        )
+        db.execute(
+            update(PlaylistHistory)
+            .where(PlaylistHistory.image_path == image_path)
+            .values(image_path=stored.original_path, thumbnail_path=stored.thumbnail_path,
+                    preview_path=stored.preview_path)
+        )
+        db.commit()
+        counts["migrated"] += 1
+        if delete:
+            os.unlink(path)
+            counts["deleted"] += 1
+    return counts
+
+
+if __name__ == "__main__":
+    # 使い方: python -m app.services.upload_store [--delete]
+    #   --delete: 移行が済んだ旧形式のファイル（uploads/{uuid}_{filename}）を削除する
+    import sys
+
+    from app.core.config import settings
+    from app.database import SessionLocal
+
+    upload_store = UploadStore(
+        settings.UPLOAD_DIR,
+        thumbnail_edge=settings.UPLOAD_THUMBNAIL_EDGE,
+        preview_edge=settings.UPLOAD_PREVIEW_EDGE,
+        quality=settings.UPLOAD_RENDITION_QUALITY,
+    )
+    with SessionLocal() as session:
+        result = migrate_legacy_uploads(session, upload_store, delete="--delete" in sys.argv[1:])
+    print(f"アップロード画像を移行しました: {result}")
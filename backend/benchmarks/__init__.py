@@ -0,0 +1,17 @@
+# ベンチマーク用パッケージ
+# 使い方: backend ディレクトリで `python -m benchmarks.<モジュール名>` を実行する
+import os
+
+# app.core.config の Settings が要求する環境変数（ベンチマークでは外部サービスに接続しない）
+for _key, _value in {
+    "ENVIRONMENT": "development",
+    "POSTGRES_SERVER": "localhost",
+    "POSTGRES_USER": "music_swipe",
+    "POSTGRES_PASSWORD": "music_swipe",
+    "POSTGRES_DB": "music_swipe",
+    "POSTGRES_PORT": "5432",
+    "API_KEY": "benchmark",
+    "SECRET_KEY": "benchmark-secret-key",
+    "ALGORITHM": "HS256",
+}.items():
+    os.environ.setdefault(_key, _value)
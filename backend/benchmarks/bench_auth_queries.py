@@ -0,0 +1,62 @@
+# 認証（get_current_user）が /swipe 1回あたりに発行するSQLの数と処理時間を比較するベンチマーク
+# - legacy: uid を持たないトークン（変更前と同じ email での取得）、キャッシュなし
+# - uid: uid 付きトークン、キャッシュなし（主キーの EXISTS のみ）
+# - cached: uid 付きトークン、検証済みトークンのキャッシュあり（署名検証もDB問い合わせもしない）
+# 使い方: python -m benchmarks.bench_auth_queries --requests 500
+import argparse
+import json
+import time
+from datetime import timedelta
+
+from benchmarks.harness import prepare_app
+
+
+def main():
+    parser = argparse.ArgumentParser(description="認証の /swipe あたりのクエリ数を比較する")
+    parser.add_argument("--songs", type=int, default=5000, help="合成カタログの楽曲数")
+    parser.add_argument("--requests", type=int, default=500, help="方式ごとの /swipe の回数")
+    args = parser.parse_args()
+
+    app = prepare_app(songs=args.songs)
+    from fastapi.testclient import TestClient
+    from sqlalchemy import event
+
+    from app import services
+    from app.database import engine
+    from app.routers import CATALOG_MANAGER
+
+    statements = []
+    event.listen(engine, "before_cursor_execute", lambda *a: statements.append(a[2]))
+
+    results = {}
+    with TestClient(app) as client:
+        signup = client.post("/signup", json={"email": "bench@example.com", "password": "bench"})
+        uid_token = signup.json()["access_token"]
+        legacy_token = services.create_access_token(data={"sub": "bench@example.com"}, expires_delta=timedelta(minutes=15))
+        song_index = CATALOG_MANAGER.current.song_index
+        songs = iter(song_index.song(p)["id"] for p in range(len(song_index)))
+
+        for mode, token, cached in (("legacy", legacy_token, False), ("uid", uid_token, False), ("cached", uid_token, True)):
+            headers = {"Authorization": f"Bearer {token}"}
+            # スワイプ状態キャッシュを温めておき、認証以外のクエリが出ないようにする
+            client.post("/swipe", json={"song_id": next(songs), "liked": False}, headers=headers)
+            statements.clear()
+            started = time.perf_counter()
+            for _ in range(args.requests):
+                if not cached:
+                    services.PRINCIPAL_CACHE.clear()
+                res = client.post("/swipe", json={"song_id": next(songs), "liked": False}, headers=headers)
+                assert res.status_code == 200, res.text
+            elapsed = time.perf_counter() - started
+            results[mode] = {
+                "queries_per_request": len(statements) / args.requests,
+                "ms_per_request": elapsed * 1000 / args.requests,
+            }
+
+    for mode, r in results.items():
+        print(f"{mode:7s} {r['queries_per_request']:.2f} queries/request  {r['ms_per_request']:.3f} ms/request")
+    print(json.dumps({"requests": args.requests, "results": results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# ワーカーごとのメモリ使用量（RSS/PSS）を、JSON読み込みとメモリマップ読み込みで比較するベンチマーク
+# 使い方: python -m benchmarks.bench_catalog_rss --songs 100000 --workers 4
+# Linux の /proc/self/smaps_rollup を使用する
+import argparse
+import json
+import multiprocessing as mp
+import os
+import tempfile
+
+from benchmarks.synthetic_catalog import write_dataset
+
+
+def read_memory() -> dict:
+    """現在のプロセスのRSS・PSS・プライベートメモリ（KiB）を返す"""
+    values = {}
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) >= 2 and parts[1].isdigit():
+                values[parts[0].rstrip(":")] = int(parts[1])
+    return {
+        "rss_kib": values.get("Rss", 0),
+        "pss_kib": values.get("Pss", 0),
+        "private_kib": values.get("Private_Clean", 0) + values.get("Private_Dirty", 0),
+    }
+
+
+def load_json(data_dir: str):
+    """変更前の routers.py と同じくJSONを辞書に展開する"""
+    loaded = []
+    for filename in ("filtered_songs_4_or_more_tags.json", "mood_similarity.json", "mood_instrument_similarity.json"):
+        with open(os.path.join(data_dir, filename), encoding="utf-8") as f:
+            loaded.append(json.load(f))
+    return loaded
+
+
+def load_mmap(data_dir: str):
+    """コンパイル済みカタログをメモリマップで開き、全ページを参照する"""
+    from app import services
+
+    catalog = services.load_catalog(data_dir)
+    index = services.SongIndex(catalog)
+    # ページをすべて読み込ませる（実運用でリクエストが全楽曲に触れた状態を再現）
+    for array in (catalog.ids, catalog.id_order, catalog.tag_bitmap, catalog.song_tag_offsets,
+                  catalog.song_tag_indices, catalog.tag_offsets, catalog.tag_postings,
+                  catalog.string_offsets, catalog.string_blob,
+                  catalog.mood_similarity.matrix, catalog.mood_instrument_similarity.matrix):
+        array.sum()
+    return index
+
+
+def worker(mode: str, data_dir: str, barrier, queue):
+    from app import services  # noqa: F401  インポート分のメモリをベースラインに含める
+
+    before = read_memory()
+    data = load_json(data_dir) if mode == "json" else load_mmap(data_dir)
+    # 全ワーカーがロードを終えた状態でPSSを測る（共有ページは按分される）
+    barrier.wait()
+    after = read_memory()
+    barrier.wait()
+    queue.put({"mode": mode, "pid": os.getpid(), "before": before, "after": after})
+    del data
+
+
+def run(mode: str, data_dir: str, workers: int) -> list:
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(workers)
+    queue = ctx.Queue()
+    procs = [ctx.Process(target=worker, args=(mode, data_dir, barrier, queue)) for _ in range(workers)]
+    for p in procs:
+        p.start()
+    results = [queue.get() for _ in procs]
+    for p in procs:
+        p.join()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="カタログ読み込み方式ごとのワーカーのメモリ使用量を比較する")
+    parser.add_argument("--songs", type=int, default=50000, help="合成カタログの楽曲数")
+    parser.add_argument("--workers", type=int, default=4, help="ワーカープロセス数")
+    parser.add_argument("--data-dir", help="既存のデータディレクトリ（指定時は合成データを使わない）")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        data_dir = args.data_dir or write_dataset(tmp, args.songs)
+        from app import services
+
+        services.compile_catalog_from_json(data_dir)
+
+        summary = {}
+        for mode in ("json", "mmap"):
+            results = run(mode, data_dir, args.workers)
+            print(f"== {mode} ({args.workers} workers)")
+            print(f"{'pid':>8} {'RSS MiB':>9} {'PSS MiB':>9} {'private MiB':>12}  (ロード前との差分)")
+            for r in results:
+                delta = {k: (r["after"][k] - r["before"][k]) / 1024 for k in r["after"]}
+                print(f"{r['pid']:>8} {delta['rss_kib']:>9.1f} {delta['pss_kib']:>9.1f} {delta['private_kib']:>12.1f}")
+            summary[mode] = {
+                key[:-len("_kib")]: sum(r["after"][key] - r["before"][key] for r in results) / len(results) / 1024
+                for key in ("rss_kib", "pss_kib", "private_kib")
+            }
+        print(json.dumps({"songs": args.songs, "workers": args.workers, "mean_delta_mib": summary}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# 埋め込みの近傍探索（IVF）について、全件走査（exact）とのレイテンシと再現率（recall@k）を比較するベンチマーク
+# タグによる事前絞り込み（候補集合の指定）あり・なしの両方を測る
+# 使い方: python -m benchmarks.bench_embedding_index --songs 100000 --nprobe 8
+import argparse
+import json
+import time
+
+import numpy as np
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from app.services.embedding_index import EmbeddingIndex, build_ivf, normalize_rows
+from benchmarks.harness import percentile
+from benchmarks.synthetic_catalog import generate_embeddings
+
+
+def run_queries(index: EmbeddingIndex, queries, k: int, candidates, exact: bool):
+    results, timings = [], []
+    for liked, pool in zip(queries, candidates):
+        started = time.perf_counter()
+        results.append(index.recommend(liked, k, candidates=pool, exclude=liked, exact=exact))
+        timings.append(time.perf_counter() - started)
+    return results, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="埋め込みの近傍探索（IVF / exact）のレイテンシと再現率を測定する")
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--nlist", type=int, default=None, help="IVFのリスト数（省略時は √n）")
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--likes", type=int, default=5, help="クエリごとのLike数")
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--mask-ratio", type=float, default=0.05, help="タグで絞り込んだ候補集合の割合")
+    args = parser.parse_args()
+
+    embeddings = normalize_rows(generate_embeddings(args.songs, args.dim))
+    started = time.perf_counter()
+    centroids, offsets, members = build_ivf(embeddings, args.nlist)
+    build_s = time.perf_counter() - started
+    index = EmbeddingIndex(embeddings[members], centroids, offsets, members, nprobe=args.nprobe)
+
+    rng = np.random.default_rng(1)
+    queries = [rng.choice(args.songs, size=args.likes, replace=False).tolist() for _ in range(args.queries)]
+    mask_size = max(args.k, int(args.songs * args.mask_ratio))
+    masks = [np.sort(rng.choice(args.songs, size=mask_size, replace=False)) for _ in range(args.queries)]
+
+    rows = []
+    for name, pools in (("all", [None] * args.queries), ("tag_mask", masks)):
+        truth, exact_t = run_queries(index, queries, args.k, pools, exact=True)
+        approx, ivf_t = run_queries(index, queries, args.k, pools, exact=False)
+        recall = np.mean([len(set(a) & set(t)) / max(1, len(t)) for a, t in zip(approx, truth)])
+        for mode, timings in (("exact", exact_t), ("ivf", ivf_t)):
+            rows.append({
+                "filter": name,
+                "mode": mode,
+                "p50_ms": percentile(timings, 50) * 1000,
+                "p99_ms": percentile(timings, 99) * 1000,
+                "recall": 1.0 if mode == "exact" else float(recall),
+            })
+
+    print(f"songs={args.songs} dim={args.dim} nlist={len(centroids)} nprobe={args.nprobe} build={build_s:.1f}s")
+    print(f"{'filter':>9} {'mode':>6} {'p50 ms':>8} {'p99 ms':>8} {'recall@' + str(args.k):>10}")
+    for r in rows:
+        print(f"{r['filter']:>9} {r['mode']:>6} {r['p50_ms']:>8.3f} {r['p99_ms']:>8.3f} {r['recall']:>10.3f}")
+    print(json.dumps({"songs": args.songs, "nlist": len(centroids), "nprobe": args.nprobe, "build_s": build_s, "results": rows}))
+
+
+if __name__ == "__main__":
+    main()
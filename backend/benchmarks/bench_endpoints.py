@@ -0,0 +1,199 @@
+# 推薦まわりのエンドポイントのマイクロベンチマーク（カタログの規模・ユーザーの履歴の長さごと）
+# 対象: POST /photo, POST /swipe, GET /swipe/queue, GET /playlist, GET /history
+# - カタログの規模ごとに別プロセスで合成カタログ（benchmarks.synthetic_catalog）からアプリを起動し、
+#   Vision API はスタブ（benchmarks.fake_vision）で応答させる
+# - 履歴の長さ H: スワイプ H 件（Like の割合は --like-ratio）と、プレイリスト H/10 件を持つユーザーを作る
+#   （測定中の /swipe は Dislike のみ送り、探索フェーズが変わらないようにする）
+# - レイテンシ: tracemalloc なしで測った p50/p95/p99（TestClient 経由のため、HTTPの送受信は含まない）
+# - メモリ: tracemalloc で測ったリクエスト1回あたりの確保量のピークと、リクエスト後も残った量、
+#   プロセスのRSSの最大値（ru_maxrss。カタログのメモリマップを含む）
+# 結果は --output にJSONで保存し、benchmarks.compare でコミット間の差を比較する。
+# 使い方: python -m benchmarks.bench_endpoints --songs 1000 10000 100000 --history 0 50 500 --output before.json
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+import tracemalloc
+
+from benchmarks.harness import percentile, prepare_app, run_metadata
+
+ENDPOINTS = ("/photo", "/swipe", "/swipe/queue", "/playlist", "/history")
+
+
+def seed_history(user_id: int, length: int, like_ratio: float, song_ids, seed: int):
+    """ユーザーにスワイプ length 件とプレイリスト length/10 件の履歴を直接書き込む"""
+    import random
+
+    from sqlalchemy import insert
+
+    from app.database import engine
+    from app.models import PlaylistHistory, SwipeHistory
+
+    rng = random.Random(seed + user_id)
+    swiped = rng.sample(song_ids, min(length, len(song_ids)))
+    with engine.begin() as conn:
+        if swiped:
+            conn.execute(insert(SwipeHistory), [
+                {"user_id": user_id, "song_id": song_id, "liked": rng.random() < like_ratio} for song_id in swiped
+            ])
+        if length // 10:
+            conn.execute(insert(PlaylistHistory), [
+                {"user_id": user_id, "image_path": "uploads/bench.jpg",
+                 "liked_song_ids": rng.sample(song_ids, 5), "recommended_song_ids": rng.sample(song_ids, 10)}
+                for _ in range(length // 10)
+            ])
+
+
+def worker(args) -> dict:
+    # 画像ごとに Vision API を呼ぶ経路を測るため、類似画像としてのキャッシュヒットは使わない
+    os.environ["MOOD_CACHE_PERCEPTUAL_DISTANCE"] = "0"
+    started = time.perf_counter()
+    app = prepare_app(songs=args.songs[0], database_url=args.database_url, seed=args.seed,
+                      embedding_dim=args.embedding_dim)
+    from fastapi.testclient import TestClient
+
+    from app import routers
+    from app.database import SessionLocal
+    from app.models import User
+    from benchmarks.fake_vision import FakeAsyncOpenAI
+    from benchmarks.load_photo_swipe import make_image
+
+    image = make_image(640, 480)
+    counter = iter(range(1 << 62))
+
+    catalog = routers.CATALOG_MANAGER.current
+    load_ms = (time.perf_counter() - started) * 1000
+    rss_after_load_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    # 起動時に本物のクライアントが作られないよう、アプリの起動前にスタブに差し替える。
+    # 英小文字のみのムード（routers 側の正規化で変化しないもの）を返させる
+    moods = [m for m in catalog.mood_similarity.keys() if m.isalpha() and m.isascii()]
+    routers.openai_client = FakeAsyncOpenAI(moods, latency=args.vision_latency_ms / 1000)
+
+    results = []
+    with TestClient(app) as client:
+        song_ids = [catalog.song_index.song(p)["id"] for p in range(len(catalog.song_index))]
+        next_song = iter(song_ids[::-1] * 4)
+
+        def request(endpoint: str, headers: dict):
+            if endpoint == "/photo":
+                # 末尾のバイトを変えて、毎回別の画像（内容ハッシュが異なる）として扱わせる
+                body = image + next(counter).to_bytes(8, "big")
+                return client.post("/photo", files={"file": ("bench.jpg", body, "image/jpeg")}, headers=headers)
+            if endpoint == "/swipe":
+                return client.post("/swipe", json={"song_id": next(next_song), "liked": False}, headers=headers)
+            if endpoint == "/swipe/queue":
+                return client.get("/swipe/queue", params={"size": 10}, headers=headers)
+            return client.get(endpoint, headers=headers)
+
+        for length in args.history:
+            res = client.post("/signup", json={"email": f"bench-{length}@example.com", "password": "benchmark"})
+            res.raise_for_status()
+            headers = {"Authorization": f"Bearer {res.json()['access_token']}"}
+            with SessionLocal() as db:
+                user_id = db.query(User.id).filter_by(email=f"bench-{length}@example.com").scalar()
+            seed_history(user_id, length, args.like_ratio, song_ids, args.seed)
+            routers.SWIPE_SESSIONS.invalidate(user_id)
+
+            for endpoint in ENDPOINTS:
+                errors = 0
+                for _ in range(args.warmup):
+                    request(endpoint, headers)
+                # レイテンシ（tracemalloc のオーバーヘッドを含めない）
+                latencies = []
+                for _ in range(args.requests):
+                    t = time.perf_counter()
+                    res = request(endpoint, headers)
+                    latencies.append((time.perf_counter() - t) * 1000)
+                    errors += res.status_code != 200
+                # メモリ（リクエストごとの確保量のピークと、リクエスト後も残った量）
+                peaks, retained = [], []
+                tracemalloc.start()
+                for _ in range(args.alloc_requests):
+                    before = tracemalloc.get_traced_memory()[0]
+                    tracemalloc.reset_peak()
+                    res = request(endpoint, headers)
+                    current, peak = tracemalloc.get_traced_memory()
+                    peaks.append((peak - before) / 1024)
+                    retained.append((current - before) / 1024)
+                    errors += res.status_code != 200
+                tracemalloc.stop()
+                results.append({
+                    "songs": args.songs[0],
+                    "history": length,
+                    "endpoint": endpoint,
+                    "count": len(latencies),
+                    "errors": errors,
+                    "mean_ms": sum(latencies) / len(latencies),
+                    "p50_ms": percentile(latencies, 50),
+                    "p95_ms": percentile(latencies, 95),
+                    "p99_ms": percentile(latencies, 99),
+                    "alloc_peak_kb": percentile(peaks, 50),
+                    "alloc_retained_kb": percentile(retained, 50),
+                })
+
+    return {
+        "catalog": {
+            "songs": args.songs[0],
+            "embedding_dim": args.embedding_dim,
+            "load_ms": load_ms,
+            "rss_after_load_mb": rss_after_load_mb,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        },
+        "results": results,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="推薦まわりのエンドポイントのレイテンシ・メモリを測る")
+    parser.add_argument("--songs", type=int, nargs="+", default=[1000, 10000, 100000], help="合成カタログの楽曲数")
+    parser.add_argument("--history", type=int, nargs="+", default=[0, 50, 500], help="ユーザーのスワイプ履歴の件数")
+    parser.add_argument("--requests", type=int, default=200, help="エンドポイントごとのレイテンシの測定回数")
+    parser.add_argument("--alloc-requests", type=int, default=20, help="エンドポイントごとのメモリの測定回数")
+    parser.add_argument("--warmup", type=int, default=10, help="測定前に送る回数")
+    parser.add_argument("--like-ratio", type=float, default=0.3, help="用意する履歴の Like の割合")
+    parser.add_argument("--embedding-dim", type=int, default=0, help="合成カタログの埋め込みの次元（0なら埋め込みなし）")
+    parser.add_argument("--vision-latency-ms", type=float, default=0, help="Vision API スタブの応答時間")
+    parser.add_argument("--database-url", help="接続先DB（省略時は一時ディレクトリのSQLite）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args)))
+        return
+
+    catalogs, results = [], []
+    for songs in args.songs:
+        command = [sys.executable, "-m", "benchmarks.bench_endpoints", "--worker", "--songs", str(songs),
+                   "--history", *map(str, args.history), "--requests", str(args.requests),
+                   "--alloc-requests", str(args.alloc_requests), "--warmup", str(args.warmup),
+                   "--like-ratio", str(args.like_ratio), "--embedding-dim", str(args.embedding_dim),
+                   "--vision-latency-ms", str(args.vision_latency_ms), "--seed", str(args.seed)]
+        if args.database_url:
+            command += ["--database-url", args.database_url]
+        out = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        report = json.loads(out.strip().splitlines()[-1])
+        catalogs.append(report["catalog"])
+        results.extend(report["results"])
+
+    for c in catalogs:
+        print(f"{c['songs']:>8} songs  load {c['load_ms']:8.0f} ms  RSS after load {c['rss_after_load_mb']:7.1f} MB  "
+              f"peak {c['peak_rss_mb']:7.1f} MB")
+    print(f"{'songs':>8} {'history':>7} {'endpoint':<13} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} "
+          f"{'alloc KB':>9} {'kept KB':>8} {'errors':>6}")
+    for r in results:
+        print(f"{r['songs']:>8} {r['history']:>7} {r['endpoint']:<13} {r['p50_ms']:8.2f} {r['p95_ms']:8.2f} "
+              f"{r['p99_ms']:8.2f} {r['alloc_peak_kb']:9.0f} {r['alloc_retained_kb']:8.0f} {r['errors']:6d}")
+    report = {"meta": run_metadata(args), "catalogs": catalogs, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
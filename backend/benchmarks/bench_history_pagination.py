@@ -0,0 +1,100 @@
+# プレイリスト履歴の件数を増やしたときの /history の処理時間とサーバー側のメモリ使用量を測るベンチマーク
+# - full: 変更前と同じく全件を読み、1つのレスポンスに組み立てる
+# - page: キーセット方式で limit 件ずつ読む（最初のページと最後のページの処理時間）
+# - export: /history/export と同じジェネレータで全件をNDJSONとして書き出す（送信先は捨てる）
+# メモリは tracemalloc で測ったPythonオブジェクトのピーク（カタログのメモリマップは含まない）
+# 使い方: python -m benchmarks.bench_history_pagination --playlists 1000 10000 50000
+import argparse
+import json
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from typing import List
+
+from benchmarks.harness import percentile, prepare_app
+
+
+def measure(fn):
+    """関数を実行し、(処理時間[ms], tracemalloc のピーク[MB]) を返す"""
+    tracemalloc.start()
+    started = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed * 1000, peak / 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プレイリスト履歴の件数に対する /history の時間・メモリを測る")
+    parser.add_argument("--songs", type=int, default=5000, help="合成カタログの楽曲数")
+    parser.add_argument("--playlists", type=int, nargs="+", default=[1000, 10000, 50000], help="ユーザーの履歴件数")
+    parser.add_argument("--limit", type=int, default=20, help="1ページの件数")
+    args = parser.parse_args()
+
+    prepare_app(songs=args.songs)
+    from pydantic import TypeAdapter
+    from sqlalchemy import insert
+
+    from app import repositories, routers, schemas, services
+    from app.database import SessionLocal, engine
+    from app.models import PlaylistHistory, User
+
+    song_index = routers.CATALOG_MANAGER.current.song_index
+    song_ids = [song_index.song(p)["id"] for p in range(len(song_index))]
+    base = datetime(2026, 1, 1)
+
+    results = []
+    for user_id, count in enumerate(args.playlists, start=1):
+        with engine.begin() as conn:
+            conn.execute(insert(User), [{"id": user_id, "email": f"user{user_id}@example.com", "hashed_password": "x"}])
+            conn.execute(insert(PlaylistHistory), [
+                {"user_id": user_id, "image_path": f"uploads/{i}.jpg",
+                 "liked_song_ids": song_ids[i % 1000:i % 1000 + 5],
+                 "recommended_song_ids": song_ids[i % 1000 + 5:i % 1000 + 15],
+                 "created_at": base + timedelta(seconds=i)}
+                for i in range(count)
+            ])
+
+        def full():
+            with SessionLocal() as db:
+                items = routers._hydrate_playlists(repositories.list_playlists(db, user_id), song_index)
+            # 変更前の response_model=List[PlaylistHistoryRead] と同じく、全件を1つのJSONにする
+            adapter = TypeAdapter(List[schemas.PlaylistHistoryRead])
+            adapter.dump_json(adapter.validate_python(items))
+
+        def export():
+            for _ in routers._export_history(user_id, "ndjson"):
+                pass
+
+        # ページを最後まで順にたどり、ページごとの処理時間を記録する
+        principal = services.Principal(user_id, f"user{user_id}@example.com")
+        page_ms, cursor = [], None
+        while True:
+            started = time.perf_counter()
+            with SessionLocal() as db:
+                page = routers.get_playlist_history(limit=args.limit, cursor=cursor, db=db, current_user=principal)
+            schemas.PlaylistHistoryPage.model_validate(page).model_dump_json()
+            page_ms.append((time.perf_counter() - started) * 1000)
+            cursor = page["next_cursor"]
+            if cursor is None:
+                break
+
+        full_ms, full_mb = measure(full)
+        export_ms, export_mb = measure(export)
+        results.append({
+            "playlists": count,
+            "full_ms": full_ms, "full_peak_mb": full_mb,
+            "page_first_ms": page_ms[0], "page_last_ms": page_ms[-1], "page_p50_ms": percentile(page_ms, 50),
+            "export_ms": export_ms, "export_peak_mb": export_mb,
+        })
+
+    for r in results:
+        print(f"{r['playlists']:>7} playlists  full: {r['full_ms']:8.1f}ms peak={r['full_peak_mb']:7.1f}MB  "
+              f"page: first={r['page_first_ms']:.2f}ms last={r['page_last_ms']:.2f}ms  "
+              f"export: {r['export_ms']:8.1f}ms peak={r['export_peak_mb']:5.1f}MB")
+    print(json.dumps({"limit": args.limit, "results": results}))
+
+
+if __name__ == "__main__":
+    main()
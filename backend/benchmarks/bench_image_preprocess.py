@@ -0,0 +1,95 @@
+# Vision APIに送る画像の前処理について、変更前（フル解像度をJPEG再エンコード）と
+# 縮小後のペイロードサイズ・処理時間・推定アップロード時間を比較するベンチマーク
+# 使い方: python -m benchmarks.bench_image_preprocess --uplink-mbps 20
+import argparse
+import base64
+import io
+import json
+import time
+
+import numpy as np
+from PIL import Image
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from app.services.image_preprocess import prepare_vision_image
+
+# (名前, 幅, 高さ)
+PHOTO_SIZES = (
+    ("12MP", 4032, 3024),
+    ("8MP", 3264, 2448),
+    ("FHD", 1920, 1080),
+)
+
+
+def make_photo(width: int, height: int, seed: int = 0) -> bytes:
+    """写真に近い（滑らかなグラデーション＋弱いノイズ）JPEGを生成する"""
+    rng = np.random.default_rng(seed)
+    y, x = np.mgrid[0:height, 0:width].astype(np.float32)
+    base = np.stack([
+        128 + 100 * np.sin(x / width * 3.1 + 0.5),
+        128 + 100 * np.cos(y / height * 2.3),
+        128 + 80 * np.sin((x + y) / (width + height) * 5.0),
+    ], axis=-1)
+    noise = rng.normal(0, 6, size=base.shape)
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    buf = io.BytesIO()
+    Image.fromarray(pixels).save(buf, format="JPEG", quality=92)
+    return buf.getvalue()
+
+
+def legacy_data_url(image_bytes: bytes) -> str:
+    """変更前の estimate_mood_from_image と同じ処理"""
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        rgb_image = img.convert("RGB")
+        output = io.BytesIO()
+        rgb_image.save(output, format="JPEG")
+    return "data:image/jpeg;base64," + base64.b64encode(output.getvalue()).decode("utf-8")
+
+
+def measure(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - started)
+    return result, float(np.median(timings))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Vision API 用の画像前処理のペイロードと処理時間を比較する")
+    parser.add_argument("--max-edge", type=int, default=1024)
+    parser.add_argument("--quality", type=int, default=85)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--uplink-mbps", type=float, default=20.0, help="推定アップロード時間の計算に使う回線速度")
+    args = parser.parse_args()
+
+    rows = []
+    for name, width, height in PHOTO_SIZES:
+        photo = make_photo(width, height)
+        legacy, legacy_time = measure(lambda: legacy_data_url(photo), args.repeat)
+        (fast, detail), fast_time = measure(
+            lambda: prepare_vision_image(photo, max_edge=args.max_edge, quality=args.quality), args.repeat
+        )
+        for path, payload, elapsed in (("legacy", legacy, legacy_time), ("downscaled", fast, fast_time)):
+            upload = len(payload) * 8 / (args.uplink_mbps * 1e6)
+            rows.append({
+                "photo": name,
+                "path": path,
+                "upload_bytes": len(photo),
+                "payload_bytes": len(payload),
+                "encode_ms": elapsed * 1000,
+                "upload_ms": upload * 1000,
+                "total_ms": (elapsed + upload) * 1000,
+                "detail": detail if path == "downscaled" else "auto",
+            })
+
+    print(f"{'photo':>6} {'path':>10} {'payload KiB':>12} {'encode ms':>10} {'upload ms':>10} {'total ms':>9}")
+    for r in rows:
+        print(f"{r['photo']:>6} {r['path']:>10} {r['payload_bytes'] / 1024:>12.1f} {r['encode_ms']:>10.1f} "
+              f"{r['upload_ms']:>10.1f} {r['total_ms']:>9.1f}")
+    print(json.dumps({"max_edge": args.max_edge, "quality": args.quality, "uplink_mbps": args.uplink_mbps, "results": rows}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# ログインが集中したとき（トークン失効直後など）の /login のスループット・レイテンシと、
+# 同時に送られる /swipe のレイテンシを測る負荷試験
+# 対象サーバーは別プロセス（benchmarks.serve）で起動する。bcrypt のコストは --rounds で指定する
+# --refresh を付けると、パスワードでのログインの代わりに /token/refresh でアクセストークンを再発行する
+# 使い方: python -m benchmarks.bench_login --logins 32 --rounds 12 --duration 10
+#         python -m benchmarks.bench_login --logins 32 --rounds 12 --duration 10 --refresh
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+
+import httpx
+
+from benchmarks.load_photo_swipe import signup, summarize, swipe_loop, wait_until_ready
+
+
+async def login_loop(client, email: str, stop_at: float, latencies: list, rejected: list):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        res = await client.post("/login", data={"username": email, "password": "benchmark"})
+        if res.status_code == 503:
+            # 上限を超えた分は即座に断られる（待ち行列に積まない）
+            rejected.append(time.perf_counter() - started)
+            await asyncio.sleep(float(res.headers.get("Retry-After", "1")))
+            continue
+        latencies.append(time.perf_counter() - started)
+        if res.status_code != 200:
+            raise RuntimeError(f"/login failed: {res.status_code} {res.text}")
+
+
+async def refresh_loop(client, email: str, stop_at: float, latencies: list, rejected: list):
+    res = await client.post("/login", data={"username": email, "password": "benchmark"})
+    res.raise_for_status()
+    refresh_token = res.json()["refresh_token"]
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        res = await client.post("/token/refresh", json={"refresh_token": refresh_token})
+        latencies.append(time.perf_counter() - started)
+        if res.status_code != 200:
+            raise RuntimeError(f"/token/refresh failed: {res.status_code} {res.text}")
+        refresh_token = res.json()["refresh_token"]
+
+
+async def run(args) -> dict:
+    env = dict(os.environ, BCRYPT_ROUNDS=str(args.rounds))
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.serve", "--port", str(args.port), "--songs", str(args.songs),
+    ], stdout=subprocess.DEVNULL, env=env)
+    limits = httpx.Limits(max_connections=args.logins + args.swipers)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits) as client:
+            await wait_until_ready(client)
+            emails = [f"login{i}@example.com" for i in range(args.logins)]
+            for email in emails:
+                await signup(client, email)
+            swipers = [await signup(client, f"swiper{i}@example.com") for i in range(args.swipers)]
+            first_song = 1000
+
+            login_latencies, rejected, swipe_latencies = [], [], []
+            loop = refresh_loop if args.refresh else login_loop
+            stop_at = time.perf_counter() + args.duration
+            started = time.perf_counter()
+            await asyncio.gather(
+                *[loop(client, email, stop_at, login_latencies, rejected) for email in emails],
+                *[swipe_loop(client, h, first_song, stop_at, swipe_latencies) for h in swipers],
+            )
+            elapsed = time.perf_counter() - started
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        "mode": "refresh" if args.refresh else "login",
+        "rounds": args.rounds,
+        "concurrent_logins": args.logins,
+        "logins_per_s": len(login_latencies) / elapsed,
+        "rejected": len(rejected),
+        "login": summarize(login_latencies),
+        "swipe": summarize(swipe_latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ログイン集中時のスループット・レイテンシを測定する")
+    parser.add_argument("--port", type=int, default=8765, help="対象サーバーのポート")
+    parser.add_argument("--songs", type=int, default=5000, help="合成カタログの楽曲数")
+    parser.add_argument("--logins", type=int, default=32, help="同時に /login を送り続けるユーザー数")
+    parser.add_argument("--swipers", type=int, default=4, help="同時に /swipe を送り続けるユーザー数")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt のコスト（BCRYPT_ROUNDS）")
+    parser.add_argument("--duration", type=float, default=10.0, help="測定時間（秒）")
+    parser.add_argument("--refresh", action="store_true", help="/login の代わりに /token/refresh を測る")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    print(f"{results['mode']}: {results['logins_per_s']:.1f}/s rejected={results['rejected']}")
+    for endpoint in ("login", "swipe"):
+        s = results[endpoint]
+        print(f"{endpoint:>6}: n={s['count']:>5} p50={s['p50_ms']:8.1f}ms p95={s['p95_ms']:8.1f}ms p99={s['p99_ms']:8.1f}ms")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
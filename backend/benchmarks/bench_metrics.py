@@ -0,0 +1,114 @@
+# メトリクスの更新1回あたりのコストを測るベンチマーク（本番で常に有効にできる 1µs 未満であることを確かめる）
+# - counter / gauge / histogram の更新（ラベルなし、ラベル付きは事前に取得した系列）
+# - labels() で系列を引いてからの更新（ホットパスで事前に取得していない場合）
+# - with histogram.time() による計測（perf_counter 2回を含む）
+# - MetricsMiddleware を通したリクエスト1回あたりの増分（最小のASGIアプリで、有無の差を測る）
+# 使い方: python -m benchmarks.bench_metrics --iterations 1000000 --max-ns 1000
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+
+
+def per_call_ns(fn, iterations: int, repeat: int = 5) -> float:
+    """fn を iterations 回呼ぶ時間の最小値から、呼び出しのループ分を除いた1回あたりの時間（ns）"""
+    def loop(f):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            f()
+        return time.perf_counter() - started
+
+    def noop():
+        pass
+
+    baseline = min(loop(noop) for _ in range(repeat))
+    elapsed = min(loop(fn) for _ in range(repeat))
+    return max(elapsed - baseline, 0.0) / iterations * 1e9
+
+
+def middleware_overhead_ns(requests: int) -> float:
+    """最小のASGIアプリに MetricsMiddleware を付けた場合のリクエスト1回あたりの増分（ns）"""
+    from app.services.metrics import MetricsMiddleware
+
+    class Route:
+        path = "/bench"
+
+    async def app(scope, receive, send):
+        scope["route"] = Route
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b""})
+
+    async def receive():
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message):
+        pass
+
+    async def drive(target):
+        started = time.perf_counter()
+        for _ in range(requests):
+            await target({"type": "http", "method": "GET", "path": "/bench"}, receive, send)
+        return time.perf_counter() - started
+
+    wrapped = MetricsMiddleware(app)
+    plain = min(asyncio.run(drive(app)) for _ in range(3))
+    instrumented = min(asyncio.run(drive(wrapped)) for _ in range(3))
+    return max(instrumented - plain, 0.0) / requests * 1e9
+
+
+def main():
+    parser = argparse.ArgumentParser(description="メトリクスの更新1回あたりのコストを測る")
+    parser.add_argument("--iterations", type=int, default=1000000, help="1回の測定で更新する回数")
+    parser.add_argument("--max-ns", type=float, help="更新1回あたりの上限（ns、超えたら終了コード1）")
+    args = parser.parse_args()
+
+    from app.services.metrics import Counter, Gauge, Histogram, Registry
+
+    registry = Registry()
+    counter = Counter("bench_total", "bench", registry=registry)
+    labeled = Counter("bench_labeled_total", "bench", ("route", "status"), registry=registry)
+    gauge = Gauge("bench_in_flight", "bench", registry=registry)
+    histogram = Histogram("bench_seconds", "bench", registry=registry)
+    labeled_histogram = Histogram("bench_labeled_seconds", "bench", ("route",), registry=registry)
+    child = labeled.labels("/swipe", 200)
+    histogram_child = labeled_histogram.labels("/swipe")
+
+    def timed():
+        with histogram.time():
+            pass
+
+    updates = {
+        "counter.inc": counter.inc,
+        "counter(labels).inc": child.inc,
+        "gauge.inc": gauge.inc,
+        "histogram.observe": lambda: histogram.observe(0.0042),
+        "histogram(labels).observe": lambda: histogram_child.observe(0.0042),
+        "labels(...).inc": lambda: labeled.labels("/swipe", 200).inc(),
+        "histogram.time()": timed,
+    }
+    results = {name: per_call_ns(fn, args.iterations) for name, fn in updates.items()}
+    # ミドルウェアはリクエストごとに gauge 2回・histogram 1回・counter 1回を更新する
+    results["middleware per request"] = middleware_overhead_ns(max(args.iterations // 10, 1000))
+    render_started = time.perf_counter()
+    registry.render()
+    render_ms = (time.perf_counter() - render_started) * 1000
+
+    for name, ns in results.items():
+        print(f"{name:<26} {ns:8.0f} ns")
+    print(f"{'render (7 metrics)':<26} {render_ms:8.3f} ms")
+    print(json.dumps({"iterations": args.iterations, "ns_per_update": results, "render_ms": render_ms}))
+
+    if args.max_ns is not None:
+        # ミドルウェアは複数の更新をまとめた値のため、上限は更新1回ごとの値にのみ適用する
+        failed = {k: v for k, v in results.items() if k != "middleware per request" and v > args.max_ns}
+        if failed:
+            print("更新のコストが上限を超えました: " + ", ".join(f"{k} {v:.0f}ns" for k, v in failed.items()),
+                  file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+# プレイリスト候補の採点について、変更前（タグ集合の走査）とベクトル化した採点器
+# （1ユーザーずつ・複数ユーザーまとめて）の処理時間を比較するベンチマーク
+# 使い方: python -m benchmarks.bench_playlist_scoring --songs 100000 --users 256
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+
+import numpy as np
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from app.services.catalog_store import compile_catalog_from_json, CompiledCatalog
+from app.services.playlist_scoring import PlaylistScorer
+from app.services.song_index import SongIndex
+from benchmarks.synthetic_catalog import write_dataset
+
+
+def legacy_score(index: SongIndex, moods, liked: set, k: int = 10):
+    """変更前の generate_playlist と同じ処理（タグ集計 → 転置リストの数え上げ → random.sample）"""
+    mood_counter, inst_counter = {}, {}
+    for pos in sorted(liked):
+        for tag in index.tags(pos):
+            counter = mood_counter if tag in moods else inst_counter
+            counter[tag] = counter.get(tag, 0) + 1
+    mood_tags = [m for m, _ in sorted(mood_counter.items(), key=lambda x: -x[1])[:3]]
+    inst_tags = [i for i, _ in sorted(inst_counter.items(), key=lambda x: -x[1])[:2]]
+    mood_hits = {}
+    for tag in mood_tags:
+        for pos in index.with_tag(tag):
+            mood_hits[pos] = mood_hits.get(pos, 0) + 1
+    candidates = sorted(
+        pos for pos, hits in mood_hits.items()
+        if hits >= 2 and pos not in liked and not index.tags(pos).isdisjoint(inst_tags)
+    )
+    return random.sample(candidates, k=min(k, len(candidates)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="プレイリスト候補の採点の処理時間を比較する")
+    parser.add_argument("--songs", type=int, default=100000)
+    parser.add_argument("--users", type=int, default=256)
+    parser.add_argument("--likes", type=int, default=8, help="ユーザーごとのLike数")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="feel-tuning-bench-")
+    data_dir = write_dataset(os.path.join(workdir, "data"), args.songs)
+    catalog = CompiledCatalog(compile_catalog_from_json(data_dir))
+    index = SongIndex(catalog)
+    scorer = PlaylistScorer(catalog)
+    scorer.song_tags, scorer.tag_songs  # 疎行列の構築は起動時の1回だけなので測定から除く
+    moods = set(catalog.meta["moods"])
+
+    rng = random.Random(1)
+    users = [set(rng.sample(range(args.songs), args.likes)) for _ in range(args.users)]
+
+    timings = {}
+    started = time.perf_counter()
+    for liked in users:
+        legacy_score(index, moods, liked)
+    timings["legacy"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    for liked in users:
+        scorer.score([liked])
+    timings["vectorized"] = time.perf_counter() - started
+
+    started = time.perf_counter()
+    scorer.score(users)
+    timings["vectorized_batch"] = time.perf_counter() - started
+
+    print(f"songs={args.songs} users={args.users}")
+    for name, elapsed in timings.items():
+        print(f"{name:>17}: {elapsed * 1000 / args.users:8.3f} ms/user  total {elapsed:7.3f} s")
+    print(json.dumps({
+        "songs": args.songs,
+        "users": args.users,
+        "ms_per_user": {name: elapsed * 1000 / args.users for name, elapsed in timings.items()},
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+# ワーカーの起動時間を測るベンチマーク（起動時間の悪化を検知するため、上限を指定すると超えた場合に失敗する）
+# - import: `python -X importtime -c "import app.main"` の合計時間と、自身の読み込み時間が長いモジュール
+# - first request: uvicorn のプロセスを起動してから GET /catalog が最初に200を返すまでの時間
+#   （カタログの読み込みは lifespan で行うため、この時間に含まれる）
+# いずれも合成カタログを事前にコンパイルした状態（エントリポイントと同じ）で、別プロセスで測る。
+# 使い方: python -m benchmarks.bench_startup --runs 5 --max-import-ms 1500 --max-first-request-ms 3000
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する（子プロセスに引き継ぐ）
+from benchmarks.synthetic_catalog import write_dataset
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def child_env(workdir: str) -> dict:
+    env = dict(os.environ)
+    env["PYTHONPATH"] = BACKEND_DIR + os.pathsep + env.get("PYTHONPATH", "")
+    env["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    env["PYTHONWARNINGS"] = "ignore"
+    return env
+
+
+def measure_import(workdir: str):
+    """app.main のインポート時間（ms）と、モジュールごとの自身の時間（ms）を返す"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import app.main"],
+        cwd=workdir, env=child_env(workdir), capture_output=True, text=True, check=True,
+    )
+    total, modules = None, {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():
+            continue
+        modules[name.strip()] = int(self_us) / 1000
+        if name.strip() == "app.main":
+            total = int(cumulative_us) / 1000
+    return total, modules
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def measure_first_request(workdir: str, timeout: float = 60.0) -> float:
+    """uvicorn を起動してから GET /catalog が200を返すまでの時間（ms）"""
+    port = free_port()
+    started = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=workdir, env=child_env(workdir), stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if proc.poll() is not None:
+                raise RuntimeError(f"uvicorn が終了しました: {proc.stderr.read().decode(errors='replace')}")
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/catalog", timeout=1) as res:
+                    if res.status == 200:
+                        return (time.perf_counter() - started) * 1000
+            except (urllib.error.URLError, ConnectionError):
+                time.sleep(0.005)
+        raise RuntimeError("タイムアウトしました")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ワーカーの起動時間（インポート・最初のリクエストまで）を測る")
+    parser.add_argument("--songs", type=int, default=20000, help="合成カタログの楽曲数")
+    parser.add_argument("--runs", type=int, default=5, help="それぞれの測定回数（中央値を使う）")
+    parser.add_argument("--top", type=int, default=10, help="表示する読み込みの遅いモジュール数")
+    parser.add_argument("--max-import-ms", type=float, help="インポート時間の上限（超えたら終了コード1）")
+    parser.add_argument("--max-first-request-ms", type=float, help="最初のリクエストまでの時間の上限（超えたら終了コード1）")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix="feel-tuning-bench-")
+    write_dataset(os.path.join(workdir, "data"), args.songs)
+    os.makedirs(os.path.join(workdir, "uploads"), exist_ok=True)
+    # エントリポイントと同じく事前にコンパイルしておく
+    subprocess.run([sys.executable, "-m", "app.services.catalog_store", "data"],
+                   cwd=workdir, env=child_env(workdir), check=True, capture_output=True)
+
+    import_ms, self_ms = [], {}
+    for _ in range(args.runs):
+        total, modules = measure_import(workdir)
+        import_ms.append(total)
+        for name, ms in modules.items():
+            self_ms.setdefault(name, []).append(ms)
+    first_request_ms = [measure_first_request(workdir) for _ in range(args.runs)]
+
+    slowest = sorted(((statistics.median(v), k) for k, v in self_ms.items()), reverse=True)[:args.top]
+    results = {
+        "songs": args.songs,
+        "runs": args.runs,
+        "import_ms": statistics.median(import_ms),
+        "first_request_ms": statistics.median(first_request_ms),
+        "slowest_modules": [{"module": name, "self_ms": ms} for ms, name in slowest],
+    }
+    print(f"import app.main:        {results['import_ms']:8.1f} ms (median of {args.runs})")
+    print(f"spawn -> first request: {results['first_request_ms']:8.1f} ms (median of {args.runs})")
+    print("slowest modules (self time):")
+    for item in results["slowest_modules"]:
+        print(f"  {item['self_ms']:8.1f} ms  {item['module']}")
+    print(json.dumps(results))
+
+    failed = []
+    if args.max_import_ms is not None and results["import_ms"] > args.max_import_ms:
+        failed.append(f"import {results['import_ms']:.0f}ms > {args.max_import_ms:.0f}ms")
+    if args.max_first_request_ms is not None and results["first_request_ms"] > args.max_first_request_ms:
+        failed.append(f"first request {results['first_request_ms']:.0f}ms > {args.max_first_request_ms:.0f}ms")
+    if failed:
+        print("起動時間が上限を超えました: " + ", ".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
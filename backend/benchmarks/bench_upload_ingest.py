@@ -0,0 +1,213 @@
+# /photo の画像受信について、変更前（UploadFile.read() で全体を bytes にし、保存・ハッシュ・Vision用の変換を
+# それぞれ bytes から行う）と、本文を読みながら保存する receive_upload のピークメモリを比較するベンチマーク
+# 方式・同時アップロード数ごとに別プロセスで実行し、/proc/self/status の VmHWM（RSSの最大値）が
+# 実行前の VmRSS からどれだけ増えたかを測る（Linuxのみ）。リクエスト本文は64KBずつASGIで渡し、
+# 画像の変換はアプリと同じく IMAGE_WORKERS 個のスレッドで行う。変換後は Vision API の応答待ちを
+# --vision-latency-ms だけ模擬する（変更前は待っている間も画像全体の bytes を保持していた）。
+# 上限サイズを超える本文（Content-Length なし）を何バイト読んだ時点で打ち切るかも確認する。
+# 使い方: python -m benchmarks.bench_upload_ingest --concurrency 1 8 --megapixels 12
+import argparse
+import asyncio
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+CHUNK = 64 * 1024
+BOUNDARY = "benchmarkboundary"
+
+
+def memory_kb(field: str) -> int:
+    with open("/proc/self/status") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} not found")
+
+
+def multipart_body(image_bytes: bytes) -> bytes:
+    head = (f"--{BOUNDARY}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"photo.jpg\"\r\n"
+            f"Content-Type: image/jpeg\r\n\r\n").encode()
+    return head + image_bytes + f"\r\n--{BOUNDARY}--\r\n".encode()
+
+
+def make_request(body_chunks, content_length=None):
+    """本文をチャンクで渡すASGIのリクエストを作る"""
+    from starlette.requests import Request
+
+    chunks = iter(body_chunks)
+
+    async def receive():
+        chunk = next(chunks, None)
+        if chunk is None:
+            return {"type": "http.request", "body": b"", "more_body": False}
+        return {"type": "http.request", "body": chunk, "more_body": True}
+
+    headers = [(b"content-type", f"multipart/form-data; boundary={BOUNDARY}".encode())]
+    if content_length is not None:
+        headers.append((b"content-length", str(content_length).encode()))
+    return Request({"type": "http", "method": "POST", "path": "/photo", "headers": headers}, receive)
+
+
+def chunked(data: bytes):
+    return (data[i:i + CHUNK] for i in range(0, len(data), CHUNK))
+
+
+async def legacy_upload(body: bytes, workdir: str, index: int, executor, latency: float):
+    """変更前と同じ処理: フォーム全体を解析し、bytes から保存・フィンガープリント・Vision用の変換を行う"""
+    from app.services.image_preprocess import prepare_vision_image
+    from app.services.mood_cache import image_fingerprint
+
+    loop = asyncio.get_running_loop()
+    form = await make_request(chunked(body), len(body)).form()
+    image_bytes = await form["file"].read()
+    with open(os.path.join(workdir, f"{index}_photo.jpg"), "wb") as f:
+        f.write(image_bytes)
+    await loop.run_in_executor(executor, image_fingerprint, image_bytes)
+    vision_image = await loop.run_in_executor(executor, prepare_vision_image, image_bytes)
+    await asyncio.sleep(latency)
+    await form.close()
+    return len(image_bytes) + len(vision_image[0])
+
+
+async def streaming_upload(body: bytes, store, index: int, executor, latency: float):
+    """変更後: 受信しながら保存し、フィンガープリントとVision用の変換はプレビューから行う"""
+    from app.services.image_preprocess import prepare_vision_image
+    from app.services.mood_cache import perceptual_hash
+    from app.services.upload_ingest import receive_upload
+
+    loop = asyncio.get_running_loop()
+    stored = await receive_upload(make_request(chunked(body), len(body)), store, max_bytes=len(body),
+                                  executor=executor)
+    preview = store.local_path(stored.preview_path)
+    await loop.run_in_executor(executor, perceptual_hash, preview)
+    vision_image = await loop.run_in_executor(executor, prepare_vision_image, preview)
+    await asyncio.sleep(latency)
+    return len(vision_image[0])
+
+
+def worker(mode: str, concurrency: int, image_path: str, latency_ms: float) -> dict:
+    import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+    from concurrent.futures import ThreadPoolExecutor
+
+    from app.core.config import settings
+    from app.services.upload_store import UploadStore
+    import app.services.upload_ingest  # noqa: F401  読み込み分のメモリを測定前に確保しておく
+
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+    workdir = tempfile.mkdtemp(prefix="feel-tuning-bench-")
+    # 同時アップロードは別々の画像として扱う（末尾のバイトを変えて内容ハッシュを変える）
+    bodies = [multipart_body(image_bytes + i.to_bytes(4, "big")) for i in range(concurrency)]
+    del image_bytes
+    store = UploadStore(os.path.join(workdir, "store"))
+    executor = ThreadPoolExecutor(max_workers=settings.IMAGE_WORKERS)
+    latency = latency_ms / 1000
+
+    async def run():
+        if mode == "legacy":
+            await asyncio.gather(*[legacy_upload(body, workdir, i, executor, latency) for i, body in enumerate(bodies)])
+        else:
+            await asyncio.gather(*[streaming_upload(body, store, i, executor, latency) for i, body in enumerate(bodies)])
+
+    body_kb = sum(len(b) for b in bodies) / 1024
+    baseline = memory_kb("VmRSS")
+    started = time.perf_counter()
+    asyncio.run(run())
+    elapsed = time.perf_counter() - started
+    peak_delta_mb = (memory_kb("VmHWM") - baseline) / 1024
+    return {
+        "mode": mode,
+        "concurrency": concurrency,
+        "request_body_mb": body_kb / 1024,
+        "peak_rss_delta_mb": peak_delta_mb,
+        "per_upload_mb": peak_delta_mb / concurrency,
+        "elapsed_ms": elapsed * 1000,
+    }
+
+
+def oversize_check(max_bytes: int) -> dict:
+    """Content-Length なしで上限の4倍の本文を送り、何バイト読んだ時点で413になるかを確かめる"""
+    import benchmarks  # noqa: F401
+    from fastapi import HTTPException
+
+    from app.services.upload_ingest import receive_upload
+    from app.services.upload_store import UploadStore
+
+    consumed = 0
+    body = multipart_body(os.urandom(max_bytes * 4))
+
+    def counting():
+        nonlocal consumed
+        for chunk in chunked(body):
+            consumed += len(chunk)
+            yield chunk
+
+    store = UploadStore(tempfile.mkdtemp(prefix="feel-tuning-bench-"))
+    try:
+        asyncio.run(receive_upload(make_request(counting()), store, max_bytes=max_bytes))
+        status = 200
+    except HTTPException as e:
+        status = e.status_code
+    return {"max_bytes": max_bytes, "sent_bytes": len(body), "consumed_bytes": consumed, "status": status,
+            "leftover_files": len(os.listdir(os.path.join(store.root, "incoming")))}
+
+
+def synthetic_photo(megapixels: float) -> bytes:
+    import numpy as np
+    from PIL import Image
+
+    height = int((megapixels * 1e6 * 4 / 3) ** 0.5)
+    width = int(height * 3 / 4)
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    pixels = np.clip(base + rng.integers(0, 48, size=(height, width, 3)), 0, 255).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="画像受信のピークメモリを比較する")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8], help="同時アップロード数")
+    parser.add_argument("--megapixels", type=float, default=12.0, help="合成写真の画素数（百万）")
+    parser.add_argument("--vision-latency-ms", type=float, default=500, help="模擬する Vision API の応答待ち")
+    parser.add_argument("--worker", choices=["legacy", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--image", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(worker(args.worker, args.concurrency[0], args.image, args.vision_latency_ms)))
+        return
+
+    image_path = os.path.join(tempfile.mkdtemp(prefix="feel-tuning-bench-"), "photo.jpg")
+    with open(image_path, "wb") as f:
+        f.write(synthetic_photo(args.megapixels))
+    results = []
+    for concurrency in args.concurrency:
+        for mode in ("legacy", "streaming"):
+            out = subprocess.run(
+                [sys.executable, "-m", "benchmarks.bench_upload_ingest", "--worker", mode,
+                 "--concurrency", str(concurrency), "--image", image_path,
+                 "--vision-latency-ms", str(args.vision_latency_ms)],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(out.strip().splitlines()[-1]))
+    oversize = oversize_check(max_bytes=2 * 1024 * 1024)
+
+    print(f"image: {os.path.getsize(image_path) / 1e6:.1f} MB ({args.megapixels:g} MP JPEG)")
+    for r in results:
+        print(f"{r['mode']:>9} x{r['concurrency']:<3} peak RSS +{r['peak_rss_delta_mb']:7.1f} MB "
+              f"({r['per_upload_mb']:6.1f} MB/upload)  {r['elapsed_ms']:7.0f} ms")
+    print(f" oversize: {oversize['status']} after reading {oversize['consumed_bytes'] / 1e6:.2f} of "
+          f"{oversize['sent_bytes'] / 1e6:.2f} MB (limit {oversize['max_bytes'] / 1e6:.2f} MB), "
+          f"leftover temp files: {oversize['leftover_files']}")
+    print(json.dumps({"megapixels": args.megapixels, "results": results, "oversize": oversize}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# アップロード画像の保存について、変更前（アップロードごとに uploads/{uuid}_{filename} へ原画像を保存）と
+# 内容ハッシュによる保存（重複は1つだけ・サムネイルとプレビューを作成）を比較するベンチマーク
+# - ディスク使用量: 一部のアップロードが同じ画像の再アップロードである場合の合計バイト数
+# - 履歴画面の転送量: 1ページ（20件）の画像を原画像で送る場合とサムネイルで送る場合
+# - 保存の処理時間: レンディション作成の分だけ増える1枚あたりの時間
+# 使い方: python -m benchmarks.bench_upload_store --uploads 200 --duplicate-ratio 0.3
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+import time
+import uuid
+
+import numpy as np
+from PIL import Image
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from app.services.upload_store import UploadStore
+from benchmarks.harness import percentile
+
+
+def synthetic_photo(rng: np.random.Generator, width: int, height: int) -> bytes:
+    """写真に近いサイズ・圧縮率のJPEG（グラデーション＋ノイズ）を作る"""
+    y, x = np.mgrid[0:height, 0:width]
+    base = np.stack([x * 255 // width, y * 255 // height, (x + y) * 255 // (width + height)], axis=-1)
+    noise = rng.integers(0, 48, size=(height, width, 3))
+    pixels = np.clip(base + noise, 0, 255).astype(np.uint8)
+    output = io.BytesIO()
+    Image.fromarray(pixels).save(output, format="JPEG", quality=90)
+    return output.getvalue()
+
+
+def dir_bytes(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="内容ハッシュによるアップロード保存のディスク使用量・転送量を比較する")
+    parser.add_argument("--uploads", type=int, default=200, help="アップロード回数")
+    parser.add_argument("--duplicate-ratio", type=float, default=0.3, help="既出の画像の再アップロードの割合")
+    parser.add_argument("--width", type=int, default=3024)
+    parser.add_argument("--height", type=int, default=4032)
+    parser.add_argument("--distinct", type=int, default=20, help="生成する異なる画像の数（生成に時間がかかるため使い回す）")
+    parser.add_argument("--page-size", type=int, default=20, help="履歴画面の1ページの件数")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    pick = random.Random(0)
+    photos = [synthetic_photo(rng, args.width, args.height) for _ in range(args.distinct)]
+    # 同じバイト列にならないよう、画像ごとに末尾へ識別用のバイトを足して「別の写真」とする
+    fresh = (photos[i % args.distinct] + i.to_bytes(4, "big") for i in range(args.uploads))
+    uploads = []
+    for _ in range(args.uploads):
+        if uploads and pick.random() < args.duplicate_ratio:
+            uploads.append(pick.choice(uploads))
+        else:
+            uploads.append(next(fresh))
+
+    workdir = tempfile.mkdtemp(prefix="feel-tuning-bench-")
+    legacy_dir = os.path.join(workdir, "legacy")
+    os.makedirs(legacy_dir)
+    legacy_ms = []
+    for image_bytes in uploads:
+        started = time.perf_counter()
+        with open(os.path.join(legacy_dir, f"{uuid.uuid4().hex}_photo.jpg"), "wb") as f:
+            f.write(image_bytes)
+        legacy_ms.append((time.perf_counter() - started) * 1000)
+
+    store = UploadStore(os.path.join(workdir, "store"))
+    stored, store_ms = [], []
+    for image_bytes in uploads:
+        started = time.perf_counter()
+        stored.append(store.put(image_bytes))
+        store_ms.append((time.perf_counter() - started) * 1000)
+
+    def disk_size(public_path: str) -> int:
+        return os.path.getsize(store.resolve(public_path.split("/", 1)[1]))
+
+    page = stored[-args.page_size:]
+    results = {
+        "uploads": args.uploads,
+        "distinct_images": len(set(uploads)),
+        "legacy": {
+            "disk_mb": dir_bytes(legacy_dir) / 1e6,
+            "history_page_mb": sum(len(b) for b in uploads[-args.page_size:]) / 1e6,
+            "put_p50_ms": percentile(legacy_ms, 50),
+        },
+        "content_addressed": {
+            "disk_mb": dir_bytes(store.root) / 1e6,
+            "history_page_mb": sum(disk_size(s.thumbnail_path) for s in page) / 1e6,
+            "preview_kb": sum(disk_size(s.preview_path) for s in page) / len(page) / 1e3,
+            "put_p50_ms": percentile(store_ms, 50),
+            "put_p95_ms": percentile(store_ms, 95),
+        },
+    }
+
+    for name in ("legacy", "content_addressed"):
+        r = results[name]
+        print(f"{name:>17}: disk={r['disk_mb']:8.1f}MB  history page={r['history_page_mb']:7.2f}MB  "
+              f"put p50={r['put_p50_ms']:.1f}ms")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
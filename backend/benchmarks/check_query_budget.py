@@ -0,0 +1,153 @@
+# エンドポイントごとのSQLの実行回数を確認するスクリプト（クエリ数の上限を超えたら終了コード1。CIで実行する）
+# 1ユーザー分のセッション（/signup → /login → /token/refresh → /photo → /swipe → /swipe/queue → /swipe/batch →
+# /playlist → /history → /history/export → /logout）を、認証・スワイプ状態のキャッシュが空の状態と温まった状態の
+# 両方で流し、リクエストごとのクエリ数・行数・DB時間をルートごとの最大値で表示する。
+# 値は QueryStatsMiddleware の on_finish で受け取る（StreamingResponse の本文の生成中のクエリも含む）。
+# スワイプログのINSERTは SwipeLogWriter のスレッドで行うため、/swipe・/swipe/batch の値には含まれない。
+# 上限は DB_QUERY_BUDGETS（設定）を --budget で上書きしたもので、超えたルートをすべて表示して失敗にする
+# （tests/test_query_budget.py は DB_QUERY_BUDGET_MODE=raise で同じセッションを流し、超えたリクエストを失敗にする）。
+# 同じSQL文を繰り返したリクエスト（N+1 の疑い）は --max-repeat を超えたら失敗にする。
+# 使い方: python -m benchmarks.check_query_budget --budget "POST /swipe=3" --output queries.json
+import argparse
+import json
+import os
+import sys
+
+from benchmarks.fake_vision import FakeAsyncOpenAI
+from benchmarks.harness import prepare_app, run_metadata
+from benchmarks.load_photo_swipe import make_image
+
+
+def parse_budgets(values) -> dict:
+    """"POST /swipe=3" の形式の指定を {ルート: 上限} にする"""
+    budgets = {}
+    for value in values:
+        route, _, limit = value.rpartition("=")
+        if not route or not limit.isdigit():
+            raise SystemExit(f"--budget は \"メソッド ルート=件数\" の形式で指定してください: {value}")
+        budgets[route.strip()] = int(limit)
+    return budgets
+
+
+def run_session(client, services, routers, args) -> None:
+    """1ユーザー分のセッションを、キャッシュが空の状態と温まった状態で args.users 人分流す"""
+    cold = False
+
+    def request(method, url, expect=200, **kwargs):
+        if cold:
+            # 認証をDBで確認する場合のクエリ数も確認する
+            services.PRINCIPAL_CACHE.clear()
+        res = client.request(method, url, **kwargs)
+        if res.status_code != expect:
+            raise SystemExit(f"{method} {url} が {res.status_code} を返しました: {res.text[:200]}")
+        return res
+
+    for user in range(args.users):
+        email = f"query-budget-{user}@example.com"
+        tokens = request("POST", "/signup", json={"email": email, "password": "budget"}).json()
+        tokens = request("POST", "/login", data={"username": email, "password": "budget"}).json()
+        tokens = request("POST", "/token/refresh", json={"refresh_token": tokens["refresh_token"]}).json()
+        headers = {"Authorization": f"Bearer {tokens['access_token']}"}
+
+        # 1周目はキャッシュが空の状態（スワイプ状態は最初の /swipe でDBから復元される）
+        for cold in (True, False):
+            image = make_image(640, 480) + bytes([user, cold])
+            songs = request("POST", "/photo", files={"file": ("photo.jpg", image, "image/jpeg")},
+                            headers=headers).json()["songs"]
+            # 小さな合成カタログでは、推定したムードとその近傍に楽曲が無く空になることがある
+            song_id = songs[0]["id"] if songs else routers.CATALOG_MANAGER.current.song_index.song(0)["id"]
+            for i in range(args.swipes):
+                song_id = request("POST", "/swipe", json={"song_id": song_id, "liked": i % 3 == 0},
+                                  headers=headers).json()["song"]["id"]
+            queue = request("GET", "/swipe/queue?size=10", headers=headers).json()
+            swipes = [{"song_id": s["id"], "liked": j % 2 == 0} for j, s in enumerate(queue["songs"][:5])]
+            request("POST", "/swipe/batch", json={"swipes": swipes, "queue": [s["id"] for s in queue["songs"][5:]],
+                                                  "phase": queue["phase"], "size": 10}, headers=headers)
+            # プレイリストは Like 済みの曲から作るため、書き込み待ちのスワイプをDBに書き切っておく
+            routers.SWIPE_LOG.flush()
+            for _ in range(args.playlists):
+                request("GET", "/playlist", headers=headers)
+            page = request("GET", "/history?limit=2", headers=headers).json()
+            if page["next_cursor"]:
+                request("GET", f"/history?limit=2&cursor={page['next_cursor']}", headers=headers)
+            request("GET", "/history/export", headers=headers)
+        request("POST", "/logout", expect=204, json={"refresh_token": tokens["refresh_token"]})
+
+
+def summarize(records, budgets) -> dict:
+    """ルートごとに、リクエスト数とクエリ数・行数・DB時間・繰り返しの最大値をまとめる"""
+    routes = {}
+    for r in records:
+        s = routes.setdefault(r["route"], {"requests": 0, "max_queries": 0, "max_rows": 0, "max_db_ms": 0.0,
+                                           "max_repeat": 0, "budget": budgets.get(r["route"])})
+        s["requests"] += 1
+        s["max_queries"] = max(s["max_queries"], r["queries"])
+        s["max_rows"] = max(s["max_rows"], r["rows"])
+        s["max_db_ms"] = max(s["max_db_ms"], r["db_ms"])
+        s["max_repeat"] = max(s["max_repeat"], r["max_repeat"])
+    return dict(sorted(routes.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="エンドポイントごとのSQLの実行回数を上限と比べる")
+    parser.add_argument("--budget", nargs="*", default=[], help="上限（\"メソッド ルート=件数\"、設定の値を上書きする）")
+    parser.add_argument("--max-repeat", type=int, default=4, help="1リクエストで同じSQL文を実行してよい回数")
+    parser.add_argument("--users", type=int, default=2, help="セッションを流すユーザー数")
+    parser.add_argument("--swipes", type=int, default=8, help="1セッションのスワイプ数")
+    parser.add_argument("--playlists", type=int, default=3, help="1セッションで作るプレイリストの数")
+    parser.add_argument("--songs", type=int, default=5000, help="合成カタログの楽曲数")
+    parser.add_argument("--database-url", help="接続先DB（省略時は一時ディレクトリのSQLite）")
+    parser.add_argument("--output", help="結果のJSONを書き出すファイル")
+    args = parser.parse_args()
+
+    # 上限はこのスクリプトで確認するため、ミドルウェアでは例外にしない
+    os.environ["DB_QUERY_STATS_ENABLED"] = "true"
+    os.environ["DB_QUERY_BUDGET_MODE"] = "off"
+    app = prepare_app(songs=args.songs, database_url=args.database_url)
+    from fastapi.testclient import TestClient
+
+    from app import routers, services
+    from app.core.config import settings
+
+    budgets = {**settings.DB_QUERY_BUDGETS, **parse_budgets(args.budget)}
+    records = []
+
+    def record(method, route, stats):
+        records.append({"route": f"{method} {route}", "queries": stats.queries, "rows": stats.rows,
+                        "db_ms": stats.duration * 1000, "max_repeat": stats.most_repeated()[1]})
+
+    # ミドルウェアはアプリの起動時に作られるため、TestClient に入る前に引数を差し替える
+    for middleware in app.user_middleware:
+        if middleware.cls is services.QueryStatsMiddleware:
+            middleware.kwargs["on_finish"] = record
+
+    moods = [m for m in routers.CATALOG_MANAGER.current.mood_similarity.keys() if m.isalpha() and m.isascii()]
+    routers.openai_client = FakeAsyncOpenAI(moods, latency=0.0)
+    with TestClient(app) as client:
+        run_session(client, services, routers, args)
+
+    failures = []
+    routes = summarize(records, budgets)
+    for route, s in routes.items():
+        budget = "-" if s["budget"] is None else s["budget"]
+        print(f"{route:<26} n={s['requests']:>3} queries max={s['max_queries']:>3} (budget {budget:>3})  "
+              f"rows max={s['max_rows']:>4}  db max={s['max_db_ms']:7.2f}ms  repeat max={s['max_repeat']}")
+        if s["max_repeat"] > args.max_repeat:
+            failures.append(f"{route} で同じSQL文を {s['max_repeat']} 回実行しました（上限 {args.max_repeat} 回）")
+        if s["budget"] is not None and s["max_queries"] > s["budget"]:
+            failures.append(f"{route} で {s['max_queries']} 件のクエリを実行しました（上限 {s['budget']} 件）")
+    unchecked = sorted(set(routes) - set(budgets))
+    if unchecked:
+        print("上限が設定されていないルート: " + ", ".join(unchecked))
+    report = {"meta": run_metadata(args), "budgets": budgets, "routes": routes, "failures": failures}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=1)
+    print(json.dumps(report))
+    if failures:
+        print("\n".join(failures), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
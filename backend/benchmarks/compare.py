@@ -0,0 +1,58 @@
+# 2つのベンチマーク結果（bench_endpoints などの --output のJSON）を比較するファイル
+# (songs, history, endpoint) が同じ行どうしで p50/p95/p99 とリクエストあたりの確保量の変化率を表示し、
+# --max-regression を指定すると、p95 がそれ以上悪化した行がある場合に終了コード1で終わる。
+# 使い方: python -m benchmarks.compare before.json after.json --max-regression 10
+import argparse
+import json
+import sys
+
+KEY_FIELDS = ("songs", "history", "endpoint")
+METRICS = ("p50_ms", "p95_ms", "p99_ms", "alloc_peak_kb")
+
+
+def load(path: str) -> dict:
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def change(before: float, after: float) -> float:
+    """変化率（%）。増えたら正"""
+    return (after - before) / before * 100 if before else 0.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="2つのベンチマーク結果を比較する")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--max-regression", type=float, help="p95 の悪化の許容値（%%、超えたら終了コード1）")
+    args = parser.parse_args()
+
+    before, after = load(args.before), load(args.after)
+    for label, report in (("before", before), ("after", after)):
+        meta = report.get("meta", {})
+        print(f"{label:>6}: {(meta.get('commit') or '?')[:12]}{'+dirty' if meta.get('dirty') else ''} "
+              f"{meta.get('timestamp', '')} python {meta.get('python', '?')}")
+
+    base = {tuple(r.get(k) for k in KEY_FIELDS): r for r in before["results"]}
+    rows, regressions = [], []
+    print(f"{'songs':>8} {'history':>7} {'endpoint':<13} " + " ".join(f"{m:>22}" for m in METRICS))
+    for r in after["results"]:
+        key = tuple(r.get(k) for k in KEY_FIELDS)
+        if key not in base:
+            continue
+        deltas = {m: change(base[key][m], r[m]) for m in METRICS}
+        rows.append({**dict(zip(KEY_FIELDS, key)), **{f"{m}_change_pct": d for m, d in deltas.items()}})
+        print(f"{key[0]:>8} {key[1]:>7} {key[2]:<13} " + " ".join(
+            f"{base[key][m]:8.2f}->{r[m]:8.2f} {deltas[m]:+5.0f}%" for m in METRICS))
+        if args.max_regression is not None and deltas["p95_ms"] > args.max_regression:
+            regressions.append(rows[-1])
+    print(json.dumps({"before": before.get("meta", {}).get("commit"), "after": after.get("meta", {}).get("commit"),
+                      "rows": rows, "regressions": regressions}))
+
+    if regressions:
+        print(f"p95 が {args.max_regression:g}% 以上悪化した行があります: {len(regressions)}件", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
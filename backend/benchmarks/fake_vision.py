@@ -0,0 +1,40 @@
+# OpenAIのVisionモデル（chat.completions）の代わりに使うスタブ
+# 指定した遅延の後、固定またはランダムなムードを返す（error_rate の割合で例外を送出する）。外部APIは呼び出さない
+import asyncio
+import random
+from types import SimpleNamespace
+from typing import Optional, Sequence
+
+
+class FakeCompletions:
+    def __init__(self, moods: Sequence[str], latency: float, mood: Optional[str] = None, error_rate: float = 0.0):
+        self.moods = list(moods)
+        self.latency = latency
+        self.mood = mood
+        self.error_rate = error_rate
+        self.calls = 0
+        self.errors = 0
+
+    async def create(self, **kwargs):
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.error_rate and random.random() < self.error_rate:
+            self.errors += 1
+            raise RuntimeError("fake vision error")
+        content = self.mood or random.choice(self.moods)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class FakeAsyncOpenAI:
+    """AsyncOpenAI と同じ呼び出し方（client.chat.completions.create）ができるスタブ"""
+
+    def __init__(self, moods: Sequence[str], latency: float = 1.0, mood: Optional[str] = None, error_rate: float = 0.0):
+        self.chat = SimpleNamespace(completions=FakeCompletions(moods, latency, mood, error_rate))
+
+    @property
+    def calls(self) -> int:
+        return self.chat.completions.calls
+
+    @property
+    def errors(self) -> int:
+        return self.chat.completions.errors
@@ -0,0 +1,75 @@
+# ベンチマーク用にアプリを一時ディレクトリで起動する準備を行うファイル
+# 合成カタログ（data/）とアップロード先（uploads/）を作り、DBを初期化してから app.main をインポートする
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Optional
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from benchmarks.synthetic_catalog import write_dataset
+
+
+def prepare_app(songs: int = 20000, database_url: Optional[str] = None, workdir: Optional[str] = None, seed: int = 0,
+                embedding_dim: int = 0):
+    """合成データでFastAPIアプリを用意して返す。
+
+    Args:
+        songs (int): 合成カタログの楽曲数。
+        database_url (str, optional): 接続先DB（省略時は一時ディレクトリのSQLite）。
+        workdir (str, optional): 作業ディレクトリ（省略時は一時ディレクトリを作成）。
+        seed (int): 合成カタログの乱数シード。
+        embedding_dim (int): 合成カタログに付ける埋め込みの次元（0なら埋め込みなし）。
+    Returns:
+        FastAPI: アプリケーションインスタンス。
+    """
+    workdir = workdir or tempfile.mkdtemp(prefix="feel-tuning-bench-")
+    write_dataset(os.path.join(workdir, "data"), songs, seed, embedding_dim)
+    os.makedirs(os.path.join(workdir, "uploads"), exist_ok=True)
+    os.environ["SQLALCHEMY_DATABASE_URI"] = database_url or f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.chdir(workdir)
+
+    from app.database import engine
+    from app.db.base_class import Base
+    import app.models  # noqa: F401
+
+    Base.metadata.drop_all(engine)
+    Base.metadata.create_all(engine)
+
+    from app.main import app
+    return app
+
+
+def percentile(values, q: float) -> float:
+    """値のリストのq分位点（0〜100）を返す"""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    k = (len(ordered) - 1) * q / 100
+    lo, hi = int(k), min(int(k) + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def run_metadata(args=None) -> dict:
+    """結果をコミット間で比較できるよう、測定した環境（コミット・Python・マシン・引数）を返す"""
+    backend_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    def git(*command):
+        try:
+            return subprocess.run(["git", *command], cwd=backend_dir, capture_output=True, text=True,
+                                  check=True).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    status = git("status", "--porcelain")
+    return {
+        "commit": git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "args": vars(args) if args is not None else {},
+    }
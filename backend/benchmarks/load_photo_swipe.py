@@ -0,0 +1,124 @@
+# /photo を多数同時に処理している間の /swipe のレイテンシを測る負荷試験
+# 対象サーバーは別プロセス（benchmarks.serve）で起動し、Vision API はスタブで指定した遅延で応答させる
+# 使い方: python -m benchmarks.load_photo_swipe --photos 64 --vision-latency 2.0 --duration 10
+import argparse
+import asyncio
+import io
+import json
+import subprocess
+import sys
+import time
+
+import httpx
+from PIL import Image
+
+from benchmarks.harness import percentile
+
+
+def make_image(width: int, height: int) -> bytes:
+    buf = io.BytesIO()
+    Image.effect_noise((width, height), 64).convert("RGB").save(buf, format="JPEG", quality=90)
+    return buf.getvalue()
+
+
+async def signup(client: httpx.AsyncClient, email: str) -> dict:
+    res = await client.post("/signup", json={"email": email, "password": "benchmark"})
+    res.raise_for_status()
+    return {"Authorization": f"Bearer {res.json()['access_token']}"}
+
+
+async def swipe_loop(client, headers, song_id: int, stop_at: float, latencies: list):
+    liked = False
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        res = await client.post("/swipe", json={"song_id": song_id, "liked": liked}, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        res.raise_for_status()
+        song_id = res.json()["song"]["id"]
+        liked = not liked
+
+
+async def photo_loop(client, headers, image: bytes, stop_at: float, latencies: list):
+    while time.perf_counter() < stop_at:
+        started = time.perf_counter()
+        res = await client.post("/photo", files={"file": ("bench.jpg", image, "image/jpeg")}, headers=headers)
+        latencies.append(time.perf_counter() - started)
+        if res.status_code != 200:
+            raise RuntimeError(f"/photo failed: {res.status_code} {res.text}")
+
+
+def summarize(latencies: list) -> dict:
+    return {
+        "count": len(latencies),
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def wait_until_ready(client: httpx.AsyncClient, timeout: float = 120.0):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        try:
+            if (await client.get("/")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("サーバーが起動しませんでした")
+
+
+async def run(args) -> dict:
+    server = subprocess.Popen([
+        sys.executable, "-m", "benchmarks.serve", "--port", str(args.port), "--songs", str(args.songs),
+        "--vision-latency", str(args.vision_latency),
+    ], stdout=subprocess.DEVNULL)
+    image = make_image(args.image_width, args.image_height)
+    limits = httpx.Limits(max_connections=args.swipers + args.photos)
+    try:
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=None, limits=limits) as client:
+            await wait_until_ready(client)
+            swipers = [await signup(client, f"swiper{i}@example.com") for i in range(args.swipers)]
+            uploaders = [await signup(client, f"uploader{i}@example.com") for i in range(args.photos)]
+            first_song = (await client.post("/photo", files={"file": ("bench.jpg", image, "image/jpeg")},
+                                            headers=swipers[0])).json()["songs"][0]["id"]
+
+            results = {}
+            for phase, with_photos in (("baseline", False), ("with_photos", True)):
+                swipe_latencies, photo_latencies = [], []
+                stop_at = time.perf_counter() + args.duration
+                tasks = [swipe_loop(client, h, first_song, stop_at, swipe_latencies) for h in swipers]
+                if with_photos:
+                    tasks += [photo_loop(client, h, image, stop_at, photo_latencies) for h in uploaders]
+                await asyncio.gather(*tasks)
+                results[phase] = {"swipe": summarize(swipe_latencies)}
+                if with_photos:
+                    results[phase]["photo"] = summarize(photo_latencies)
+    finally:
+        server.terminate()
+        server.wait()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/photo の同時実行中の /swipe レイテンシを測定する")
+    parser.add_argument("--port", type=int, default=8765, help="対象サーバーのポート")
+    parser.add_argument("--songs", type=int, default=20000, help="合成カタログの楽曲数")
+    parser.add_argument("--swipers", type=int, default=8, help="/swipe を送り続けるユーザー数")
+    parser.add_argument("--photos", type=int, default=64, help="同時に /photo を送り続けるユーザー数")
+    parser.add_argument("--vision-latency", type=float, default=2.0, help="Vision API スタブの応答時間（秒）")
+    parser.add_argument("--image-width", type=int, default=4032)
+    parser.add_argument("--image-height", type=int, default=3024)
+    parser.add_argument("--duration", type=float, default=10.0, help="各フェーズの測定時間（秒）")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    for phase in ("baseline", "with_photos"):
+        for endpoint, s in results[phase].items():
+            print(f"{phase:>12} {endpoint:>6}: n={s['count']:>5} p50={s['p50_ms']:8.1f}ms "
+                  f"p95={s['p95_ms']:8.1f}ms p99={s['p99_ms']:8.1f}ms")
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
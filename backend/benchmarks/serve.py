@@ -0,0 +1,70 @@
+# 合成カタログとVision APIスタブでアプリをuvicornで起動するファイル（負荷試験の対象サーバー）
+# 負荷試験から飽和状態を観測できるよう、GET /_bench/stats でスレッドプール・DB接続プール・
+# 画像処理用スレッドの使用状況を返す（このサーバーでのみ追加するルート）。
+# 使い方: python -m benchmarks.serve --port 8765 --songs 20000 --vision-latency 2.0
+import argparse
+
+import uvicorn
+
+from benchmarks.fake_vision import FakeAsyncOpenAI
+from benchmarks.harness import prepare_app
+
+
+def add_stats_route(app, vision):
+    """GET /_bench/stats（その時点のスレッドプール・DB接続プールの使用状況）を追加する"""
+    from anyio import to_thread
+
+    from app import routers
+    from app.database import engine
+
+    @app.get("/_bench/stats", include_in_schema=False)
+    async def bench_stats():
+        # 同期エンドポイント・run_in_threadpool が使う anyio のスレッド数の上限
+        limiter = to_thread.current_default_thread_limiter().statistics()
+        pool = engine.pool
+        executor = routers.IMAGE_EXECUTOR
+        return {
+            "threadpool": {
+                "busy": limiter.borrowed_tokens,
+                "size": limiter.total_tokens,
+                "waiting": limiter.tasks_waiting,
+            },
+            "db_pool": {
+                "checked_out": pool.checkedout() if hasattr(pool, "checkedout") else None,
+                "size": pool.size() if hasattr(pool, "size") else None,
+                "overflow": pool.overflow() if hasattr(pool, "overflow") else None,
+                "max_overflow": getattr(pool, "_max_overflow", None),
+            },
+            # ThreadPoolExecutor は使用中のスレッド数を公開しないため、待機中のスレッド数から求める
+            "image_executor": {
+                "busy": len(executor._threads) - executor._idle_semaphore._value,
+                "size": executor._max_workers,
+                "queued": executor._work_queue.qsize(),
+            },
+            "vision": {"calls": vision.calls, "errors": vision.errors},
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ベンチマーク用にアプリを起動する")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--songs", type=int, default=20000, help="合成カタログの楽曲数")
+    parser.add_argument("--embedding-dim", type=int, default=0, help="合成カタログの埋め込みの次元（0なら埋め込みなし）")
+    parser.add_argument("--database-url", help="接続先DB（省略時は一時ディレクトリのSQLite）")
+    parser.add_argument("--vision-latency", type=float, default=2.0, help="Vision API スタブの応答時間（秒）")
+    parser.add_argument("--vision-error-rate", type=float, default=0.0, help="Vision API スタブが失敗する割合")
+    args = parser.parse_args()
+
+    app = prepare_app(songs=args.songs, database_url=args.database_url, embedding_dim=args.embedding_dim)
+    from app import routers
+
+    # 英小文字のみのムード（routers 側の正規化で変化しないもの）を返させる
+    moods = [m for m in routers.CATALOG_MANAGER.current.mood_similarity.keys() if m.isalpha() and m.isascii()]
+    routers.openai_client = FakeAsyncOpenAI(moods, latency=args.vision_latency, error_rate=args.vision_error_rate)
+    add_stats_route(app, routers.openai_client)
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,201 @@
+# ベンチマーク用の合成楽曲カタログを生成するファイル
+# 実際の楽曲データ（filtered_songs_4_or_more_tags.json）はリポジトリに含まれないため、
+# ムード・楽器の語彙は data/ の類似度データから取得して同じ形式の楽曲を生成する
+# タグの分布は実データに近づける:
+# - ムード・楽器・ジャンルの出現頻度は少数に集中する（Zipf分布）
+# - 1曲のムードは主ムードとそれに類似したムード（mood_similarity の上位）の組み合わせ
+# - 楽器は主ムードと相性の良いもの（mood_instrument_similarity の上位）ほど選ばれやすい
+# 埋め込みを付ける場合は、タグごとのベクトルの和にノイズを加えたもの（タグが近い曲ほど近い）を使う。
+# 使い方: python -m benchmarks.synthetic_catalog --songs 1000000 --out /tmp/catalog-1m [--embedding-dim 32]
+import argparse
+import json
+import os
+import shutil
+from typing import Iterator, List
+
+import numpy as np
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data")
+SIMILARITY_FILES = ("mood_similarity.json", "mood_instrument_similarity.json")
+GENRES = ["pop", "rock", "electronic", "jazz", "classical", "ambient", "hiphop", "folk", "soundtrack", "world"]
+
+# タグの出現頻度の偏り（Zipf分布の指数）
+ZIPF_EXPONENT = 1.1
+# 副ムードを選ぶ範囲（主ムードとの類似度の上位件数）と、順位ごとの選ばれやすさの減衰率
+NEIGHBOR_MOODS = 16
+NEIGHBOR_DECAY = 0.8
+# 楽器の相性の順位ごとの選ばれやすさの減衰率
+INSTRUMENT_DECAY = 0.85
+# 1曲あたりの副ムード数・楽器数・ジャンル数とその確率（主ムードと合わせてタグは4つ以上）
+EXTRA_MOODS = ((1, 2, 3), (0.4, 0.4, 0.2))
+INSTRUMENTS_PER_SONG = ((1, 2, 3), (0.35, 0.45, 0.2))
+GENRES_PER_SONG = ((1, 2), (0.9, 0.1))
+# 一度に生成する楽曲数（100万曲でもメモリを使い切らないよう分割する）
+CHUNK_SIZE = 50000
+
+
+def load_vocabulary(data_dir: str = DATA_DIR):
+    """ムードと楽器の語彙を類似度データから読み込む"""
+    with open(os.path.join(data_dir, "mood_similarity.json"), encoding="utf-8") as f:
+        moods = list(json.load(f).keys())
+    with open(os.path.join(data_dir, "mood_instrument_similarity.json"), encoding="utf-8") as f:
+        instruments = list(next(iter(json.load(f).values())).keys())
+    return moods, instruments
+
+
+def _zipf(n: int, rng: np.random.Generator) -> np.ndarray:
+    """n個の語彙に、ランダムな順でZipf分布の出現確率を割り当てる"""
+    weights = 1.0 / np.arange(1, n + 1) ** ZIPF_EXPONENT
+    return rng.permutation(weights / weights.sum())
+
+
+def _pick(weights: np.ndarray, counts: np.ndarray, rng: np.random.Generator) -> List[List[int]]:
+    """行ごとの重み（件数×候補数）に従い、行ごとに counts 個を重複なしで選ぶ（Gumbel top-k）"""
+    keys = np.log(np.maximum(weights, 1e-12)) + rng.gumbel(size=weights.shape)
+    order = np.argsort(-keys, axis=1)[:, :int(counts.max())]
+    return [row[:k] for row, k in zip(order.tolist(), counts.tolist())]
+
+
+def _draw_counts(spec, size: int, rng: np.random.Generator) -> np.ndarray:
+    values, probs = spec
+    return rng.choice(values, size=size, p=probs)
+
+
+class _Vocabulary:
+    """類似度データから作る語彙と、タグを選ぶための重み"""
+
+    def __init__(self, data_dir: str, rng: np.random.Generator):
+        with open(os.path.join(data_dir, "mood_similarity.json"), encoding="utf-8") as f:
+            mood_similarity = json.load(f)
+        with open(os.path.join(data_dir, "mood_instrument_similarity.json"), encoding="utf-8") as f:
+            mood_inst_similarity = json.load(f)
+        self.moods = list(mood_similarity.keys())
+        self.instruments = list(next(iter(mood_inst_similarity.values())).keys())
+        mood_index = {m: i for i, m in enumerate(self.moods)}
+        inst_index = {t: i for i, t in enumerate(self.instruments)}
+
+        self.mood_prob = _zipf(len(self.moods), rng)
+        self.genre_prob = _zipf(len(GENRES), rng)
+        inst_prob = _zipf(len(self.instruments), rng)
+
+        # ムードごとの類似ムード（自身を除く上位 NEIGHBOR_MOODS 件）
+        similarity = np.full((len(self.moods), len(self.moods)), -np.inf)
+        for mood, row in mood_similarity.items():
+            for other, score in row.items():
+                if other in mood_index and other != mood:
+                    similarity[mood_index[mood], mood_index[other]] = score
+        self.neighbors = np.argsort(-similarity, axis=1)[:, :NEIGHBOR_MOODS]
+        self.neighbor_weights = NEIGHBOR_DECAY ** np.arange(NEIGHBOR_MOODS)
+
+        # ムードごとの楽器の選ばれやすさ（相性の順位による減衰 × 楽器自体の出現頻度）
+        affinity = np.full((len(self.moods), len(self.instruments)), -np.inf)
+        for mood, row in mood_inst_similarity.items():
+            for inst, score in row.items():
+                if mood in mood_index and inst in inst_index:
+                    affinity[mood_index[mood], inst_index[inst]] = score
+        rank = np.argsort(np.argsort(-affinity, axis=1), axis=1)
+        self.instrument_weights = INSTRUMENT_DECAY ** rank * inst_prob
+
+
+def iter_songs(n: int, seed: int = 0, data_dir: str = DATA_DIR, embedding_dim: int = 0) -> Iterator[List[dict]]:
+    """楽曲データと同じ形式の合成楽曲をn件、CHUNK_SIZE 件ずつ生成する"""
+    rng = np.random.default_rng(seed)
+    vocab = _Vocabulary(data_dir, rng)
+    if embedding_dim:
+        mood_vectors = rng.normal(size=(len(vocab.moods), embedding_dim)).astype(np.float32)
+        inst_vectors = rng.normal(scale=0.5, size=(len(vocab.instruments), embedding_dim)).astype(np.float32)
+        genre_vectors = rng.normal(scale=0.5, size=(len(GENRES), embedding_dim)).astype(np.float32)
+
+    for start in range(0, n, CHUNK_SIZE):
+        size = min(CHUNK_SIZE, n - start)
+        primary = rng.choice(len(vocab.moods), size=size, p=vocab.mood_prob)
+        extra = _pick(np.broadcast_to(vocab.neighbor_weights, (size, NEIGHBOR_MOODS)),
+                      _draw_counts(EXTRA_MOODS, size, rng), rng)
+        instruments = _pick(vocab.instrument_weights[primary], _draw_counts(INSTRUMENTS_PER_SONG, size, rng), rng)
+        genres = _pick(np.broadcast_to(vocab.genre_prob, (size, len(GENRES))),
+                       _draw_counts(GENRES_PER_SONG, size, rng), rng)
+        artists = rng.zipf(1.5, size=size) % 5000
+
+        songs = []
+        for k in range(size):
+            mood_ids = [int(primary[k])] + vocab.neighbors[primary[k], extra[k]].tolist()
+            songs.append({
+                "id": start + k + 1,
+                "title": f"Synthetic Song {start + k + 1}",
+                "artist": f"Synthetic Artist {artists[k]}",
+                "tags": {
+                    "genre": [GENRES[g] for g in genres[k]],
+                    "instrument": [vocab.instruments[i] for i in instruments[k]],
+                    "mood": [vocab.moods[m] for m in mood_ids],
+                },
+                "url": f"https://example.com/preview/{start + k + 1}.mp3",
+            })
+            if embedding_dim:
+                vector = (mood_vectors[mood_ids].sum(axis=0) + inst_vectors[instruments[k]].sum(axis=0)
+                          + genre_vectors[genres[k]].sum(axis=0) + rng.normal(scale=0.5, size=embedding_dim))
+                songs[-1]["embedding"] = np.round(vector, 4).tolist()
+        yield songs
+
+
+def generate_songs(n: int, seed: int = 0, data_dir: str = DATA_DIR, embedding_dim: int = 0) -> List[dict]:
+    """楽曲データと同じ形式の合成楽曲をn件生成する（タグは4つ以上）"""
+    return [song for chunk in iter_songs(n, seed, data_dir, embedding_dim) for song in chunk]
+
+
+def generate_embeddings(n: int, dim: int = 768, clusters: int = 64, seed: int = 0) -> np.ndarray:
+    """楽曲の埋め込みに似せた（いくつかのクラスタに偏った）合成ベクトルを生成する"""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, clusters, size=n)
+    return centers[labels] + rng.normal(scale=0.8, size=(n, dim)).astype(np.float32)
+
+
+def write_dataset(out_dir: str, n: int, seed: int = 0, embedding_dim: int = 0) -> str:
+    """合成楽曲と類似度データを out_dir にアプリと同じファイル名で書き出す（楽曲は生成しながら書き込む）"""
+    os.makedirs(out_dir, exist_ok=True)
+    with open(os.path.join(out_dir, "filtered_songs_4_or_more_tags.json"), "w", encoding="utf-8") as f:
+        f.write("[")
+        first = True
+        for chunk in iter_songs(n, seed, embedding_dim=embedding_dim):
+            for song in chunk:
+                f.write(("" if first else ",") + json.dumps(song, ensure_ascii=False))
+                first = False
+        f.write("]")
+    for filename in SIMILARITY_FILES:
+        shutil.copyfile(os.path.join(DATA_DIR, filename), os.path.join(out_dir, filename))
+    return out_dir
+
+
+def tag_distribution(songs: List[dict]) -> dict:
+    """タグの分布の要約（カテゴリごとの語彙数・1曲あたりの平均数・上位10件が占める割合）"""
+    summary = {}
+    for category in ("mood", "instrument", "genre"):
+        counts = {}
+        for song in songs:
+            for tag in song["tags"][category]:
+                counts[tag] = counts.get(tag, 0) + 1
+        total = sum(counts.values())
+        top = sorted(counts.values(), reverse=True)[:10]
+        summary[category] = {
+            "distinct": len(counts),
+            "per_song": total / max(len(songs), 1),
+            "top10_share": sum(top) / max(total, 1),
+        }
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="合成楽曲カタログ（アプリと同じファイル構成）を書き出す")
+    parser.add_argument("--songs", type=int, default=10000, help="楽曲数（1000〜1000000程度）")
+    parser.add_argument("--out", required=True, help="出力先のデータディレクトリ")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--embedding-dim", type=int, default=0, help="埋め込みの次元（0なら埋め込みなし）")
+    args = parser.parse_args()
+
+    write_dataset(args.out, args.songs, args.seed, args.embedding_dim)
+    sample = next(iter_songs(min(args.songs, CHUNK_SIZE), args.seed))
+    print(json.dumps({"songs": args.songs, "out": args.out, "tags": tag_distribution(sample)}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
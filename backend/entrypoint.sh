@@ -7,5 +7,11 @@ alembic upgrade head
 echo "初期データを投入します（初回のみ実行）..."
 python app/init_data.py
 
+echo "旧形式のアップロード画像を内容ハッシュの保存先に移行します（移行済みなら何もしない）..."
+python -m app.services.upload_store
+
+echo "楽曲カタログをコンパイルします（ワーカー間でメモリマップを共有）..."
+python -m app.services.catalog_store data
+
 echo "FastAPIアプリケーションを起動します..."
 exec uvicorn app.main:app --host 0.0.0.0 --port 8000 --reload
\ No newline at end of file
@@ -0,0 +1,52 @@
+# テスト共通の準備（合成カタログ・SQLiteでアプリを1回だけ起動し、すべてのテストで共有する）
+# クエリ数の上限を超えたリクエストは DB_QUERY_BUDGET_MODE=raise で QueryBudgetExceeded になり、テストが失敗する
+import itertools
+import os
+
+import pytest
+
+import benchmarks  # noqa: F401  Settings 用の環境変数を設定する
+from benchmarks.fake_vision import FakeAsyncOpenAI
+from benchmarks.harness import prepare_app
+
+_EMAILS = itertools.count()
+
+
+@pytest.fixture(scope="session")
+def app():
+    os.environ["DB_QUERY_STATS_ENABLED"] = "true"
+    os.environ["DB_QUERY_BUDGET_MODE"] = "raise"
+    return prepare_app(songs=500)
+
+
+@pytest.fixture(scope="session")
+def client(app):
+    from fastapi.testclient import TestClient
+
+    from app import routers
+
+    moods = [m for m in routers.CATALOG_MANAGER.current.mood_similarity.keys() if m.isalpha() and m.isascii()]
+    routers.openai_client = FakeAsyncOpenAI(moods, latency=0.0)
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture
+def signup(client):
+    """ユーザーを登録し、(email, トークンのレスポンス) を返す関数"""
+
+    def signup(password: str = "password"):
+        email = f"user-{next(_EMAILS)}@example.com"
+        res = client.post("/signup", json={"email": email, "password": password})
+        assert res.status_code == 200, res.text
+        return email, res.json()
+
+    return signup
+
+
+@pytest.fixture
+def db(app):
+    from app.database import SessionLocal
+
+    with SessionLocal() as session:
+        yield session
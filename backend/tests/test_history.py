@@ -0,0 +1,72 @@
+# /history のキーセット方式のページング（next_cursor の往復）と書き出しのテスト
+import json
+from datetime import datetime, timedelta, timezone
+
+
+def _login_headers(tokens):
+    return {"Authorization": f"Bearer {tokens['access_token']}"}
+
+
+def _add_playlists(db, email, count):
+    """作成日時が重なる行を含むプレイリストを追加し、新しい順のIDを返す"""
+    from sqlalchemy import select
+
+    from app.models import PlaylistHistory, User
+
+    user_id = db.scalar(select(User.id).where(User.email == email))
+    base = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    rows = [
+        PlaylistHistory(user_id=user_id, image_path=f"uploads/{i}.jpg", liked_song_ids=[1, 2, 3],
+                        recommended_song_ids=[4, 5], created_at=base + timedelta(minutes=i // 2))
+        for i in range(count)
+    ]
+    db.add_all(rows)
+    db.commit()
+    return [row.id for row in sorted(rows, key=lambda row: (row.created_at, row.id), reverse=True)]
+
+
+def test_history_cursor_round_trip(client, signup, db):
+    email, tokens = signup()
+    expected = _add_playlists(db, email, 7)
+    headers = _login_headers(tokens)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 3, **({"cursor": cursor} if cursor else {})}
+        res = client.get("/history", params=params, headers=headers)
+        assert res.status_code == 200, res.text
+        page = res.json()
+        assert len(page["items"]) <= 3
+        seen += [item["id"] for item in page["items"]]
+        cursor = page["next_cursor"]
+        if cursor is None:
+            break
+    assert seen == expected
+    first = client.get("/history", params={"limit": 1}, headers=headers).json()["items"][0]
+    assert [song["id"] for song in first["liked"]] == [1, 2, 3]
+    assert [song["id"] for song in first["recommended"]] == [4, 5]
+
+
+def test_history_last_page_has_no_cursor(client, signup, db):
+    email, tokens = signup()
+    _add_playlists(db, email, 2)
+    page = client.get("/history", params={"limit": 2}, headers=_login_headers(tokens)).json()
+    assert len(page["items"]) == 2
+    assert page["next_cursor"] is None
+
+
+def test_history_rejects_invalid_cursor(client, signup):
+    _, tokens = signup()
+    res = client.get("/history", params={"cursor": "not-a-cursor"}, headers=_login_headers(tokens))
+    assert res.status_code == 400
+
+
+def test_history_export_matches_pages(client, signup, db):
+    email, tokens = signup()
+    expected = _add_playlists(db, email, 5)
+    headers = _login_headers(tokens)
+    ndjson = client.get("/history/export", headers=headers)
+    assert ndjson.status_code == 200
+    assert [json.loads(line)["id"] for line in ndjson.text.splitlines()] == expected
+    array = client.get("/history/export", params={"format": "json"}, headers=headers).json()
+    assert [item["id"] for item in array] == expected
@@ -0,0 +1,36 @@
+# ログイン（bcrypt の検証と、コストの異なる旧ハッシュの再ハッシュ）のテスト
+import bcrypt
+from sqlalchemy import select
+
+
+def _login(client, email, password):
+    return client.post("/login", data={"username": email, "password": password})
+
+
+def test_login_with_current_hash(client, signup):
+    email, _ = signup(password="secret")
+    assert _login(client, email, "secret").status_code == 200
+    assert _login(client, email, "wrong").status_code == 401
+
+
+def test_login_rehashes_legacy_hash(client, db):
+    from app.core.config import settings
+    from app.models import User
+    from app.services.password_hash import hash_rounds
+
+    # 設定と異なるコストで保存された旧ハッシュ
+    legacy_rounds = 4 if settings.BCRYPT_ROUNDS != 4 else 5
+    email = "legacy-hash@example.com"
+    legacy = bcrypt.hashpw(b"secret", bcrypt.gensalt(legacy_rounds)).decode("ascii")
+    db.add(User(email=email, hashed_password=legacy))
+    db.commit()
+
+    # 再ハッシュのUPDATEを含めてクエリ数の上限内に収まる（超えると QueryBudgetExceeded で失敗する）
+    res = _login(client, email, "secret")
+    assert res.status_code == 200
+    assert res.json()["refresh_token"]
+    db.expire_all()
+    stored = db.scalar(select(User.hashed_password).where(User.email == email))
+    assert stored != legacy
+    assert hash_rounds(stored) == settings.BCRYPT_ROUNDS
+    assert _login(client, email, "secret").status_code == 200
@@ -0,0 +1,42 @@
+# エンドポイントごとのクエリ数の上限を確認するテスト（DB_QUERY_BUDGET_MODE=raise で、超えたリクエストを失敗にする）
+# benchmarks.check_query_budget と同じ1ユーザー分のセッションを合成カタログ・SQLiteで流す。
+# スワイプログの書き込み（SwipeLogWriter のスレッドでのINSERT）はリクエストの外で実行するため数えない
+# 使い方: backend ディレクトリで `python -m pytest -q tests`
+from types import SimpleNamespace
+
+import pytest
+
+from benchmarks.check_query_budget import run_session
+
+
+def test_session_within_budgets(client):
+    from app import routers, services
+    from app.core.config import settings
+
+    assert settings.DB_QUERY_BUDGET_MODE == "raise"
+    # 上限を超えたリクエストは QueryBudgetExceeded が TestClient から送出されて失敗する
+    run_session(client, services, routers, SimpleNamespace(users=1, swipes=4, playlists=1))
+
+
+def test_budget_exceeded_raises():
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+    from sqlalchemy import create_engine, text
+
+    from app.services import QueryBudgetExceeded, QueryStatsMiddleware, instrument_engine
+
+    engine = create_engine("sqlite://")
+    instrument_engine(engine)
+
+    app = FastAPI()
+
+    @app.get("/items")
+    def items():
+        with engine.connect() as conn:
+            for _ in range(3):
+                conn.execute(text("SELECT 1"))
+        return []
+
+    app.add_middleware(QueryStatsMiddleware, budgets={"GET /items": 2}, mode="raise", record_metrics=False)
+    with TestClient(app) as test_client, pytest.raises(QueryBudgetExceeded):
+        test_client.get("/items")
@@ -0,0 +1,86 @@
+# リフレッシュトークンのローテーション・再利用の検知・猶予期間内の再送のテスト
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import func, select, update
+
+
+def _refresh(client, token):
+    return client.post("/token/refresh", json={"refresh_token": token})
+
+
+def _live_tokens(db, email) -> int:
+    from app.models import RefreshToken, User
+
+    stmt = (
+        select(func.count())
+        .select_from(RefreshToken)
+        .join(User, User.id == RefreshToken.user_id)
+        .where(User.email == email, RefreshToken.revoked_at.is_(None))
+    )
+    return db.scalar(stmt)
+
+
+def test_rotation_issues_a_new_token(client, signup, db):
+    email, tokens = signup()
+    first = _refresh(client, tokens["refresh_token"])
+    assert first.status_code == 200
+    second = _refresh(client, first.json()["refresh_token"])
+    assert second.status_code == 200
+    assert len({tokens["refresh_token"], first.json()["refresh_token"], second.json()["refresh_token"]}) == 3
+    assert _live_tokens(db, email) == 1
+
+
+def test_reuse_outside_grace_revokes_family(client, signup, db):
+    from app.core.config import settings
+    from app.models import RefreshToken, User
+
+    email, tokens = signup()
+    successor = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+    # 交換を猶予期間より前に行ったことにする
+    consumed_at = datetime.now(timezone.utc) - timedelta(seconds=settings.REFRESH_TOKEN_REUSE_GRACE_SECONDS + 1)
+    user_id = db.scalar(select(User.id).where(User.email == email))
+    db.execute(update(RefreshToken).where(RefreshToken.user_id == user_id, RefreshToken.revoked_at.is_not(None))
+               .values(revoked_at=consumed_at))
+    db.commit()
+
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert _refresh(client, successor).status_code == 401
+    assert _live_tokens(db, email) == 0
+
+
+def test_retry_within_grace_leaves_one_live_token(client, signup, db):
+    email, tokens = signup()
+    lost = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]  # 応答が届かなかった後継
+    retried = _refresh(client, tokens["refresh_token"])
+    assert retried.status_code == 200
+    assert _live_tokens(db, email) == 1
+    # 失効させた後継は使えず、再発行したトークンで続けられる
+    assert _refresh(client, retried.json()["refresh_token"]).status_code == 200
+    assert _live_tokens(db, email) == 1
+    assert lost != retried.json()["refresh_token"]
+
+
+def test_second_retry_within_grace_revokes_family(client, signup, db):
+    email, tokens = signup()
+    _refresh(client, tokens["refresh_token"])
+    reissued = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+    assert _refresh(client, tokens["refresh_token"]).status_code == 401
+    assert _refresh(client, reissued).status_code == 401
+    assert _live_tokens(db, email) == 0
+
+
+def test_revoked_successor_is_treated_as_reuse(client, signup, db):
+    email, tokens = signup()
+    lost = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+    reissued = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+    assert _refresh(client, lost).status_code == 401
+    assert _refresh(client, reissued).status_code == 401
+    assert _live_tokens(db, email) == 0
+
+
+def test_logout_revokes_family(client, signup, db):
+    email, tokens = signup()
+    successor = _refresh(client, tokens["refresh_token"]).json()["refresh_token"]
+    assert client.post("/logout", json={"refresh_token": successor}).status_code == 204
+    assert _refresh(client, successor).status_code == 401
+    assert _live_tokens(db, email) == 0
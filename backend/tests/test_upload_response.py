@@ -0,0 +1,94 @@
+# アップロード画像の配信（ETag・If-None-Match・Range・If-Range）のテスト
+import hashlib
+import os
+
+import pytest
+
+CONTENT = bytes(range(256)) * 4
+
+
+@pytest.fixture
+def uploads(tmp_path):
+    """内容ハッシュの保存先と旧形式の保存先に同じ画像を置き、upload_response で返すアプリのクライアント"""
+    from fastapi import FastAPI, Request
+    from fastapi.testclient import TestClient
+
+    from app.services import upload_response
+
+    digest = hashlib.sha256(CONTENT).hexdigest()
+    hashed = f"original/{digest[:2]}/{digest}.jpg"
+    for relative_path in (hashed, "legacy.jpg"):
+        path = tmp_path / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(CONTENT)
+
+    app = FastAPI()
+
+    @app.api_route("/uploads/{path:path}", methods=["GET", "HEAD"])
+    def get_upload(path: str, request: Request):
+        return upload_response(os.path.join(tmp_path, path), path, request.headers, request.method)
+
+    with TestClient(app) as client:
+        yield client, f"/uploads/{hashed}", digest
+
+
+def test_full_response_has_strong_etag(uploads):
+    client, url, digest = uploads
+    res = client.get(url)
+    assert res.status_code == 200
+    assert res.content == CONTENT
+    assert res.headers["etag"] == f'"{digest}"'
+    assert "immutable" in res.headers["cache-control"]
+    assert res.headers["accept-ranges"] == "bytes"
+
+
+def test_if_none_match_returns_304(uploads):
+    client, url, digest = uploads
+    res = client.get(url, headers={"If-None-Match": f'"other", "{digest}"'})
+    assert res.status_code == 304
+    assert res.content == b""
+
+
+def test_legacy_file_revalidates_with_generated_etag(uploads):
+    client, _, _ = uploads
+    first = client.get("/uploads/legacy.jpg")
+    assert first.headers["cache-control"] == "public, no-cache"
+    assert client.get("/uploads/legacy.jpg", headers={"If-None-Match": first.headers["etag"]}).status_code == 304
+
+
+@pytest.mark.parametrize("range_header, start, end", [
+    ("bytes=0-9", 0, 9),
+    ("bytes=1000-", 1000, 1023),
+    ("bytes=-24", 1000, 1023),
+    ("bytes=1020-5000", 1020, 1023),
+])
+def test_range_returns_206(uploads, range_header, start, end):
+    client, url, _ = uploads
+    res = client.get(url, headers={"Range": range_header})
+    assert res.status_code == 206
+    assert res.headers["content-range"] == f"bytes {start}-{end}/{len(CONTENT)}"
+    assert res.content == CONTENT[start:end + 1]
+
+
+@pytest.mark.parametrize("range_header", ["bytes=1024-", "bytes=10-5", "bytes=-0"])
+def test_unsatisfiable_range_returns_416(uploads, range_header):
+    client, url, _ = uploads
+    res = client.get(url, headers={"Range": range_header})
+    assert res.status_code == 416
+    assert res.headers["content-range"] == f"bytes */{len(CONTENT)}"
+
+
+def test_if_range_mismatch_returns_full_content(uploads):
+    client, url, digest = uploads
+    assert client.get(url, headers={"Range": "bytes=0-9", "If-Range": f'"{digest}"'}).status_code == 206
+    res = client.get(url, headers={"Range": "bytes=0-9", "If-Range": '"stale"'})
+    assert res.status_code == 200
+    assert res.content == CONTENT
+
+
+def test_head_range_has_no_body(uploads):
+    client, url, _ = uploads
+    res = client.head(url, headers={"Range": "bytes=0-9"})
+    assert res.status_code == 206
+    assert res.headers["content-length"] == "10"
+    assert res.content == b""
@@ -10,42 +10,68 @@ import {
   ScrollView,
 } from 'react-native';
 import { useRouter } from 'expo-router';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getAccessToken } from '../lib/auth';
 import Constants from 'expo-constants';
 
 const screenHeight = Dimensions.get("window").height;
 const screenWidth = Dimensions.get("window").width;
 const API_URL = Constants.expoConfig?.extra?.API_URL;
 
+interface Song {
+  id: number;
+  title: string;
+  artist: string;
+}
+
 interface PlaylistHistory {
   id: number;
   image_path: string;
-  songs_json: string;
+  thumbnail_path: string | null;
+  preview_path: string | null;
+  liked: Song[];
+  recommended: Song[];
   created_at: string;
 }
 
+interface PlaylistHistoryPage {
+  items: PlaylistHistory[];
+  next_cursor: string | null;
+}
+
+const PAGE_SIZE = 20;
+
 export default function HistoryScreen() {
   const router = useRouter();
   const [history, setHistory] = useState<PlaylistHistory[]>([]);
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const [loading, setLoading] = useState(false);
+
+  // 履歴を1ページ分取得する（cursor を渡すと続きを取得して末尾に追加する）
+  const fetchHistory = async (cursor: string | null) => {
+    setLoading(true);
+    try {
+      const token = await getAccessToken();
+      if (!token) return;
+      const params = new URLSearchParams({ limit: String(PAGE_SIZE) });
+      if (cursor) params.append('cursor', cursor);
+      const res = await fetch(`${API_URL}/history?${params.toString()}`, {
+        headers: {
+          Authorization: `Bearer ${token}`,
+        },
+      });
+      if (!res.ok) throw new Error(await res.text());
+      const data: PlaylistHistoryPage = await res.json();
+      setHistory((prev) => (cursor ? [...prev, ...data.items] : data.items));
+      setNextCursor(data.next_cursor);
+    } catch (err) {
+      console.error("履歴取得エラー:", err);
+    } finally {
+      setLoading(false);
+    }
+  };
 
   useEffect(() => {
-    const fetchHistory = async () => {
-      try {
-        const token = await AsyncStorage.getItem("accessToken");
-        if (!token) return;
-        const res = await fetch(`${API_URL}/history`, {
-          headers: {
-            Authorization: `Bearer ${token}`,
-          },
-        });
-        if (!res.ok) throw new Error(await res.text());
-        const data = await res.json();
-        setHistory(data);
-      } catch (err) {
-        console.error("履歴取得エラー:", err);
-      }
-    };
-    fetchHistory();
+    fetchHistory(null);
   }, []);
 
   return (
@@ -62,14 +88,11 @@ export default function HistoryScreen() {
         ) : (
           <ScrollView contentContainerStyle={styles.scroll}>
             {history.map((item) => {
-              let songCount = 0;
-              try {
-                songCount = JSON.parse(item.songs_json).length;
-              } catch (e) {}
+              const songCount = item.liked.length + item.recommended.length;
               return (
                 <View key={item.id} style={styles.card}>
                   <Image
-                    source={{ uri: `${API_URL}/${item.image_path}` }}
+                    source={{ uri: `${API_URL}/${item.thumbnail_path ?? item.image_path}` }}
                     style={styles.thumbnail}
                     resizeMode="cover"
                   />
@@ -80,6 +103,15 @@ export default function HistoryScreen() {
                 </View>
               );
             })}
+            {nextCursor && (
+              <TouchableOpacity
+                style={styles.moreButton}
+                disabled={loading}
+                onPress={() => fetchHistory(nextCursor)}
+              >
+                <Text style={styles.moreText}>{loading ? "読み込み中..." : "もっと見る"}</Text>
+              </TouchableOpacity>
+            )}
           </ScrollView>
         )}
 
@@ -155,6 +187,18 @@ const styles = StyleSheet.create({
     color: '#666',
     marginTop: 5,
   },
+  moreButton: {
+    backgroundColor: '#ffffffcc',
+    borderRadius: 15,
+    paddingVertical: 10,
+    marginVertical: 10,
+    alignItems: 'center',
+  },
+  moreText: {
+    fontSize: 14,
+    fontWeight: 'bold',
+    color: '#0078d7',
+  },
   navbar: {
     position: 'absolute',
     bottom: 0,
@@ -1,7 +1,7 @@
 // app/login.tsx
 import React, { useState } from 'react';
 import { View, Text, TextInput, ImageBackground, StyleSheet, Alert, TouchableOpacity, Dimensions } from 'react-native';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { saveTokens } from '../lib/auth';
 import { useRouter } from 'expo-router';
 import Constants from 'expo-constants';
 
@@ -27,7 +27,7 @@ export default function LoginScreen() {
 
       const data = await response.json();
       if (response.ok) {
-        await AsyncStorage.setItem('accessToken', data.access_token);
+        await saveTokens(data);
         router.replace('/photo');
       } else {
         Alert.alert('ログイン失敗', data.detail || 'メールアドレスかパスワードが間違っています');
@@ -2,7 +2,7 @@
 import React, { useEffect, useState } from 'react';
 import { View, Text, TouchableOpacity, StyleSheet, Image, Alert, ImageBackground, Dimensions } from 'react-native';
 import * as ImagePicker from 'expo-image-picker';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getAccessToken } from '../lib/auth';
 import { useRouter } from 'expo-router';
 import { Linking } from 'react-native';
 import Constants from 'expo-constants';
@@ -18,7 +18,7 @@ export default function PhotoUploadScreen() {
 
   useEffect(() => {
     const checkAuth = async () => {
-      const token = await AsyncStorage.getItem('accessToken');
+      const token = await getAccessToken();
       if (!token) {
         Alert.alert('認証エラー', 'ログインが必要です');
         router.replace('/login');
@@ -70,7 +70,7 @@ export default function PhotoUploadScreen() {
   };
 
   const sendImage = async () => {
-    const token = await AsyncStorage.getItem('accessToken');
+    const token = await getAccessToken();
     if (!imageUri) return;
 
     const formData = new FormData();
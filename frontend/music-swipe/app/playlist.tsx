@@ -4,7 +4,7 @@ import {
 } from 'react-native';
 import { Audio } from 'expo-av';
 import Constants from 'expo-constants';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getAccessToken } from '../lib/auth';
 import { useRouter } from 'expo-router';
 import Animated, {
   useSharedValue,
@@ -58,7 +58,7 @@ export default function PlaylistScreen() {
   useEffect(() => {
     const fetchPlaylist = async () => {
       try {
-        const token = await AsyncStorage.getItem('accessToken');
+        const token = await getAccessToken();
         const res = await fetch(`${API_URL}/playlist`, {
           headers: {
             Authorization: `Bearer ${token}`,
@@ -1,7 +1,7 @@
 // SignupScreen.tsx
 import React, { useState } from 'react';
 import { View, Text, TextInput, ImageBackground, StyleSheet, Alert, TouchableOpacity, Dimensions } from 'react-native';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { saveTokens } from '../lib/auth';
 import { useRouter } from 'expo-router';
 import Constants from 'expo-constants';
 
@@ -28,7 +28,7 @@ export default function SignupScreen() {
       }
 
       const data = await response.json();
-      await AsyncStorage.setItem('accessToken', data.access_token);
+      await saveTokens(data);
       Alert.alert('登録成功');
       router.replace('/photo');
     } catch (error: any) {
@@ -10,11 +10,20 @@ import Animated, {
 } from 'react-native-reanimated';
 import { useRouter, useLocalSearchParams } from 'expo-router';
 import Constants from 'expo-constants';
-import AsyncStorage from '@react-native-async-storage/async-storage';
+import { getAccessToken } from '../lib/auth';
 
 const screenWidth = Dimensions.get('window').width;
 const screenHeight = Dimensions.get('window').height;
 const API_URL = Constants.expoConfig?.extra?.API_URL;
+// 先読みキューの長さ・残りがこの枚数以下になったら補充する・スワイプ結果をまとめて送る枚数
+const QUEUE_SIZE = 10;
+const REFILL_THRESHOLD = 3;
+const BATCH_SIZE = 5;
+
+interface SwipeOutcome {
+  song_id: number;
+  liked: boolean;
+}
 
 interface Song {
   id: number;
@@ -36,6 +45,10 @@ export default function SwipeScreen() {
   const [isPlaying, setIsPlaying] = useState(false);
   const [lastPlayedId, setLastPlayedId] = useState<number | null>(null);
   const soundRef = useRef<Audio.Sound | null>(null);
+  // 未送信のスワイプ結果・キューを作ったときの探索フェーズ・送信中かどうか
+  const pendingRef = useRef<SwipeOutcome[]>([]);
+  const phaseRef = useRef<string | null>(null);
+  const flushingRef = useRef<Promise<void> | null>(null);
 
   const translateX = useSharedValue(0);
   const translateY = useSharedValue(0);
@@ -101,40 +114,77 @@ export default function SwipeScreen() {
     }
   };
 
+  // 溜まったスワイプ結果と残りのキューを送り、補充されたキューを受け取る
+  const flush = (queue: Song[]) => {
+    if (flushingRef.current) return flushingRef.current;
+    const swipes = pendingRef.current;
+    pendingRef.current = [];
+    const request = (async () => {
+      try {
+        const token = await getAccessToken();
+        const res = await fetch(`${API_URL}/swipe/batch`, {
+          method: "POST",
+          headers: {
+            "Content-Type": "application/json",
+            Authorization: `Bearer ${token}`
+          },
+          body: JSON.stringify({
+            swipes,
+            queue: queue.map((s) => s.id),
+            phase: phaseRef.current,
+            size: QUEUE_SIZE
+          })
+        });
+
+        const data = await res.json();
+        if (!res.ok) throw new Error(data.detail || "Swipe API failed");
+
+        phaseRef.current = data.phase;
+        setSongs((prev) => {
+          // 送信中にスワイプされた曲は除き、表示中のカードはそのまま先頭に残す
+          const swiped = new Set(pendingRef.current.map((o) => o.song_id));
+          const head = prev.slice(0, 1);
+          const rest = (data.songs as Song[]).filter(
+            (s) => !swiped.has(s.id) && !head.some((h) => h.id === s.id)
+          );
+          return [...head, ...rest];
+        });
+      } catch (err) {
+        // 送れなかった結果は次回まとめて送り直す
+        pendingRef.current = [...swipes, ...pendingRef.current];
+        console.error("Swipe error:", err);
+      } finally {
+        flushingRef.current = null;
+      }
+    })();
+    flushingRef.current = request;
+    return request;
+  };
+
   const handleSwipe = async (liked: boolean) => {
     const current = songs[0];
     if (!current) return;
 
-    try {
-      const token = await AsyncStorage.getItem("accessToken");
-      const res = await fetch(`${API_URL}/swipe`, {
-        method: "POST",
-        headers: {
-          "Content-Type": "application/json",
-          Authorization: `Bearer ${token}`
-        },
-        body: JSON.stringify({ song_id: current.id, liked })
-      });
-
-      const data = await res.json();
-      if (!res.ok) throw new Error(data.detail || "Swipe API failed");
+    // 次のカードはサーバーの応答を待たずに先読みキューから出す
+    const remaining = songs.slice(1);
+    setSongs(remaining);
+    pendingRef.current = [...pendingRef.current, { song_id: current.id, liked }];
+    resetCard();
 
-      if (liked) {
-        const newLikeCount = likeCount + 1;
-        setLikeCount(newLikeCount);
-        if (newLikeCount >= 5) {
-          await stopSound();
-          return router.push("/playlist");
-        }
+    if (liked) {
+      const newLikeCount = likeCount + 1;
+      setLikeCount(newLikeCount);
+      if (newLikeCount >= 5) {
+        await stopSound();
+        // 進行中の送信を待ってから残りを送り、プレイリスト生成時に全件が記録されているようにする
+        await flushingRef.current;
+        await flush(remaining);
+        return router.push("/playlist");
       }
+    }
 
-      if (data.song && data.song.id !== current.id) {
-        setSongs([data.song]);
-      }
-    } catch (err) {
-      console.error("Swipe error:", err);
-    } finally {
-      resetCard();
+    if (remaining.length <= REFILL_THRESHOLD || pendingRef.current.length >= BATCH_SIZE) {
+      flush(remaining);
     }
   };
 
@@ -0,0 +1,76 @@
+// lib/auth.ts
+// アクセストークン・リフレッシュトークンの保存と、期限切れ前のアクセストークンの再発行
+// アクセストークンは短命（15分）なので、期限が近づいたら /token/refresh で交換する
+// （パスワードでの再ログインをさせない）
+import AsyncStorage from '@react-native-async-storage/async-storage';
+import Constants from 'expo-constants';
+
+const API_URL = Constants.expoConfig?.extra?.API_URL;
+// 期限のこの秒数前から再発行する
+const REFRESH_MARGIN_SECONDS = 60;
+
+type TokenResponse = { access_token: string; refresh_token?: string | null };
+
+export async function saveTokens(data: TokenResponse) {
+  await AsyncStorage.setItem('accessToken', data.access_token);
+  if (data.refresh_token) {
+    await AsyncStorage.setItem('refreshToken', data.refresh_token);
+  }
+}
+
+export async function clearTokens() {
+  await AsyncStorage.multiRemove(['accessToken', 'refreshToken']);
+}
+
+// JWTのペイロードから有効期限（UNIX秒）を読む（署名の検証はサーバーで行う）
+function tokenExpiry(token: string): number | null {
+  try {
+    const payload = token.split('.')[1].replace(/-/g, '+').replace(/_/g, '/');
+    return JSON.parse(atob(payload.padEnd(Math.ceil(payload.length / 4) * 4, '='))).exp ?? null;
+  } catch {
+    return null;
+  }
+}
+
+async function refresh(current: string | null): Promise<string | null> {
+  const refreshToken = await AsyncStorage.getItem('refreshToken');
+  if (!refreshToken) return current;
+  try {
+    const res = await fetch(`${API_URL}/token/refresh`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify({ refresh_token: refreshToken }),
+    });
+    if (res.status === 401) {
+      // 期限切れ・失効済み：再ログインが必要
+      await clearTokens();
+      return null;
+    }
+    if (!res.ok) return current;
+    const data: TokenResponse = await res.json();
+    await saveTokens(data);
+    return data.access_token;
+  } catch {
+    // 通信エラー時は手元のトークンのまま続ける
+    return current;
+  }
+}
+
+// 交換中のリクエスト（複数の画面から同時に呼ばれても交換は1回だけにする。
+// 使用済みのリフレッシュトークンを再送すると、サーバーは盗用とみなして系列ごと失効させるため）
+let refreshing: Promise<string | null> | null = null;
+
+// 有効なアクセストークンを返す（期限が近ければ再発行する）。ログインしていなければ null
+export async function getAccessToken(): Promise<string | null> {
+  const token = await AsyncStorage.getItem('accessToken');
+  const exp = token ? tokenExpiry(token) : null;
+  if (token && exp !== null && exp - Date.now() / 1000 > REFRESH_MARGIN_SECONDS) {
+    return token;
+  }
+  if (!refreshing) {
+    refreshing = refresh(token).finally(() => {
+      refreshing = null;
+    });
+  }
+  return refreshing;
+}